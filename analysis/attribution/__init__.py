@@ -0,0 +1,25 @@
+"""
+Building blocks for the multi-touch attribution pipeline in playground.py
+"""
+from .ingest import EVENT_COLUMNS, EVENT_TYPES, iter_event_chunks, load_events
+from .store import PRODUCT_COLUMNS, JourneyStore, build_store, ensure_store, store_is_current
+from .journeys import build_purchase_journeys, purchase_journey_bounds, segment_searchsorted
+from .rules import RULE_MODELS, flatten_touchpoints, rule_based_revenue, run_rule_models, touch_credit
+from .shapley import ShapleyEngine, heuristic_value_function, journey_masks, shapley_revenue
+from .conversion import (coalition_counts, conversion_table, empirical_value_function, fit_logistic,
+                         learn_conversion_table, table_summary)
+from .markov import (build_transition_counts, conversion_probabilities, markov_journeys, markov_revenue,
+                     merge_chains, order_report, path_transition_counts, path_transition_incidence,
+                     removal_effects, state_labels, transition_matrix)
+from .paths import collapse_repeats, compress_paths, compression_report, path_table
+from .bots import (BOT_BINS, BOT_LABELS, SessionCounter, bot_filter_report, bot_user_ids, flag_counts,
+                   flag_users, human_event_mask, human_user_mask, sessions_per_user,
+                   stream_sessions_per_user)
+from .sessions import SessionStore, dominant_actions, session_starts, session_summary, touchpoint_store
+from .parallel import StoreShard, process_shard, run_sharded, user_shards
+from .export import build_dashboard_export, write_export
+from .metrics import RunMetrics
+from .bootstrap import bootstrap_intervals, journey_credit
+from .trends import lookback_comparison, rolling_attribution
+from .cube import attribution_cube, build_cube
+from .scenarios import budget_scenarios, evaluate_allocations, fit_response_curves, optimal_allocation
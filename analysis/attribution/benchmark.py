@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .bots import flag_users, human_user_mask, sessions_per_user
+from .conversion import empirical_value_function, learn_conversion_table
+from .journeys import purchase_journey_bounds
+from .markov import markov_journeys, markov_revenue, path_transition_counts, removal_effects
+from .metrics import RunMetrics
+from .paths import compress_paths
+from .pipeline import merge_params
+from .rules import flatten_touchpoints, run_rule_models
+from .shapley import shapley_revenue
+from .store import build_store
+from .synthetic import users_for_events, write_events_csv
+
+BENCHMARK_SIZES = [1_000_000, 10_000_000, 100_000_000]
+
+# A stage regresses when it is this much slower (or uses this much more peak
+# memory) than the baseline run; sub-second stages are too noisy to time
+REGRESSION_FACTOR = 1.25
+REGRESSION_MIN_SECONDS = 0.5
+
+_SUFFIXES = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+
+
+def parse_size(text):
+    """'10M' -> 10_000_000"""
+    text = text.strip().upper()
+    if text[-1:] in _SUFFIXES:
+        return int(float(text[:-1]) * _SUFFIXES[text[-1]])
+    return int(text)
+
+
+def size_label(n_events):
+    for suffix, scale in sorted(_SUFFIXES.items(), key=lambda kv: -kv[1]):
+        if n_events >= scale and n_events % scale == 0:
+            return f'{n_events // scale}{suffix}'
+    return str(n_events)
+
+
+def synthetic_csv(workdir, n_events, seed=0, **knobs):
+    """Path of the synthetic CSV for this size and seed, generated on first use"""
+    name = f"events-{size_label(n_events)}-seed{seed}"
+    if knobs:
+        name += '-' + '-'.join(f'{k}{v}' for k, v in sorted(knobs.items()))
+    path = os.path.join(workdir, name + '.csv')
+    if not os.path.exists(path):
+        os.makedirs(workdir, exist_ok=True)
+        partial = path + '.partial'
+        write_events_csv(partial, users_for_events(n_events, **_event_knobs(knobs)), seed=seed, **knobs)
+        os.replace(partial, path)
+    return path
+
+
+def _event_knobs(knobs):
+    return {k: knobs[k] for k in ('sessions_per_user', 'journey_mean', 'bot_share') if k in knobs}
+
+
+def run_stages(csv_path, store_dir, params=None):
+    """
+    Run every pipeline stage once over csv_path and measure each one, with
+    the pipeline's parameters (params overrides them as in
+    AttributionPipeline, e.g. {'shapley': {'value_function': 'heuristic'}}).
+    Returns one RunMetrics stage record per stage.
+    """
+    params = merge_params(params)
+    engine_params = dict(params['shapley'])
+    value_function = engine_params.pop('value_function')
+    smoothing = engine_params.pop('smoothing')
+    metrics = RunMetrics()
+
+    with metrics.stage('ingest') as r:
+        store = build_store(csv_path, store_dir)
+        r['rows_out'] = len(store)
+
+    with metrics.stage('bot_filter', rows_in=len(store)) as r:
+        keep_user = human_user_mask(flag_users(sessions_per_user(store)))
+        r['rows_out'] = int(keep_user.sum())
+
+    with metrics.stage('journeys', rows_in=len(store)) as r:
+        bounds = purchase_journey_bounds(store, keep_user=keep_user)
+        touches = flatten_touchpoints(store, bounds)
+        paths = compress_paths(touches)
+        r['rows_out'] = len(bounds['purchase'])
+
+    with metrics.stage('rule_models', rows_in=len(paths['count'])) as r:
+        r['rows_out'] = run_rule_models(touches, paths=paths).size
+
+    with metrics.stage('shapley', rows_in=len(paths['count'])) as r:
+        if value_function == 'empirical':
+            table = learn_conversion_table(store, keep_user, smoothing)
+            engine_params['value_fn'] = empirical_value_function(table)
+        _, engine = shapley_revenue(paths, **engine_params)
+        r['rows_out'] = engine.stats['vector_calls']
+
+    with metrics.stage('markov', rows_in=len(store)) as r:
+        markov_paths = compress_paths(markov_journeys(store, keep_user=keep_user), by='converted')
+        chain = path_transition_counts(markov_paths, order=params['markov']['order'])
+        _, effects = removal_effects(chain)
+        markov_revenue(effects, float(touches['value'].sum()), store.channels)
+        r['rows_out'] = int(chain['count'].sum())
+
+    return metrics.stages
+
+
+def run_benchmark(sizes=None, workdir=os.path.join('data', 'benchmark'), seed=0, keep_store=False, params=None,
+                  **knobs):
+    """
+    Generate (or reuse) a synthetic CSV per size and time every stage on it
+    (params: pipeline parameter overrides, see run_stages).
+    Returns a DataFrame with one row per (size, stage).
+    """
+    rows = []
+    for n_events in sizes or BENCHMARK_SIZES:
+        csv_path = synthetic_csv(workdir, n_events, seed, **knobs)
+        store_dir = os.path.join(workdir, f'store-{size_label(n_events)}')
+        for record in run_stages(csv_path, store_dir, params):
+            rows.append(dict(record, size=n_events))
+        if not keep_store:
+            shutil.rmtree(store_dir, ignore_errors=True)
+    return pd.DataFrame(rows, columns=['size', 'stage', 'wall_s', 'cpu_s', 'peak_rss', 'rss_start',
+                                       'rows_in', 'rows_out'])
+
+
+def find_regressions(results, baseline, factor=REGRESSION_FACTOR, min_seconds=REGRESSION_MIN_SECONDS):
+    """
+    Stages whose wall time or peak RSS grew by more than factor over baseline
+    (both DataFrames as returned by run_benchmark)
+    """
+    merged = results.merge(baseline, on=['size', 'stage'], suffixes=('', '_baseline'))
+    slower = ((merged['wall_s'] > merged['wall_s_baseline'] * factor)
+              & (merged['wall_s'] - merged['wall_s_baseline'] > min_seconds))
+    bigger = merged['peak_rss'] > merged['peak_rss_baseline'] * factor
+    flagged = merged[slower | bigger].copy()
+    flagged['wall_ratio'] = flagged['wall_s'] / flagged['wall_s_baseline']
+    flagged['rss_ratio'] = flagged['peak_rss'] / flagged['peak_rss_baseline']
+    return flagged[['size', 'stage', 'wall_s', 'wall_s_baseline', 'wall_ratio',
+                    'peak_rss', 'peak_rss_baseline', 'rss_ratio']]
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage benchmark on synthetic events")
+    parser.add_argument('--sizes', nargs='+', default=[size_label(n) for n in BENCHMARK_SIZES],
+                        help="event counts, e.g. 1M 10M 100M")
+    parser.add_argument('--workdir', default=os.path.join('data', 'benchmark'))
+    parser.add_argument('--output', default=os.path.join('output', 'benchmark.json'))
+    parser.add_argument('--baseline', help="earlier benchmark.json to check for regressions")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bot-share', type=float)
+    parser.add_argument('--channels', type=int, dest='n_channels')
+    parser.add_argument('--journey-mean', type=float)
+    parser.add_argument('--sessions-per-user', type=float)
+    parser.add_argument('--value-function', choices=['empirical', 'heuristic'], default='empirical',
+                        help="Shapley characteristic function, as the pipeline's shapley.value_function")
+    args = parser.parse_args(argv)
+
+    knobs = {k: v for k, v in vars(args).items()
+             if k in ('bot_share', 'n_channels', 'journey_mean', 'sessions_per_user') and v is not None}
+    params = {'shapley': {'value_function': args.value_function}}
+    results = run_benchmark([parse_size(s) for s in args.sizes], args.workdir, args.seed, params=params, **knobs)
+
+    table = results.assign(peak_rss_mb=results['peak_rss'] / 2**20)
+    print(table[['size', 'stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows_out']].to_string(index=False,
+                                                                                       float_format='%.2f'))
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'seed': args.seed, 'knobs': knobs, 'params': params,
+                   'results': results.astype(object).where(results.notna(), None).to_dict(orient='records')},
+                  f, indent=2)
+    print(f"Benchmark written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = pd.DataFrame(json.load(f)['results'])
+        regressions = find_regressions(results, baseline)
+        if len(regressions):
+            print("\nRegressions against baseline:")
+            print(regressions.to_string(index=False, float_format='%.2f'))
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
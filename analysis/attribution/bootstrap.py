@@ -0,0 +1,216 @@
+import numpy as np
+
+from .export import EXPORT_CHANNELS
+from .markov import (DENSE_STATE_LIMIT, _removal_masks, conversion_probabilities,
+                     path_transition_incidence)
+from .rules import RULE_MODELS, touch_credit
+from .shapley import journey_masks
+
+BOOTSTRAP_REPLICATES = 1000
+CONFIDENCE_LEVEL = 0.95
+
+# Journeys per block of Poisson weights (replicates x block float64s in memory)
+JOURNEY_BLOCK = 4096
+
+# Upper bound on the batched (replicates, scenarios, T, T) Markov solve
+SOLVE_BLOCK_BYTES = 1 << 27
+
+# Upper bound on the (replicates, path steps) weights gathered per block of replicates
+COUNT_BLOCK_BYTES = 1 << 27
+
+
+def poisson_weights(rng, n_replicates, n_units):
+    """
+    (replicates, units) Poisson(1) resampling weights: each replicate draws
+    every unit independently, so replicates never materialize resampled data
+    """
+    return rng.poisson(1.0, (n_replicates, n_units)).astype(np.float64)
+
+
+def journey_credit(touches, models=None, engine=None):
+    """
+    Per-journey channel credit, one (journeys, channels) array per model.
+
+    Rule-based models use their per-touch weights; engine (a ShapleyEngine)
+    adds 'shapley', each journey taking its touchpoint set's Shapley vector
+    times its value. Row sums are the journey values, and column sums are
+    the models' channel revenue.
+    """
+    n_journeys = len(touches['offsets']) - 1
+    n_channels = len(touches['channels'])
+    cells = touches['journey'].astype(np.int64) * n_channels + touches['channel']
+    credit = {}
+    for model in models or list(RULE_MODELS):
+        credit[model] = np.bincount(cells, weights=touch_credit(touches, model),
+                                    minlength=n_journeys * n_channels).reshape(n_journeys, n_channels)
+    if engine is not None:
+        unique, inverse = np.unique(journey_masks(touches), return_inverse=True)
+        vectors = np.array([engine.shapley_vector(mask) for mask in unique.tolist()]).reshape(-1, n_channels)
+        credit['shapley'] = vectors[inverse.ravel()] * touches['value'][:, None]
+    return credit
+
+
+def bootstrap_journey_revenue(credit, n_replicates=BOOTSTRAP_REPLICATES, seed=0, block=JOURNEY_BLOCK):
+    """
+    (replicates, channels) channel revenue per model under Poisson resampling
+    of journeys. Every model sees the same weights, so differences between
+    models are paired; each block of journeys costs one matrix product.
+    """
+    models = list(credit)
+    stacked = np.concatenate([credit[m] for m in models], axis=1)
+    rng = np.random.default_rng([seed, 0])
+    totals = np.zeros((n_replicates, stacked.shape[1]))
+    for start in range(0, len(stacked), block):
+        part = stacked[start:start + block]
+        totals += poisson_weights(rng, n_replicates, len(part)) @ part
+    return dict(zip(models, np.split(totals, len(models), axis=1)))
+
+
+def replicate_transition_counts(paths, order=1, n_replicates=BOOTSTRAP_REPLICATES, seed=0,
+                                max_bytes=COUNT_BLOCK_BYTES):
+    """
+    Chain of the compressed Markov paths plus (replicates, transitions)
+    resampled counts. A path followed by c journeys gets weight Poisson(c),
+    the sum of its journeys' Poisson(1) weights, so resampling the distinct
+    paths is exact. Replicates are drawn and summed in blocks whose gathered
+    (replicates, path steps) weights stay under max_bytes.
+    """
+    chain, transition, entry_path = path_transition_incidence(paths, order)
+    rng = np.random.default_rng([seed, 1])
+    path_counts = np.asarray(paths['count'], dtype=np.float64)
+
+    # Sum entries per transition: sort once, then one reduceat per block of replicates
+    by_transition = np.argsort(transition, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(transition[by_transition]) != 0])
+    columns = transition[by_transition][starts]
+    steps = entry_path[by_transition]
+    counts = np.zeros((n_replicates, len(chain['count'])), dtype=np.int64)
+    block = max(1, max_bytes // (8 * max(len(steps), len(path_counts), 1)))
+    for first in range(0, n_replicates, block):
+        weights = rng.poisson(path_counts, (min(block, n_replicates - first), len(path_counts)))
+        if len(steps):
+            counts[first:first + len(weights), columns] = np.add.reduceat(weights[:, steps], starts, axis=1)
+    return chain, counts
+
+
+def replicate_conversion_probabilities(chain, counts, removed_masks, max_bytes=SOLVE_BLOCK_BYTES):
+    """
+    (replicates, scenarios) conversion probabilities for chains that share
+    chain's transitions but carry per-replicate counts.
+
+    Dense chains solve every replicate and removal scenario in batched
+    np.linalg.solve calls of at most max_bytes; transitions a replicate never
+    draws get probability 0. Large chains fall back to one
+    conversion_probabilities call per replicate.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    n_transient, n_states = chain['n_transient'], chain['n_states']
+    if n_transient > DENSE_STATE_LIMIT:
+        return _each_replicate(chain, counts, removed_masks)
+
+    src, dst = chain['src'], chain['dst']
+    by_src = np.argsort(src, kind='stable')
+    sources, starts = np.unique(src[by_src], return_index=True)
+    out_totals = np.zeros((len(counts), n_states))
+    if len(by_src):
+        out_totals[:, sources] = np.add.reduceat(counts[:, by_src], starts, axis=1)
+    totals = out_totals[:, src]
+    prob = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+
+    transient = dst < n_transient
+    to_conversion = dst == n_transient
+    keep = ~removed_masks
+    eye = np.eye(n_transient)
+    block = max(1, max_bytes // (len(keep) * n_transient * n_transient * 8))
+    out = []
+    for first in range(0, len(counts), block):
+        p = prob[first:first + block]
+        q = np.zeros((len(p), n_transient, n_transient))
+        q[:, src[transient], dst[transient]] = p[:, transient]
+        r = np.zeros((len(p), n_transient))
+        r[:, src[to_conversion]] = p[:, to_conversion]
+        a = eye - q[:, None, :, :] * keep[None, :, None, :]
+        b = np.broadcast_to(r[:, None, :, None], a.shape[:3] + (1,))
+        try:
+            out.append(np.linalg.solve(a, b)[..., 0, 0])
+        except np.linalg.LinAlgError:
+            out.append(_each_replicate(chain, counts[first:first + block], removed_masks))
+    return np.concatenate(out) if out else np.zeros((0, len(keep)))
+
+
+def _each_replicate(chain, counts, removed_masks):
+    """One conversion_probabilities solve per replicate, on its drawn transitions only"""
+    out = []
+    for row in counts:
+        live = row > 0
+        sub = dict(chain, src=chain['src'][live], dst=chain['dst'][live], count=row[live])
+        out.append(conversion_probabilities(sub, removed_masks))
+    return np.array(out).reshape(len(counts), len(removed_masks))
+
+
+def removal_shares(probs):
+    """
+    (rows, channels) Markov revenue shares from (rows, 1 + channels)
+    conversion probabilities (baseline first): positive removal effects
+    normalized to sum to 1, as markov_revenue splits revenue
+    """
+    positive = np.clip(probs[:, :1] - probs[:, 1:], 0, None)
+    sums = positive.sum(axis=1, keepdims=True)
+    return np.divide(positive, sums, out=np.zeros_like(positive), where=sums > 0)
+
+
+def bootstrap_markov_shares(paths, order=1, n_replicates=BOOTSTRAP_REPLICATES, seed=0):
+    """(replicates, channels) Markov revenue shares over resampled paths"""
+    chain, counts = replicate_transition_counts(paths, order, n_replicates, seed)
+    probs = replicate_conversion_probabilities(chain, counts, _removal_masks(chain, chain['channels']))
+    return removal_shares(probs)
+
+
+def replicate_shares(revenue, channels):
+    """
+    (replicates, EXPORT_CHANNELS) percent shares, computed as channel_shares
+    does for the point estimates
+    """
+    columns = [channels.index(c) if c in channels else None for c in EXPORT_CHANNELS]
+    export = np.stack([revenue[:, c] if c is not None else np.zeros(len(revenue)) for c in columns], axis=1)
+    totals = export.sum(axis=1, keepdims=True)
+    return np.divide(export * 100, totals, out=np.zeros_like(export), where=totals != 0)
+
+
+def share_intervals(shares, confidence=CONFIDENCE_LEVEL):
+    """
+    Percentile interval and standard error per export channel from
+    (replicates, EXPORT_CHANNELS) shares
+    """
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(shares, [tail, 100 - tail], axis=0)
+    std_error = shares.std(axis=0, ddof=1) if len(shares) > 1 else np.zeros(shares.shape[1])
+    return {
+        channel: {'lower': float(lower[i]), 'upper': float(upper[i]), 'std_error': float(std_error[i])}
+        for i, channel in enumerate(EXPORT_CHANNELS)
+    }
+
+
+def bootstrap_intervals(touches, markov_paths=None, markov_order=1, models=None, engine=None,
+                        n_replicates=BOOTSTRAP_REPLICATES, confidence=CONFIDENCE_LEVEL, seed=0):
+    """
+    Bootstrap confidence intervals for every model's channel shares.
+
+    touches: flatten_touchpoints output (purchase journeys, resampled for the
+    rule-based models and, with engine, Shapley). markov_paths: markov_journeys
+    compressed with by='converted' (all journeys, converting or not, resampled
+    for the Markov chain). Returns the attribution_intervals export block.
+    """
+    channels = list(touches['channels'])
+    credit = journey_credit(touches, models, engine)
+    revenue = bootstrap_journey_revenue(credit, n_replicates, seed)
+    shares = {model: replicate_shares(r, channels) for model, r in revenue.items()}
+    if markov_paths is not None:
+        markov = bootstrap_markov_shares(markov_paths, markov_order, n_replicates, seed)
+        shares['markov'] = replicate_shares(markov, list(markov_paths['channels']))
+    return {
+        'replicates': n_replicates,
+        'confidence': confidence,
+        'method': 'poisson',
+        'models': {model: share_intervals(s, confidence) for model, s in shares.items()},
+    }
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+
+from .ingest import MISSING_SESSION, hash_sessions
+
+# Sessions per user: 0-27 human, 28-62 suspicious, 63+ bot
+BOT_BINS = [0, 27, 62, float('inf')]
+BOT_LABELS = ['human', 'suspicious', 'bot']
+
+# Events per block when counting distinct sessions over a store
+SESSION_BLOCK_EVENTS = 1 << 22
+
+# Bits per user in the approximate (linear counting) session counter. 128 bits
+# keep the standard error around 7% up to the 62-session bot threshold
+SESSION_BITMAP_BITS = 128
+
+# Spreads session hashes over the bitmap bits
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+# Funnel flags of a session: it added to cart, it purchased
+CART_FLAG = np.uint8(1)
+PURCHASE_FLAG = np.uint8(2)
+FUNNEL_COUNTS = ('cart_sessions', 'purchase_sessions', 'abandoned_carts')
+
+
+def _block_bounds(offsets, block_events):
+    """User-aligned (first_user, last_user) blocks of roughly block_events events"""
+    targets = np.arange(0, offsets[-1], block_events)
+    cuts = np.unique(np.append(np.searchsorted(offsets, targets, side='right') - 1, len(offsets) - 1))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def sessions_per_user(store, block_events=SESSION_BLOCK_EVENTS, approximate=False,
+                      bitmap_bits=SESSION_BITMAP_BITS):
+    """
+    Distinct sessions for every store user, in store user order. Events
+    without a session id are not counted.
+
+    One pass over the memory-mapped session column in user-aligned blocks:
+    each block is sorted by (user, session) and the runs are counted, so
+    memory is bounded by the block, not the event count. approximate feeds
+    the blocks to a linear-counting SessionCounter instead, whose bitmaps
+    bound memory by the number of users.
+    """
+    offsets = np.asarray(store.offsets)
+    sessions = store['user_session']
+    if approximate:
+        counter = SessionCounter(approximate=True, bitmap_bits=bitmap_bits)
+        user_ids = store['user_id']
+        for first, last in _block_bounds(offsets, block_events):
+            start, end = offsets[first], offsets[last]
+            counter.add(user_ids[start:end], sessions[start:end])
+        counts = counter.counts().reindex(np.asarray(store.users, dtype=np.int64), fill_value=0)
+        return pd.Series(counts.to_numpy())
+    counts = np.zeros(store.n_users, dtype=np.int64)
+    for first, last in _block_bounds(offsets, block_events):
+        start, end = offsets[first], offsets[last]
+        users = np.repeat(np.arange(first, last), np.diff(offsets[first:last + 1]))
+        block = np.asarray(sessions[start:end])
+        order = np.lexsort((block, users))
+        users, block = users[order], block[order]
+        new = np.ones(len(block), dtype=bool)
+        new[1:] = (users[1:] != users[:-1]) | (block[1:] != block[:-1])
+        new &= block != MISSING_SESSION
+        counts[first:last] = np.bincount(users[new] - first, minlength=last - first)
+    return pd.Series(counts)
+
+
+def funnel_flags(channels):
+    """CART_FLAG / PURCHASE_FLAG of every event_type code (0 for other channels)"""
+    flags = np.zeros(len(channels), dtype=np.uint8)
+    for name, flag in (('cart', CART_FLAG), ('purchase', PURCHASE_FLAG)):
+        if name in channels:
+            flags[list(channels).index(name)] = flag
+    return flags
+
+
+def funnel_counts(session_flags):
+    """Cart, purchase and abandoned-cart session counts from per-session funnel flags"""
+    cart = (session_flags & CART_FLAG) > 0
+    purchase = (session_flags & PURCHASE_FLAG) > 0
+    return {'cart_sessions': int(cart.sum()),
+            'purchase_sessions': int(purchase.sum()),
+            'abandoned_carts': int((cart & ~purchase).sum())}
+
+
+def session_funnel(store, keep_user=None, block_events=SESSION_BLOCK_EVENTS):
+    """
+    funnel_counts over the distinct sessions of the kept store users, in the
+    same blocked pass as sessions_per_user (events without a session id are
+    not counted)
+    """
+    offsets = np.asarray(store.offsets)
+    sessions = store['user_session']
+    flags_of = funnel_flags(store.channels)
+    counts = funnel_counts(np.empty(0, dtype=np.uint8))
+    for first, last in _block_bounds(offsets, block_events):
+        start, end = offsets[first], offsets[last]
+        users = np.repeat(np.arange(first, last), np.diff(offsets[first:last + 1]))
+        block = np.asarray(sessions[start:end])
+        flags = flags_of[np.asarray(store['event_type'][start:end])]
+        keep = block != MISSING_SESSION
+        if keep_user is not None:
+            keep &= keep_user[users]
+        order = np.lexsort((block[keep], users[keep]))
+        users, block, flags = users[keep][order], block[keep][order], flags[keep][order]
+        if len(block) == 0:
+            continue
+        new = np.ones(len(block), dtype=bool)
+        new[1:] = (users[1:] != users[:-1]) | (block[1:] != block[:-1])
+        for name, value in funnel_counts(np.bitwise_or.reduceat(flags, np.flatnonzero(new))).items():
+            counts[name] += value
+    return counts
+
+
+class SessionCounter:
+    """
+    Distinct sessions per user over an unsorted event stream, in one pass.
+
+    Exact mode keeps every distinct (user, session) pair. Approximate mode
+    keeps a fixed bitmap per user and estimates with linear counting, so
+    memory grows with users rather than sessions.
+    """
+
+    def __init__(self, approximate=False, bitmap_bits=SESSION_BITMAP_BITS):
+        if approximate and (bitmap_bits < 64 or bitmap_bits & (bitmap_bits - 1)):
+            raise ValueError("bitmap_bits must be a power of two of at least 64")
+        self.approximate = approximate
+        self.bitmap_bits = bitmap_bits
+        self.users = np.empty(0, dtype=np.int64)
+        self.bitmaps = np.zeros((0, bitmap_bits // 64), dtype=np.uint64)
+        self._pairs = []
+
+    def add(self, user_ids, sessions):
+        """
+        Count one chunk; sessions may be raw ids or uint64 hashes from
+        hash_sessions. Events without a session id are skipped.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        sessions = np.asarray(sessions)
+        if sessions.dtype != np.uint64:
+            sessions = hash_sessions(sessions)
+        present = sessions != MISSING_SESSION
+        user_ids, sessions = user_ids[present], sessions[present]
+        if self.approximate:
+            self._add_bitmap(user_ids, sessions)
+        else:
+            pairs = pd.DataFrame({'user_id': user_ids, 'session': sessions}).drop_duplicates()
+            self._pairs.append(pairs)
+
+    def _add_bitmap(self, user_ids, sessions):
+        new_users = np.setdiff1d(user_ids, self.users)
+        if len(new_users):
+            at = np.searchsorted(self.users, new_users)
+            self.users = np.insert(self.users, at, new_users)
+            self.bitmaps = np.insert(self.bitmaps, at, 0, axis=0)
+        rows = np.searchsorted(self.users, user_ids)
+        bit = (sessions * _MIX) >> np.uint64(65 - self.bitmap_bits.bit_length())
+        word = (bit >> np.uint64(6)).astype(np.int64)
+        np.bitwise_or.at(self.bitmaps, (rows, word), np.uint64(1) << (bit & np.uint64(63)))
+
+    def counts(self):
+        """Distinct sessions per user (Series indexed by user_id, sorted)"""
+        if self.approximate:
+            set_bits = np.unpackbits(self.bitmaps.view(np.uint8), axis=1).sum(axis=1)
+            empty = np.maximum(self.bitmap_bits - set_bits, 0.5)
+            estimate = -self.bitmap_bits * np.log(empty / self.bitmap_bits)
+            return pd.Series(np.rint(estimate).astype(np.int64), index=pd.Index(self.users, name='user_id'))
+        if not self._pairs:
+            return pd.Series(np.empty(0, dtype=np.int64), index=pd.Index([], name='user_id', dtype=np.int64))
+        # Collapse the chunk-level uniques so memory stays at one copy of the pairs
+        pairs = pd.concat(self._pairs, ignore_index=True).drop_duplicates()
+        self._pairs = [pairs]
+        return pairs.groupby('user_id').size()
+
+    @property
+    def nbytes(self):
+        if self.approximate:
+            return self.users.nbytes + self.bitmaps.nbytes
+        return sum(int(p.memory_usage(index=False).sum()) for p in self._pairs)
+
+
+def stream_sessions_per_user(chunks, approximate=False, bitmap_bits=SESSION_BITMAP_BITS):
+    """
+    Distinct sessions per user from event chunks (e.g. iter_event_chunks over
+    user_id and user_session) without sorting or holding the events.
+    Returns (counts indexed by user_id, counter).
+    """
+    counter = SessionCounter(approximate, bitmap_bits)
+    for chunk in chunks:
+        counter.add(chunk['user_id'], chunk['user_session'])
+    return counter.counts(), counter
+
+
+def flag_users(session_counts):
+    """
+    Bin session counts into human / suspicious / bot labels
+    """
+    return pd.cut(session_counts, bins=BOT_BINS, labels=BOT_LABELS, include_lowest=True)
+
+
+def human_user_mask(user_flags):
+    """
+    Boolean mask over store users that keeps everything except bots
+    """
+    return (user_flags != 'bot').to_numpy()
+
+
+def bot_user_ids(user_flags, user_ids=None):
+    """
+    Sorted exclusion set of bot user ids (user_ids aligned with user_flags;
+    defaults to the flags' index)
+    """
+    user_ids = np.asarray(user_flags.index if user_ids is None else user_ids, dtype=np.int64)
+    return np.sort(user_ids[(user_flags == 'bot').to_numpy()])
+
+
+def human_event_mask(event_user_ids, exclusion):
+    """
+    Boolean mask over events keeping users not in the sorted exclusion set
+    """
+    event_user_ids = np.asarray(event_user_ids, dtype=np.int64)
+    if len(exclusion) == 0:
+        return np.ones(len(event_user_ids), dtype=bool)
+    at = np.minimum(np.searchsorted(exclusion, event_user_ids), len(exclusion) - 1)
+    return exclusion[at] != event_user_ids
+
+
+def flag_counts(user_flags):
+    return {label: int((user_flags == label).sum()) for label in BOT_LABELS}
+
+
+def bot_filter_report(user_flags, n_events, event_row_bytes):
+    """
+    Flagged-user counts plus an estimate of the memory a per-user mask saves
+    over merging the flag onto every event. The merge is never run: its size
+    is modelled as a copy of each row plus an object pointer for the label.
+    """
+    merge_bytes = n_events * (event_row_bytes + np.dtype(object).itemsize)
+    mask_bytes = len(user_flags)
+    return dict(flag_counts(user_flags),
+                users=len(user_flags),
+                mask_bytes=mask_bytes,
+                estimated_merge_bytes=merge_bytes,
+                estimated_saved_bytes=merge_bytes - mask_bytes)
@@ -0,0 +1,174 @@
+import numpy as np
+
+# Prior weight, in journeys, of the logistic fit: a coalition's empirical
+# conversion rate is shrunk toward the fit as if this many extra journeys
+# had followed it, so rarely seen touchpoint sets lean on the fit
+SMOOTHING = 20.0
+
+# L2 penalty on the logistic channel coefficients (keeps them finite when a
+# channel appears in every journey, or only in converting ones)
+RIDGE = 1.0
+
+# Channel counts up to which the table is a dense array indexed by bitmask
+DENSE_TABLE_CHANNELS = 20
+
+_NEWTON_STEPS = 50
+
+
+def coalition_counts(store, keep_user=None, conversion_type='purchase'):
+    """
+    (masks, journeys, conversions) per distinct coalition, from one pass over
+    every user's events.
+
+    Each conversion counts a converting journey whose coalition is every
+    channel the user touched before it (as purchase journeys are built); each
+    user whose events end without a conversion counts a non-converting
+    journey with every channel they touched. Conversions with no touch before
+    them are skipped, as purchase_journey_bounds skips them.
+    """
+    event_types = np.asarray(store['event_type'])
+    user_index = store.user_index()
+    if keep_user is not None:
+        kept = np.asarray(keep_user)[user_index]
+        event_types, user_index = event_types[kept], user_index[kept]
+
+    n = len(event_types)
+    opens = np.ones(n, dtype=bool)
+    closes = np.ones(n, dtype=bool)
+    if n:
+        opens[1:] = closes[:-1] = user_index[1:] != user_index[:-1]
+    user_rank = np.cumsum(opens) - 1
+
+    # Channels seen before each event of its user: per-channel running counts
+    # minus the count at the user's first event
+    before = np.zeros(n, dtype=np.uint64)
+    for code in range(len(store.channels)):
+        hits = event_types == code
+        running = np.cumsum(hits) - hits
+        seen = running - running[opens][user_rank] > 0
+        before |= seen.astype(np.uint64) << np.uint64(code)
+    through = before | np.left_shift(np.uint64(1), event_types.astype(np.uint64))
+
+    converts = event_types == store.channels.index(conversion_type)
+    converting = before[converts & (before != 0)]
+    tails = through[closes & ~converts]
+
+    masks, inverse = np.unique(np.concatenate([converting, tails]), return_inverse=True)
+    inverse = inverse.ravel()
+    journeys = np.bincount(inverse, minlength=len(masks))
+    conversions = np.bincount(inverse[:len(converting)], minlength=len(masks))
+    return masks, journeys, conversions
+
+
+def mask_features(masks, n_channels):
+    """(masks, 1 + channels) design matrix: intercept, then one 0/1 column per channel bit"""
+    masks = np.asarray(masks, dtype=np.uint64)
+    bits = (masks[:, None] >> np.arange(n_channels, dtype=np.uint64)) & np.uint64(1)
+    return np.column_stack([np.ones(len(masks)), bits.astype(np.float64)])
+
+
+def fit_logistic(masks, journeys, conversions, n_channels, ridge=RIDGE, tol=1e-10):
+    """
+    Coefficients (intercept, then one per channel) of a logistic regression
+    of conversion on the channels present, fitted by Newton's method on the
+    aggregated coalition counts (one row per distinct coalition, not per journey)
+    """
+    x = mask_features(masks, n_channels)
+    journeys = np.asarray(journeys, dtype=np.float64)
+    conversions = np.asarray(conversions, dtype=np.float64)
+    penalty = np.full(x.shape[1], float(ridge))
+    penalty[0] = 0.0
+    beta = np.zeros(x.shape[1])
+    total = journeys.sum()
+    if total > 0:
+        # Start at the overall conversion rate
+        rate = np.clip(conversions.sum() / total, 1e-6, 1 - 1e-6)
+        beta[0] = np.log(rate / (1 - rate))
+    for _ in range(_NEWTON_STEPS):
+        p = 1 / (1 + np.exp(-(x @ beta)))
+        gradient = x.T @ (conversions - journeys * p) - penalty * beta
+        hessian = (x * (journeys * p * (1 - p))[:, None]).T @ x + np.diag(penalty) + 1e-9 * np.eye(len(beta))
+        step = np.linalg.solve(hessian, gradient)
+        beta += step
+        if np.abs(step).max() < tol:
+            break
+    return beta
+
+
+def conversion_table(masks, journeys, conversions, n_channels, smoothing=SMOOTHING, ridge=RIDGE):
+    """
+    Learned characteristic function: conversion probability per coalition.
+
+    Observed coalitions get their empirical rate smoothed toward the logistic
+    fit, (conversions + smoothing * fit) / (journeys + smoothing); coalitions
+    never observed get the fit itself, and the empty coalition 0. With at most
+    DENSE_TABLE_CHANNELS channels every coalition is precomputed into an
+    array indexed by bitmask; otherwise only observed ones are stored.
+    """
+    masks = np.asarray(masks, dtype=np.uint64)
+    journeys = np.asarray(journeys, dtype=np.int64)
+    conversions = np.asarray(conversions, dtype=np.int64)
+    beta = fit_logistic(masks, journeys, conversions, n_channels, ridge)
+    prior = 1 / (1 + np.exp(-(mask_features(masks, n_channels) @ beta)))
+    rates = (conversions + smoothing * prior) / np.maximum(journeys + smoothing, 1e-12)
+
+    table = {
+        'n_channels': n_channels,
+        'coefficients': beta,
+        'smoothing': smoothing,
+        'masks': masks,
+        'journeys': journeys,
+        'conversions': conversions,
+        'rates': np.where(masks == 0, 0.0, rates),
+        'dense': None,
+    }
+    if n_channels <= DENSE_TABLE_CHANNELS:
+        everything = np.arange(1 << n_channels, dtype=np.uint64)
+        dense = 1 / (1 + np.exp(-(mask_features(everything, n_channels) @ beta)))
+        dense[masks.astype(np.int64)] = rates
+        dense[0] = 0.0
+        table['dense'] = dense
+    return table
+
+
+def table_values(table, masks):
+    """Conversion probability of each coalition mask, read from the table"""
+    masks = np.asarray(masks, dtype=np.uint64)
+    if table['dense'] is not None:
+        return table['dense'][masks.astype(np.int64)]
+    beta = table['coefficients']
+    flat = masks.ravel()
+    values = 1 / (1 + np.exp(-(mask_features(flat, table['n_channels']) @ beta)))
+    position = np.searchsorted(table['masks'], flat)
+    position = np.minimum(position, max(len(table['masks']) - 1, 0))
+    if len(table['masks']):
+        observed = table['masks'][position] == flat
+        values[observed] = table['rates'][position[observed]]
+    return np.where(flat == 0, 0.0, values).reshape(masks.shape)
+
+
+def empirical_value_function(table):
+    """ShapleyEngine value_fn backed by a conversion_table (one array read per coalition)"""
+
+    def value(masks):
+        return table_values(table, masks)
+
+    return value
+
+
+def learn_conversion_table(store, keep_user=None, smoothing=SMOOTHING, ridge=RIDGE, conversion_type='purchase'):
+    """conversion_table over every converting and non-converting journey in the store"""
+    masks, journeys, conversions = coalition_counts(store, keep_user, conversion_type)
+    return conversion_table(masks, journeys, conversions, len(store.channels), smoothing, ridge)
+
+
+def table_summary(table, channels):
+    """Export-friendly view of a conversion table: fit coefficients and observed coalitions"""
+    beta = table['coefficients']
+    return {
+        'smoothing': table['smoothing'],
+        'logistic': {'intercept': float(beta[0]), **{c: float(b) for c, b in zip(channels, beta[1:])}},
+        'journeys': int(table['journeys'].sum()),
+        'conversions': int(table['conversions'].sum()),
+        'coalitions': len(table['masks']),
+    }
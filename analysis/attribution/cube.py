@@ -0,0 +1,253 @@
+import itertools
+import json
+import os
+
+import numpy as np
+
+from .bootstrap import journey_credit
+from .export import EXPORT_CHANNELS
+from .journeys import NS_PER_DAY
+from .markov import markov_revenue
+from .shapley import journey_masks
+from .trends import day_range, group_totals
+
+CUBE_DIMENSIONS = ['category', 'brand', 'price_band']
+
+# Upper edges of the price bands in USD; the last band is open-ended
+PRICE_BAND_EDGES = (25, 50, 100, 250, 500, 1000)
+
+# Brands outside the top N by purchase revenue are pooled as OTHER
+TOP_BRANDS = 50
+
+# Dimension code of a rolled-up cell (all values of that dimension)
+ALL = -1
+UNKNOWN = 'unknown'
+OTHER = 'other'
+
+# Header of a cube written as memory-mappable .npy columns
+CUBE_META_FILE = 'cube.json'
+
+# File prefix of the per-day base cells' columns
+DAILY_PREFIX = 'daily_'
+
+
+def price_band_labels(edges=PRICE_BAND_EDGES):
+    """['<25', '25-50', ..., '1000+'] for the band edges"""
+    labels = [f'<{edges[0]:g}']
+    labels += [f'{low:g}-{high:g}' for low, high in zip(edges[:-1], edges[1:])]
+    return labels + [f'{edges[-1]:g}+']
+
+
+def _labelled(codes, labels):
+    """Append UNKNOWN for missing (-1) codes and return (codes, labels)"""
+    codes = np.asarray(codes, dtype=np.int64)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels = labels + [UNKNOWN]
+    return codes, labels
+
+
+def journey_dimensions(store, purchases, values, top_brands=TOP_BRANDS, price_edges=PRICE_BAND_EDGES):
+    """
+    Cube coordinates of every journey from its purchase event: top-level
+    category ('electronics' for 'electronics.smartphone'), brand (top
+    top_brands by revenue, the rest OTHER) and price band.
+    Returns {dimension: (codes, labels)}.
+    """
+    category_codes = np.asarray(store['category_code'])[purchases].astype(np.int64)
+    tops = [code.split('.')[0] for code in store.categories['category_code']]
+    top_labels = sorted(set(tops))
+    top_of = np.array([top_labels.index(t) for t in tops] + [-1], dtype=np.int64)
+    category = _labelled(top_of[category_codes], top_labels)
+
+    brand_codes = np.asarray(store['brand'])[purchases].astype(np.int64)
+    brand_labels = list(store.categories['brand'])
+    revenue = np.bincount(brand_codes[brand_codes >= 0], weights=values[brand_codes >= 0],
+                          minlength=len(brand_labels))
+    kept = np.argsort(-revenue, kind='stable')[:top_brands]
+    kept = kept[revenue[kept] > 0]
+    brand_of = np.full(len(brand_labels) + 1, -1, dtype=np.int64)
+    brand_of[kept] = np.arange(len(kept))
+    labels = [brand_labels[b] for b in kept]
+    brand_of[:-1][brand_of[:-1] < 0] = len(labels)
+    brand = _labelled(brand_of[brand_codes], labels + [OTHER])
+
+    price_band = (np.searchsorted(price_edges, values, side='right'), price_band_labels(price_edges))
+    return {'category': category, 'brand': brand, 'price_band': price_band}
+
+
+def markov_journey_credit(touches, effects):
+    """
+    (journeys, channels) Markov credit: each journey's value is split over
+    the channels it touched in proportion to their removal effects, then each
+    channel's column is rescaled so the totals match markov_revenue's global
+    split. Cells therefore add up to the headline Markov numbers.
+    """
+    channels = list(touches['channels'])
+    effect = effects['removal_effect'].clip(lower=0).reindex(channels, fill_value=0.0).to_numpy()
+    masks = journey_masks(touches)
+    present = ((masks[:, None] >> np.arange(len(channels), dtype=np.uint64)) & np.uint64(1)).astype(bool)
+    weights = present * effect
+    sums = weights.sum(axis=1, keepdims=True)
+    credit = np.divide(weights, sums, out=np.zeros_like(weights), where=sums > 0) * touches['value'][:, None]
+
+    target = markov_revenue(effects, float(touches['value'].sum()), channels).to_numpy()
+    column_totals = credit.sum(axis=0)
+    scale = np.divide(target, column_totals, out=np.zeros_like(target), where=column_totals > 0)
+    return credit * scale
+
+
+def _cell_columns(names, coords, totals, models, export, channels):
+    """Columnar cells: a code list per dimension, journeys, revenue and credit per model and channel"""
+    n_export = len(export)
+    model_credit = {}
+    for i, model in enumerate(models):
+        block = totals[:, 2 + i * n_export:2 + (i + 1) * n_export]
+        model_credit[model] = {channels[c]: np.round(block[:, j], 2).tolist() for j, c in enumerate(export)}
+    return {
+        **{name: coords[:, i].astype(int).tolist() for i, name in enumerate(names)},
+        'journeys': totals[:, 0].astype(np.int64).tolist(),
+        'revenue': np.round(totals[:, 1], 2).tolist(),
+        'credit': model_credit,
+    }
+
+
+def build_cube(dimensions, credit, values, channels, days=None, dates=None):
+    """
+    Columnar cube of every model's channel credit per populated cell, plus
+    roll-up totals for every subset of the dimensions (ALL marks a rolled-up
+    dimension; the row with every dimension ALL is the grand total).
+
+    dimensions: journey_dimensions output; credit: {model: (journeys, channels)};
+    values: revenue per journey. One grouped pass sums every model over the
+    base cells; roll-ups are regrouped from the base cells, not the journeys.
+
+    With days (purchase day index per journey) and dates (ISO label per day
+    index), the cube also carries 'daily': the base cells split by purchase
+    day and sorted by day, so a date range is a contiguous run of rows.
+    """
+    names = list(dimensions)
+    sizes = [len(dimensions[name][1]) for name in names]
+    cell_of = np.ravel_multi_index([dimensions[name][0] for name in names], sizes)
+    base, inverse = np.unique(cell_of, return_inverse=True)
+    inverse = inverse.ravel()
+
+    export = [channels.index(c) for c in EXPORT_CHANNELS if c in channels]
+    models = list(credit)
+    stacked = np.concatenate([np.ones((len(values), 1)), values[:, None]] +
+                             [credit[m][:, export] for m in models], axis=1)
+    base_totals = group_totals(stacked, inverse, len(base))
+    base_coords = np.stack(np.unravel_index(base, sizes), axis=1)
+
+    # Grand total first, then every other grouping set regrouped from the base cells
+    coords = [np.full((1, len(names)), ALL)]
+    totals = [base_totals.sum(axis=0, keepdims=True)]
+    for rolled in itertools.product([False, True], repeat=len(names)):
+        if all(rolled) or len(base) == 0:
+            continue
+        unique, group = np.unique(np.where(rolled, ALL, base_coords), axis=0, return_inverse=True)
+        coords.append(unique)
+        totals.append(group_totals(base_totals, group.ravel(), len(unique)))
+    coords = np.concatenate(coords)
+    totals = np.concatenate(totals)
+
+    cube = {
+        'dimensions': {name: dimensions[name][1] for name in names},
+        'all_code': ALL,
+        'channels': [channels[c] for c in export],
+        'cells': _cell_columns(names, coords, totals, models, export, channels),
+    }
+    if days is not None:
+        # Day is the most significant index, so np.unique returns the rows by day
+        daily_sizes = [len(dates)] + sizes
+        daily, inverse = np.unique(np.ravel_multi_index([days] + [dimensions[name][0] for name in names],
+                                                        daily_sizes), return_inverse=True)
+        daily_totals = group_totals(stacked, inverse.ravel(), len(daily))
+        daily_coords = np.stack(np.unravel_index(daily, daily_sizes), axis=1)
+        cube['daily'] = {'dates': list(dates),
+                         'cells': _cell_columns(['day'] + names, daily_coords, daily_totals, models, export,
+                                                channels)}
+    return cube
+
+
+def attribution_cube(store, bounds, touches, models=None, engine=None, markov_effects=None,
+                     top_brands=TOP_BRANDS, price_edges=PRICE_BAND_EDGES):
+    """
+    Attribution cube for the purchase journeys in bounds/touches: every
+    rule-based model, Shapley (with engine) and Markov (with markov_effects)
+    credited by category, brand and price band, with a per-day split of the
+    base cells for date-range queries
+    """
+    credit = journey_credit(touches, models, engine)
+    if markov_effects is not None:
+        credit['markov'] = markov_journey_credit(touches, markov_effects)
+    values = touches['value']
+    dimensions = journey_dimensions(store, bounds['purchase'], values, top_brands, price_edges)
+    origin, n_days = day_range(store)
+    days = (touches['conversion_time'] - origin) // NS_PER_DAY
+    dates = np.datetime64(origin, 'ns').astype('datetime64[D]') + np.arange(n_days)
+    return build_cube(dimensions, credit, values, list(touches['channels']), days, [str(d) for d in dates])
+
+
+def _numpy_columns(cells, names, models, channels):
+    columns = {name: np.asarray(cells[name], dtype=np.int16) for name in names}
+    columns['journeys'] = np.asarray(cells['journeys'], dtype=np.int64)
+    columns['revenue'] = np.asarray(cells['revenue'], dtype=np.float64)
+    columns['credit'] = np.array([[cells['credit'][m][c] for c in channels] for m in models],
+                                 dtype=np.float64).reshape(len(models), len(channels), -1)
+    return columns
+
+
+def cube_columns(cube):
+    """
+    Cube cells as numpy columns: an int16 code per dimension, journeys,
+    revenue, and credit as one (models, channels, cells) float64 array.
+    The daily cells, when present, follow with a DAILY_PREFIX and a day column.
+    """
+    models = list(cube['cells']['credit'])
+    names = list(cube['dimensions'])
+    columns = _numpy_columns(cube['cells'], names, models, cube['channels'])
+    if 'daily' in cube:
+        daily = _numpy_columns(cube['daily']['cells'], ['day'] + names, models, cube['channels'])
+        columns.update({DAILY_PREFIX + name: values for name, values in daily.items()})
+    return columns
+
+
+def _column_names(header):
+    names = list(header['dimensions']) + ['journeys', 'revenue', 'credit']
+    if 'dates' in header:
+        names += [DAILY_PREFIX + name for name in ['day'] + names]
+    return names
+
+
+def _replace_file(path, write, mode='wb'):
+    """Write to a side file and rename it over path, so mapped readers keep the old file"""
+    with open(path + '.partial', mode) as f:
+        write(f)
+    os.replace(path + '.partial', path)
+
+
+def write_cube_arrays(cube, directory):
+    """
+    Write the cube as one .npy file per column plus a small JSON header
+    (dimension labels, models, channels, daily dates), so readers can
+    memory-map it. Every file is replaced, never rewritten in place; the
+    header goes last.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, values in cube_columns(cube).items():
+        _replace_file(os.path.join(directory, name + '.npy'), lambda f: np.save(f, values))
+    header = {'dimensions': cube['dimensions'], 'all_code': cube['all_code'], 'channels': cube['channels'],
+              'models': list(cube['cells']['credit'])}
+    if 'daily' in cube:
+        header['dates'] = cube['daily']['dates']
+    _replace_file(os.path.join(directory, CUBE_META_FILE), lambda f: json.dump(header, f, indent=2), 'w')
+    return directory
+
+
+def load_cube_arrays(directory):
+    """(header, columns) of a write_cube_arrays directory, columns memory-mapped"""
+    with open(os.path.join(directory, CUBE_META_FILE)) as f:
+        header = json.load(f)
+    return header, {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+                    for name in _column_names(header)}
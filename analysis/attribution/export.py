@@ -0,0 +1,88 @@
+import json
+import os
+
+# Dashboard channels, in display order
+EXPORT_CHANNELS = ['view', 'cart', 'purchase']
+
+# Qualitative scores shown on the dashboard radar chart
+MODEL_SCORES = {
+    'first_touch': {'accuracy': 3, 'fairness': 2, 'business_value': 4},
+    'last_touch': {'accuracy': 3, 'fairness': 2, 'business_value': 4},
+    'linear': {'accuracy': 5, 'fairness': 6, 'business_value': 6},
+    'shapley': {'accuracy': 8, 'fairness': 9, 'business_value': 8},
+    'markov': {'accuracy': 9, 'fairness': 8, 'business_value': 9}
+}
+
+
+def channel_shares(revenue):
+    """
+    Percent of each model's revenue credited to each channel
+    (revenue: DataFrame indexed by channel, one column per model)
+    """
+    revenue = revenue.reindex(EXPORT_CHANNELS, fill_value=0.0)
+    totals = revenue.sum(axis=0).replace(0, float('nan'))
+    return (revenue / totals * 100).fillna(0.0)
+
+
+def funnel_rates(funnel):
+    """
+    Dashboard funnel percentages from session_funnel counts: sessions with a
+    purchase, and cart sessions without one, per session with a cart
+    """
+    carts = max(funnel['cart_sessions'], 1)
+    return {'conversion_rate': round(100 * funnel['purchase_sessions'] / carts, 1),
+            'cart_abandonment_rate': round(100 * funnel['abandoned_carts'] / carts, 1)}
+
+
+def build_dashboard_export(revenue, journey_stats, meta, run_metrics=None, intervals=None, trends=None,
+                           scenarios=None):
+    """
+    attribution-results.json payload for the React dashboard.
+
+    revenue: channel x model revenue (columns are the export model keys)
+    journey_stats: avg_touchpoints, avg_days, total_journeys_analyzed and the
+    session_funnel counts (cart_sessions, purchase_sessions, abandoned_carts)
+    meta: run-level counts for the meta block
+    run_metrics: optional RunMetrics summary, exported as run_metrics
+    intervals: optional bootstrap_intervals output, exported as attribution_intervals
+    trends: optional lookback_windows and attribution_trends blocks (see trends.py)
+    scenarios: optional budget_scenarios output, exported as budget_scenarios
+    """
+    shares = channel_shares(revenue)
+    payload = {
+        'meta': meta,
+        'attribution_models': {
+            model: {channel: float(shares.loc[channel, model]) for channel in EXPORT_CHANNELS}
+            for model in shares.columns
+        },
+    }
+    if intervals is not None:
+        payload['attribution_intervals'] = intervals
+    payload.update({
+        'journey_stats': {
+            'avg_touchpoints': float(journey_stats['avg_touchpoints']),
+            'avg_days': float(journey_stats['avg_days']),
+            'total_journeys_analyzed': int(journey_stats['total_journeys_analyzed']),
+            **funnel_rates(journey_stats),
+        },
+        'model_comparison': MODEL_SCORES
+    })
+    if trends is not None:
+        payload.update(trends)
+    if scenarios is not None:
+        payload['budget_scenarios'] = scenarios
+    if run_metrics is not None:
+        payload['run_metrics'] = run_metrics
+    return payload
+
+
+def write_export(payload, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write then rename, so readers that memory-map the file never see it half written
+    partial = path + '.partial'
+    with open(partial, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(partial, path)
+    return path
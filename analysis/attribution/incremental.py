@@ -0,0 +1,738 @@
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .bots import BOT_BINS, BOT_LABELS, FUNNEL_COUNTS, funnel_counts, funnel_flags, session_funnel
+from .conversion import SMOOTHING, coalition_counts, conversion_table, empirical_value_function
+from .export import build_dashboard_export, write_export
+from .ingest import EVENT_TYPES, MISSING_SESSION
+from .journeys import NS_PER_DAY, purchase_journey_bounds, tie_run_ends
+from .markov import (CONVERSION_CODE, NULL_CODE, build_transition_counts, chain_code_counts,
+                     chain_from_code_counts, markov_revenue, pack_histories, removal_effects)
+from .rules import (FIRST_SHARE, HALF_LIFE_DAYS, LAST_SHARE, RULE_MODELS, flatten_touchpoints,
+                    touch_credit)
+from .sessions import TOUCHPOINT_UNITS
+from .shapley import ShapleyEngine, heuristic_value_function, journey_masks
+from .store import STORE_COLUMNS, JourneyStore, MemoryStore, build_store
+
+CHECKPOINT_META = 'checkpoint.json'
+STATE_FILE = 'state.npz'
+SEGMENTS_DIR = 'segments'
+USERS_DIR = 'users'
+SESSIONS_DIR = 'sessions'
+
+# A fold writes its users' carry state (and its new session keys) as a new
+# table, merged into the previous one while that holds at most this many times
+# its rows: a checkpoint keeps O(log users) tables and a fold rewrites O(day)
+# rows amortised instead of the whole history
+MERGE_RATIO = 2
+
+# Mixes user ids into session hashes so one sorted key array tracks distinct (user, session) pairs
+SESSION_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# Users with more distinct sessions than this are bots (upper edge of 'suspicious')
+BOT_SESSION_LIMIT = BOT_BINS[2]
+
+# Incremental folding covers the built-in rule-based models
+INCREMENTAL_MODELS = list(RULE_MODELS)
+
+# Settings a checkpoint is created with; every later fold must ask for the same
+CHECKPOINT_SETTINGS = ('conversion_type', 'markov_order', 'touchpoint_unit', 'lookback_days')
+
+# Per-user carry state: (dtype, value for users not seen before)
+USER_STATE = {
+    'n_events': (np.int64, 0),
+    'first_channel': (np.int16, -1),
+    'first_time': (np.int64, 0),
+    'last_channel': (np.int16, -1),
+    'history': (np.int64, 0),
+    'sessions': (np.int64, 0),
+    'bot': (np.bool_, False),
+    'decay_ref': (np.int64, 0),  # time the user's decay sums are relative to
+}
+# Per-user, per-channel carry state
+USER_CHANNEL_STATE = {
+    'counts': np.int64,
+    'decay': np.float64,
+}
+
+
+def _pair_keys(src_codes, dst_codes, width):
+    return (src_codes + 2) * width + (dst_codes + 2)
+
+
+def _atomic_write(path, write):
+    """Write path through a temporary file and os.replace it, so readers see the old or the new file"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _write_table(path, columns):
+    """Write columns as one .npy file each into the directory path"""
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp, name + '.npy'), values)
+    os.replace(tmp, path)
+
+
+def _read_table(path, names):
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in names}
+
+
+def _merge_tables(older, newer, key):
+    """Union of two tables sorted by column key, keeping each key's row from newer"""
+    keys = np.concatenate([older[key], newer[key]])
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    # The stable sort puts a key's newer row last
+    keep = np.append(keys[1:] != keys[:-1], True)
+    return {name: np.concatenate([older[name], newer[name]])[order][keep] for name in newer}
+
+
+def _bot_labels(sessions):
+    return pd.cut(pd.Series(sessions), bins=BOT_BINS, labels=BOT_LABELS, include_lowest=True)
+
+
+def _add_counts(keys, counts, new_keys, new_counts):
+    """Sum two sparse (key, count) tables"""
+    keys, inverse = np.unique(np.concatenate([keys, new_keys]), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate([counts, new_counts]), minlength=len(keys))
+    return keys, totals
+
+
+class AttributionCheckpoint:
+    """
+    Persisted attribution state that a new day of events can be folded into.
+
+    Holds per-user carry state (distinct session keys for the bot filter, the
+    open journey summary and the Markov history each user's next event
+    continues from), Markov transition counts in packed-code space,
+    per-model revenue accumulators, and the journey and conversion counts per
+    coalition that the learned Shapley value function is fitted on. Folding a day touches only that day's
+    events plus the users it mentions; users who cross the bot threshold have
+    their earlier contributions subtracted from the archived day segments, so
+    the totals always equal a full recompute over every folded day.
+
+    state.npz holds the metadata and accumulators and is the commit point of
+    a fold: it is replaced atomically and names the user and session-key
+    tables in force, so an interrupted fold leaves the previous one intact.
+    checkpoint.json is a readable copy of the metadata.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(os.path.join(path, STATE_FILE)) as state:
+            self.meta = json.loads(state['meta'].item())
+            self.state = {name: state[name] for name in state.files if name != 'meta'}
+        self.channels = self.meta['channels']
+        self.conversion = self.channels.index(self.meta['conversion_type'])
+        self.order = self.meta['markov_order']
+        self.base = len(self.channels)  # non-conversion channels + 1 padding digit
+        self.code_width = self.base ** self.order + 2
+        self._obsolete = []
+        self._remove_orphans()
+
+    @classmethod
+    def create(cls, path, channels=None, markov_order=1, conversion_type='purchase', touchpoint_unit='event',
+               lookback_days=None):
+        """
+        New empty checkpoint. Only event touchpoints over whole journeys can be
+        folded: sessions and lookback windows both need events the carried
+        per-user summaries no longer hold, so other settings raise ValueError
+        (run the pipeline for those).
+        """
+        if touchpoint_unit not in TOUCHPOINT_UNITS:
+            raise ValueError(f"Unknown touchpoint unit '{touchpoint_unit}' (use 'event' or 'session')")
+        if touchpoint_unit != 'event' or lookback_days is not None:
+            raise ValueError("Checkpoints fold event touchpoints over whole journeys; "
+                             "use the pipeline for session touchpoints or a lookback window")
+        channels = list(channels or EVENT_TYPES)
+        n_channels = len(channels)
+        for directory in (SEGMENTS_DIR, USERS_DIR, SESSIONS_DIR):
+            os.makedirs(os.path.join(path, directory), exist_ok=True)
+        meta = {
+            'channels': channels,
+            'conversion_type': conversion_type,
+            'markov_order': markov_order,
+            'touchpoint_unit': touchpoint_unit,
+            'lookback_days': lookback_days,
+            'last_time_ns': None,
+            'segments': [],
+            'tables': {USERS_DIR: [], SESSIONS_DIR: []},
+            'next_table': 0,
+            'flags': {label: 0 for label in BOT_LABELS},
+            'totals': {'events': 0, 'users': 0, 'sessions': 0, 'journeys': 0, 'touchpoints': 0,
+                       'journey_days': 0, 'revenue': 0.0, **dict.fromkeys(FUNNEL_COUNTS, 0)},
+        }
+        state = {'rule_revenue': np.zeros((len(INCREMENTAL_MODELS), n_channels)),
+                 'shapley_masks': np.empty(0, dtype=np.uint64),
+                 'shapley_values': np.empty(0),
+                 'shapley_counts': np.empty(0, dtype=np.int64),
+                 'coalition_masks': np.empty(0, dtype=np.uint64),
+                 'coalition_journeys': np.empty(0, dtype=np.int64),
+                 'coalition_conversions': np.empty(0, dtype=np.int64),
+                 'markov_keys': np.empty(0, dtype=np.int64),
+                 'markov_counts': np.empty(0, dtype=np.int64)}
+        _atomic_write(os.path.join(path, STATE_FILE),
+                      lambda f: np.savez(f, meta=json.dumps(meta), **state))
+        checkpoint = cls(path)
+        checkpoint.save()
+        return checkpoint
+
+    @classmethod
+    def open_or_create(cls, path, **params):
+        """Open the checkpoint at path, refusing it if it was created with other settings"""
+        if not os.path.exists(os.path.join(path, STATE_FILE)):
+            return cls.create(path, **params)
+        checkpoint = cls(path)
+        checkpoint.check_settings(**{k: v for k, v in params.items() if k in CHECKPOINT_SETTINGS})
+        return checkpoint
+
+    def settings(self):
+        """The settings this checkpoint folds with (checkpoints without them used the defaults)"""
+        defaults = {'touchpoint_unit': 'event', 'lookback_days': None}
+        return {name: self.meta.get(name, defaults.get(name)) for name in CHECKPOINT_SETTINGS}
+
+    def check_settings(self, **settings):
+        """Raise ValueError if any given setting differs from the checkpoint's"""
+        current = self.settings()
+        mismatched = {name: (current[name], value) for name, value in settings.items() if current[name] != value}
+        if mismatched:
+            details = ', '.join(f"{name}={have!r} (asked for {want!r})" for name, (have, want) in mismatched.items())
+            raise ValueError(f"Checkpoint '{self.path}' was built with {details}; "
+                             f"fold into a new checkpoint to change them")
+
+    def save(self):
+        """Commit: replace state.npz, refresh checkpoint.json, then drop tables merged away"""
+        _atomic_write(os.path.join(self.path, STATE_FILE),
+                      lambda f: np.savez(f, meta=json.dumps(self.meta), **self.state))
+        _atomic_write(os.path.join(self.path, CHECKPOINT_META),
+                      lambda f: f.write(json.dumps(self.meta, indent=2).encode()))
+        for path in self._obsolete:
+            shutil.rmtree(path, ignore_errors=True)
+        self._obsolete = []
+
+    def _remove_orphans(self):
+        """Delete tables an interrupted fold wrote or merged away but never committed"""
+        for kind, tables in self.meta['tables'].items():
+            live = {table['name'] for table in tables}
+            for name in os.listdir(os.path.join(self.path, kind)):
+                if name not in live:
+                    shutil.rmtree(os.path.join(self.path, kind, name), ignore_errors=True)
+
+    # ---- carry tables --------------------------------------------------
+
+    def _append_table(self, kind, key, columns):
+        """
+        Write columns (sorted by columns[key]) as the newest table of kind,
+        first merging in older tables that are at most MERGE_RATIO times its size
+        """
+        tables = self.meta['tables'][kind]
+        while tables and tables[-1]['rows'] <= MERGE_RATIO * len(columns[key]):
+            path = os.path.join(self.path, kind, tables.pop()['name'])
+            columns = _merge_tables(_read_table(path, columns), columns, key)
+            self._obsolete.append(path)
+        name = f"{self.meta['next_table']:08d}"
+        self.meta['next_table'] += 1
+        _write_table(os.path.join(self.path, kind, name), columns)
+        tables.append({'name': name, 'rows': int(len(columns[key]))})
+
+    def _user_rows(self, day_users):
+        """
+        Carry state of day_users (sorted), each from the newest table holding
+        it, with defaults for users not seen before. Returns (columns, known).
+        """
+        n = len(day_users)
+        columns = {name: np.full(n, default, dtype=dtype) for name, (dtype, default) in USER_STATE.items()}
+        for name, dtype in USER_CHANNEL_STATE.items():
+            columns[name] = np.zeros((n, len(self.channels)), dtype=dtype)
+        known = np.zeros(n, dtype=bool)
+        for table in reversed(self.meta['tables'][USERS_DIR]):
+            stored = _read_table(os.path.join(self.path, USERS_DIR, table['name']), ['users', *columns])
+            at = np.minimum(np.searchsorted(stored['users'], day_users), table['rows'] - 1)
+            hit = ~known & (stored['users'][at] == day_users)
+            for name in columns:
+                columns[name][hit] = stored[name][at[hit]]
+            known |= hit
+            if known.all():
+                break
+        return columns, known
+
+    # ---- folding -------------------------------------------------------
+
+    def _channel_codes(self, store):
+        """Map a store's event_type codes onto checkpoint channel indices"""
+        unknown = [c for c in store.channels if c not in self.channels]
+        if unknown:
+            raise ValueError(f"Channels {unknown} are not in the checkpoint's channel list")
+        remap = np.array([self.channels.index(c) for c in store.channels], dtype=np.int64)
+        return remap[np.asarray(store['event_type'])]
+
+    def _count_sessions(self, carry, user_of_event, user_ids, sessions, flags, active):
+        """
+        Add the day's unseen (user, session) pairs to each user's distinct
+        count, and move the funnel totals by the sessions of active users
+        whose funnel flags the day changed
+        """
+        present = np.flatnonzero(sessions != MISSING_SESSION)
+        keys = sessions[present] ^ (user_ids[present].astype(np.uint64) * SESSION_KEY_MULTIPLIER)
+        keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        first = present[first]
+        day_flags = np.zeros(len(keys), dtype=np.uint8)
+        np.bitwise_or.at(day_flags, inverse.ravel(), flags[present])
+
+        seen = np.zeros(len(keys), dtype=bool)
+        old_flags = np.zeros(len(keys), dtype=np.uint8)
+        for table in reversed(self.meta['tables'][SESSIONS_DIR]):
+            stored = _read_table(os.path.join(self.path, SESSIONS_DIR, table['name']), ['keys', 'funnel'])
+            at = np.minimum(np.searchsorted(stored['keys'], keys), table['rows'] - 1)
+            hit = ~seen & (stored['keys'][at] == keys)
+            old_flags[hit] = stored['funnel'][at[hit]]
+            seen |= hit
+        np.add.at(carry['sessions'], user_of_event[first[~seen]], 1)
+        self.meta['totals']['sessions'] += int((~seen).sum())
+
+        new_flags = old_flags | day_flags
+        owned = active[user_of_event[first]]
+        totals = self.meta['totals']
+        before, after = funnel_counts(old_flags[owned]), funnel_counts(new_flags[owned])
+        for name in before:
+            totals[name] += after[name] - before[name]
+        changed = ~seen | (new_flags != old_flags)
+        if changed.any():
+            self._append_table(SESSIONS_DIR, 'keys', {'keys': keys[changed], 'funnel': new_flags[changed]})
+
+    def fold(self, source, label, **settings):
+        """
+        Fold one day of events (CSV path or compact events DataFrame) into the
+        checkpoint. Events must be newer than anything already folded. Any
+        settings given (touchpoint_unit, lookback_days, ...) must match the
+        checkpoint's.
+        """
+        self.check_settings(**settings)
+        segment_dir = os.path.join(self.path, SEGMENTS_DIR, label)
+        if label in self.meta['segments']:
+            raise ValueError(f"Segment '{label}' has already been folded")
+        day = build_store(source, segment_dir, columns=STORE_COLUMNS)
+        if len(day) == 0:
+            self.meta['segments'].append(label)
+            self.save()
+            return
+
+        times = np.asarray(day['event_time']).view(np.int64)
+        if self.meta['last_time_ns'] is not None and times.min() <= self.meta['last_time_ns']:
+            raise ValueError("Events overlap the checkpoint; fold days in order")
+
+        channel = self._channel_codes(day)
+        user_of_event = day.user_index().astype(np.int64)
+        offsets = np.asarray(day.offsets)
+        day_users = np.asarray(day.users).astype(np.int64)
+        carry, known = self._user_rows(day_users)
+
+        old_labels = _bot_labels(carry['sessions'][known])
+        bot_before = carry['bot'].copy()
+        self._count_sessions(carry, user_of_event, np.asarray(day['user_id']), np.asarray(day['user_session']),
+                             funnel_flags(self.channels)[channel], ~bot_before)
+        new_labels = _bot_labels(carry['sessions'])
+        for bot_label in BOT_LABELS:
+            self.meta['flags'][bot_label] += int((new_labels == bot_label).sum() - (old_labels == bot_label).sum())
+        bot_now = carry['sessions'] > BOT_SESSION_LIMIT
+        carry['bot'] = bot_now
+
+        # Decay sums are relative to each user's last fold; rebasing them to
+        # today keeps the exponents within one day however long the history
+        origin = int(times.min())
+        scale = np.exp2((carry['decay_ref'][known] - origin) / (HALF_LIFE_DAYS * NS_PER_DAY))
+        carry['decay'][known] *= scale[:, None]
+        carry['decay_ref'][:] = origin
+
+        n_channels = len(self.channels)
+        onehot = np.zeros((len(channel), n_channels), dtype=np.int64)
+        onehot[np.arange(len(channel)), channel] = 1
+        cum_counts = np.zeros((len(channel) + 1, n_channels), dtype=np.int64)
+        np.cumsum(onehot, axis=0, out=cum_counts[1:])
+        decay = onehot * np.exp2((times - origin) / (HALF_LIFE_DAYS * NS_PER_DAY))[:, None]
+        cum_decay = np.zeros((len(channel) + 1, n_channels))
+        np.cumsum(decay, axis=0, out=cum_decay[1:])
+
+        active = ~bot_before
+        self._fold_purchases(day, channel, times, user_of_event, offsets, carry, active,
+                             cum_counts, cum_decay)
+        new_history = self._fold_transitions(channel, user_of_event, offsets, carry, active)
+        self._fold_coalitions(channel, user_of_event, offsets, carry, active, cum_counts)
+
+        # Carry every user's journey summary into tomorrow
+        starts, ends = offsets[:-1], offsets[1:]
+        fresh = carry['n_events'] == 0
+        carry['first_channel'][fresh] = channel[starts[fresh]]
+        carry['first_time'][fresh] = times[starts[fresh]]
+        carry['last_channel'][:] = channel[ends - 1]
+        carry['n_events'] += ends - starts
+        carry['counts'] += cum_counts[ends] - cum_counts[starts]
+        carry['decay'] += cum_decay[ends] - cum_decay[starts]
+        carry['history'] = new_history
+        self._append_table(USERS_DIR, 'users', {'users': day_users, **carry})
+
+        # Users who just became bots leave every accumulator
+        newly_flagged = day_users[bot_now & ~bot_before]
+        self.meta['segments'].append(label)
+        if len(newly_flagged):
+            self._subtract_users(newly_flagged)
+
+        self.meta['last_time_ns'] = int(times.max())
+        self.meta['totals']['events'] += len(day)
+        self.meta['totals']['users'] += int((~known).sum())
+        self.save()
+
+    def _fold_purchases(self, day, channel, times, user_of_event, offsets, carry, active,
+                        cum_counts, cum_decay):
+        """
+        Credit every purchase of the day, continuing each user's journey from the
+        carried summary (first touch, last touch, channel counts, decay sums)
+        """
+        purchases = np.flatnonzero((channel == self.conversion) & active[user_of_event])
+        run_starts, run_ends = tie_run_ends(user_of_event, times)
+        journey_end = run_ends[np.searchsorted(run_starts, purchases, side='right') - 1]
+        user = user_of_event[purchases]
+        start = offsets[user]
+
+        carried = carry['n_events'][user]
+        length = carried + (journey_end - 1 - start)
+        valid = length >= 1
+        purchases, journey_end, user, start, carried, length = (
+            a[valid] for a in (purchases, journey_end, user, start, carried, length))
+        if len(purchases) == 0:
+            return
+
+        counts = carry['counts'][user] + cum_counts[journey_end - 1] - cum_counts[start]
+        decay = carry['decay'][user] + cum_decay[journey_end - 1] - cum_decay[start]
+        first = np.where(carried > 0, carry['first_channel'][user], channel[start])
+        first_time = np.where(carried > 0, carry['first_time'][user], times[start])
+        last_pos = journey_end - 2
+        last = np.where(last_pos >= start, channel[np.maximum(last_pos, 0)], carry['last_channel'][user])
+        value = np.asarray(day['price'][purchases], dtype=np.float64)
+
+        n_channels = len(self.channels)
+        first_hot = np.eye(n_channels)[first]
+        last_hot = np.eye(n_channels)[last]
+        lengths = length[:, None].astype(np.float64)
+        middle_share = 1.0 - FIRST_SHARE - LAST_SHARE
+        end_share = np.where(lengths > 2, 0.0, middle_share / 2)
+        per_middle = np.where(lengths > 2, middle_share / np.maximum(lengths - 2, 1), 0.0)
+
+        weights = {
+            'first_touch': first_hot,
+            'last_touch': last_hot,
+            'linear': counts / lengths,
+            'time_decay': decay / decay.sum(axis=1, keepdims=True),
+            'position_based': ((FIRST_SHARE + end_share) * first_hot
+                               + (LAST_SHARE + end_share) * last_hot
+                               + per_middle * (counts - first_hot - last_hot)),
+        }
+        for i, model in enumerate(INCREMENTAL_MODELS):
+            self.state['rule_revenue'][i] += (weights[model] * value[:, None]).sum(axis=0)
+
+        masks = self._masks(counts)
+        self._add_shapley(masks, value, np.ones(len(masks), dtype=np.int64))
+
+        totals = self.meta['totals']
+        totals['journeys'] += int(len(purchases))
+        totals['touchpoints'] += int(length.sum())
+        totals['journey_days'] += int(((times[purchases] - first_time) // NS_PER_DAY).sum())
+        totals['revenue'] += float(value.sum())
+
+    def _fold_coalitions(self, channel, user_of_event, offsets, carry, active, cum_counts):
+        """
+        Count the day's journeys per coalition as coalition_counts does: each
+        conversion adds a converting journey over every channel its user touched
+        before it, and each user's open tail (events after the last conversion)
+        is a non-converting journey whose coalition moves from yesterday's
+        channel set to today's.
+        """
+        purchases = np.flatnonzero((channel == self.conversion) & active[user_of_event])
+        user = user_of_event[purchases]
+        before = self._masks(carry['counts'][user] + cum_counts[purchases] - cum_counts[offsets[user]])
+        before = before[before != 0]
+
+        starts, ends = offsets[:-1], offsets[1:]
+        old_tail = active & (carry['n_events'] > 0) & (carry['last_channel'] != self.conversion)
+        new_tail = active & (channel[ends - 1] != self.conversion)
+        old_masks = self._masks(carry['counts'][old_tail])
+        new_masks = self._masks(carry['counts'][new_tail] + cum_counts[ends[new_tail]]
+                                - cum_counts[starts[new_tail]])
+
+        masks = np.concatenate([before, old_masks, new_masks])
+        journeys = np.concatenate([np.ones(len(before), dtype=np.int64),
+                                   -np.ones(len(old_masks), dtype=np.int64),
+                                   np.ones(len(new_masks), dtype=np.int64)])
+        conversions = np.concatenate([np.ones(len(before), dtype=np.int64),
+                                      np.zeros(len(old_masks) + len(new_masks), dtype=np.int64)])
+        self._add_coalitions(masks, journeys, conversions)
+
+    def _fold_transitions(self, channel, user_of_event, offsets, carry, active):
+        """
+        Count the day's Markov transitions, continuing each user's open journey
+        from its carried history code. Returns every day user's new history code
+        (0 when the user's last event was a conversion).
+        """
+        order, base = self.order, self.base
+        converts = channel == self.conversion
+        digit_of = np.zeros(len(self.channels), dtype=np.int64)
+        digit_of[[c for c in range(len(self.channels)) if c != self.conversion]] = \
+            np.arange(1, len(self.channels))
+        digits = digit_of[channel]
+
+        n = len(channel)
+        first_today = np.zeros(n, dtype=bool)
+        first_today[offsets[:-1]] = True
+        opens = first_today.copy()
+        opens[1:] |= converts[:-1]
+        open_pos = np.maximum.accumulate(np.where(opens, np.arange(n), 0))
+        journey_pos = np.arange(n) - open_pos
+
+        history = carry['history'][user_of_event]
+        codes = pack_histories(digits, journey_pos, order, base)
+        # Journeys still open from yesterday take their older digits from the carry
+        continuing = open_pos == offsets[user_of_event]
+        shift = np.where(journey_pos + 1 < order, base ** np.minimum(journey_pos + 1, order), 0)
+        codes[continuing] += (history[continuing] * shift[continuing]) % (base ** order)
+        codes[converts] = CONVERSION_CODE
+
+        prev = np.empty(n, dtype=np.int64)
+        prev[1:] = codes[:-1]
+        prev[opens] = 0
+        prev[first_today] = history[first_today]
+
+        last_codes = codes[offsets[1:] - 1]
+        new_history = np.where(last_codes == CONVERSION_CODE, 0, last_codes)
+
+        # Provisional exits to NULL move from yesterday's open state to today's
+        user_active = active
+        old_open = user_active & (carry['history'] != 0)
+        new_open = user_active & (new_history != 0)
+        event_active = user_active[user_of_event]
+        src = np.concatenate([prev[event_active], carry['history'][old_open], new_history[new_open]])
+        dst = np.concatenate([codes[event_active], np.full(int(old_open.sum()), NULL_CODE),
+                              np.full(int(new_open.sum()), NULL_CODE)])
+        weight = np.concatenate([np.ones(int(event_active.sum()), dtype=np.int64),
+                                 -np.ones(int(old_open.sum()), dtype=np.int64),
+                                 np.ones(int(new_open.sum()), dtype=np.int64)])
+        self._add_markov(src, dst, weight)
+        return new_history
+
+    def _add_shapley(self, masks, values, counts):
+        state = self.state
+        keys, inverse = np.unique(np.concatenate([state['shapley_masks'], masks]), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate([state['shapley_values'], values]),
+                             minlength=len(keys))
+        journeys = np.bincount(inverse, weights=np.concatenate([state['shapley_counts'], counts]),
+                               minlength=len(keys)).astype(np.int64)
+        live = journeys != 0
+        state['shapley_masks'], state['shapley_values'], state['shapley_counts'] = \
+            keys[live], totals[live], journeys[live]
+
+    def _add_coalitions(self, masks, journeys, conversions):
+        state = self.state
+        keys, inverse = np.unique(np.concatenate([state['coalition_masks'], masks]), return_inverse=True)
+        inverse = inverse.ravel()
+        totals = np.bincount(inverse, weights=np.concatenate([state['coalition_journeys'], journeys]),
+                             minlength=len(keys)).astype(np.int64)
+        converted = np.bincount(inverse, weights=np.concatenate([state['coalition_conversions'], conversions]),
+                                minlength=len(keys)).astype(np.int64)
+        live = totals != 0
+        state['coalition_masks'], state['coalition_journeys'], state['coalition_conversions'] = \
+            keys[live], totals[live], converted[live]
+
+    def _masks(self, counts):
+        """Coalition bitmask of every row of per-channel counts"""
+        bits = np.left_shift(np.uint64(1), np.arange(len(self.channels), dtype=np.uint64))
+        return ((counts > 0) * bits).sum(axis=1).astype(np.uint64)
+
+    def _add_markov(self, src_codes, dst_codes, counts):
+        state = self.state
+        keys, totals = _add_counts(state['markov_keys'], state['markov_counts'],
+                                   _pair_keys(src_codes, dst_codes, self.code_width), counts)
+        totals = totals.astype(np.int64)
+        live = totals != 0
+        state['markov_keys'], state['markov_counts'] = keys[live], totals[live]
+
+    # ---- bot subtraction -----------------------------------------------
+
+    def history_store(self, user_ids):
+        """
+        MemoryStore with every archived event of user_ids (event_type holds
+        checkpoint channel indices)
+        """
+        user_ids = np.sort(np.asarray(user_ids, dtype=np.int64))
+        parts = {name: [] for name in STORE_COLUMNS}
+        for label in self.meta['segments']:
+            segment = JourneyStore(os.path.join(self.path, SEGMENTS_DIR, label))
+            if len(segment) == 0:
+                continue
+            seg_users = np.asarray(segment.users).astype(np.int64)
+            at = np.minimum(np.searchsorted(seg_users, user_ids), len(seg_users) - 1)
+            present = at[seg_users[at] == user_ids]
+            seg_offsets = np.asarray(segment.offsets)
+            starts = seg_offsets[present]
+            lengths = seg_offsets[present + 1] - starts
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+            for name in STORE_COLUMNS:
+                values = self._channel_codes(segment) if name == 'event_type' else segment[name]
+                parts[name].append(np.asarray(values)[positions])
+
+        columns = {name: np.concatenate(parts[name]) if parts[name] else np.empty(0)
+                   for name in STORE_COLUMNS}
+        # Segments are chronological, so a stable sort by user keeps time order
+        order = np.argsort(columns['user_id'], kind='stable')
+        columns = {name: values[order] for name, values in columns.items()}
+        return MemoryStore(columns, {'event_type': self.channels})
+
+    def _subtract_users(self, user_ids):
+        """Remove every contribution the given users made to the accumulators"""
+        store = self.history_store(user_ids)
+        bounds = purchase_journey_bounds(store, purchase_type=self.meta['conversion_type'])
+        touches = flatten_touchpoints(store, bounds)
+        n_channels = len(self.channels)
+        for i, model in enumerate(INCREMENTAL_MODELS):
+            credit = touch_credit(touches, model)
+            self.state['rule_revenue'][i] -= np.bincount(touches['channel'], weights=credit,
+                                                         minlength=n_channels)
+
+        masks = journey_masks(touches)
+        self._add_shapley(masks, -touches['value'], -np.ones(len(masks), dtype=np.int64))
+
+        masks, journeys, conversions = coalition_counts(store, conversion_type=self.meta['conversion_type'])
+        self._add_coalitions(masks, -journeys, -conversions)
+
+        chain = build_transition_counts(store, conversion_type=self.meta['conversion_type'],
+                                        order=self.order)
+        src, dst, counts = chain_code_counts(chain)
+        self._add_markov(src, dst, -counts)
+
+        lengths = np.diff(touches['offsets'])
+        first_times = touches['time'][touches['offsets'][:-1]]
+        totals = self.meta['totals']
+        totals['journeys'] -= int(len(lengths))
+        totals['touchpoints'] -= int(lengths.sum())
+        totals['journey_days'] -= int(((touches['conversion_time'] - first_times) // NS_PER_DAY).sum())
+        totals['revenue'] -= float(touches['value'].sum())
+        for name, value in session_funnel(store).items():
+            totals[name] -= value
+
+    # ---- reporting -----------------------------------------------------
+
+    def markov_chain(self):
+        keys, counts = self.state['markov_keys'], self.state['markov_counts']
+        src, dst = keys // self.code_width - 2, keys % self.code_width - 2
+        channels = [c for i, c in enumerate(self.channels) if i != self.conversion]
+        return chain_from_code_counts(src, dst, counts, channels, self.order)
+
+    def conversion_table(self, smoothing=SMOOTHING):
+        """Learned characteristic function over every folded journey"""
+        return conversion_table(self.state['coalition_masks'], self.state['coalition_journeys'],
+                                self.state['coalition_conversions'], len(self.channels), smoothing)
+
+    def report(self, value_function='empirical', smoothing=SMOOTHING):
+        """
+        Attribution results from the accumulators (same layout as run_sharded).
+        value_function: 'empirical' (the learned conversion table) or
+        'heuristic' (fixed channel weights) characteristic function for Shapley
+        """
+        channels = self.channels
+        totals = self.meta['totals']
+        rule_revenue = pd.DataFrame(self.state['rule_revenue'].T, index=channels,
+                                    columns=INCREMENTAL_MODELS)
+        if value_function not in ('empirical', 'heuristic'):
+            raise ValueError(f"Unknown Shapley value function '{value_function}' (use 'empirical' or 'heuristic')")
+        table = None
+        if value_function == 'empirical':
+            table = self.conversion_table(smoothing)
+            engine = ShapleyEngine(empirical_value_function(table), len(channels))
+        else:
+            engine = ShapleyEngine(heuristic_value_function(channels), len(channels))
+        shapley = engine.attribute(self.state['shapley_masks'], self.state['shapley_values'])
+        chain = self.markov_chain()
+        baseline, effects = removal_effects(chain)
+        journeys = max(totals['journeys'], 1)
+        return {
+            'rule_revenue': rule_revenue,
+            'shapley_revenue': pd.Series(shapley, index=channels),
+            'conversion_table': table,
+            'markov_chain': chain,
+            'markov_baseline': baseline,
+            'markov_effects': effects,
+            'markov_revenue': markov_revenue(effects, totals['revenue'], channels),
+            'flags': dict(self.meta['flags']),
+            'journey_stats': {
+                'events': totals['events'],
+                'users': totals['users'],
+                'journeys': totals['journeys'],
+                'avg_touchpoints': totals['touchpoints'] / journeys,
+                'avg_days': totals['journey_days'] / journeys,
+                'revenue': totals['revenue'],
+                **{name: totals[name] for name in FUNNEL_COUNTS},
+            },
+        }
+
+    def export(self, output_path, value_function='empirical', smoothing=SMOOTHING):
+        """Write a refreshed attribution-results.json from the accumulators"""
+        result = self.report(value_function, smoothing)
+        revenue = result['rule_revenue'].assign(shapley=result['shapley_revenue'],
+                                                markov=result['markov_revenue'])
+        stats = result['journey_stats']
+        payload = build_dashboard_export(
+            revenue,
+            journey_stats={'avg_touchpoints': stats['avg_touchpoints'],
+                           'avg_days': stats['avg_days'],
+                           'total_journeys_analyzed': stats['journeys'],
+                           **{name: stats[name] for name in FUNNEL_COUNTS}},
+            meta={'total_events': stats['events'],
+                  'total_users': stats['users'],
+                  'total_sessions': totals['sessions'],
+                  'analysis_sample': stats['journeys'],
+                  'bot_filtered': True,
+                  'segments': list(self.meta['segments'])})
+        return write_export(payload, output_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fold one day of events into an attribution checkpoint")
+    parser.add_argument('checkpoint', help="checkpoint directory (created if missing)")
+    parser.add_argument('events_csv', help="CSV with one day of events")
+    parser.add_argument('--label', help="segment name (defaults to the CSV file name)")
+    parser.add_argument('--output', default=os.path.join('output', 'attribution-results.json'))
+    parser.add_argument('--markov-order', type=int, default=1)
+    parser.add_argument('--touchpoint-unit', choices=TOUCHPOINT_UNITS, default='event',
+                        help="touchpoint unit; must match the checkpoint's (only 'event' can be folded)")
+    parser.add_argument('--lookback-days', type=int, default=None,
+                        help="journey lookback window; must match the checkpoint's (only none can be folded)")
+    parser.add_argument('--value-function', choices=['empirical', 'heuristic'], default='empirical',
+                        help="Shapley characteristic function: learned from the folded journeys or fixed weights")
+    parser.add_argument('--smoothing', type=float, default=SMOOTHING,
+                        help="prior weight, in journeys, of the logistic fit in the learned value function")
+    args = parser.parse_args(argv)
+
+    settings = {'markov_order': args.markov_order, 'touchpoint_unit': args.touchpoint_unit,
+                'lookback_days': args.lookback_days}
+    checkpoint = AttributionCheckpoint.open_or_create(args.checkpoint, **settings)
+    label = args.label or os.path.splitext(os.path.basename(args.events_csv))[0]
+    checkpoint.fold(args.events_csv, label, **settings)
+    print(f"Folded '{label}' into {args.checkpoint}")
+    print(f"Results exported to {checkpoint.export(args.output, args.value_function, args.smoothing)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+# Column layout of the Kaggle e-commerce event files
+EVENT_COLUMNS = ['event_time', 'event_type', 'product_id', 'category_id',
+                 'category_code', 'brand', 'price', 'user_id', 'user_session']
+
+# Known touchpoint types come first so their codes are stable across files
+EVENT_TYPES = ['view', 'cart', 'purchase']
+
+CATEGORICAL_COLUMNS = ['event_type', 'category_code', 'brand']
+
+# Dtypes handed to the CSV parser (event_time and user_session are post-processed)
+READ_DTYPES = {
+    'event_type': 'category',
+    'product_id': 'int32',
+    'category_id': 'int64',
+    'category_code': 'category',
+    'brand': 'category',
+    'price': 'float32',
+    'user_id': 'int64',
+    'user_session': 'object',
+}
+
+EVENT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S UTC'
+
+DEFAULT_MEMORY_LIMIT_MB = 4096
+
+# Rough cost of one raw CSV row while pandas is still holding Python strings
+PARSE_BYTES_PER_ROW = 600
+
+# Share of the memory ceiling a single in-flight chunk may use
+PARSE_FRACTION = 0.25
+
+
+def chunk_rows_for_limit(memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    Number of CSV rows to parse at once so a chunk stays inside the memory ceiling
+    """
+    budget = memory_limit_mb * 1024 * 1024 * PARSE_FRACTION
+    return max(10_000, int(budget // PARSE_BYTES_PER_ROW))
+
+
+# hash_sessions code of a missing session id
+MISSING_SESSION = np.iinfo(np.uint64).max
+
+
+def hash_sessions(values):
+    """
+    Dictionary-encode session ids as 64-bit hashes.
+
+    A real string dictionary for ~14M UUIDs costs gigabytes of Python objects,
+    so the "dictionary" is a stable hash: the same session string maps to the
+    same uint64 in every chunk and every run. Missing ids become MISSING_SESSION.
+    """
+    values = np.asarray(values, dtype=object)
+    codes, uniques = pd.factorize(values)
+    hashed = pd.util.hash_array(np.asarray(uniques, dtype=object))
+    out = np.full(len(values), MISSING_SESSION, dtype=np.uint64)
+    present = codes >= 0
+    out[present] = hashed[codes[present]]
+    return out
+
+
+def recode_categorical(series, categories, index):
+    """
+    Map a chunk-local categorical onto the running category list for the file
+    """
+    local = series.cat.categories
+    lookup = np.empty(len(local) + 1, dtype=np.int32)
+    lookup[-1] = -1
+    for i, value in enumerate(local):
+        if value not in index:
+            index[value] = len(categories)
+            categories.append(value)
+        lookup[i] = index[value]
+    codes = lookup[series.cat.codes.to_numpy()]
+    return pd.Categorical.from_codes(codes, categories=list(categories))
+
+
+def compact_chunk(chunk, categories=None):
+    """
+    Convert one parsed chunk to compact dtypes.
+
+    categories: dict of column -> (category list, value index) shared across
+    chunks so categorical codes line up when the chunks are concatenated.
+    """
+    if categories is None:
+        categories = {}
+    out = {}
+
+    if 'event_time' in chunk:
+        event_time = chunk['event_time']
+        if not pd.api.types.is_datetime64_any_dtype(event_time):
+            event_time = pd.to_datetime(event_time, format=EVENT_TIME_FORMAT, errors='coerce')
+        out['event_time'] = event_time.to_numpy(dtype='datetime64[ns]')
+
+    for column in chunk.columns:
+        if column == 'event_time':
+            continue
+        values = chunk[column]
+        if column in CATEGORICAL_COLUMNS:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+            if column not in categories:
+                seed = list(EVENT_TYPES) if column == 'event_type' else []
+                categories[column] = (seed, {v: i for i, v in enumerate(seed)})
+            cats, index = categories[column]
+            out[column] = recode_categorical(values, cats, index)
+        elif column == 'user_session':
+            out[column] = hash_sessions(values.to_numpy())
+        elif column == 'user_id':
+            # Always int64: a per-chunk downcast would not agree across chunks
+            # (the journey store narrows it once the whole file's range is known)
+            out[column] = values.to_numpy(dtype=np.int64)
+        elif column == 'price':
+            out[column] = values.to_numpy(dtype=np.float32)
+        else:
+            out[column] = values.to_numpy()
+
+    frame = pd.DataFrame(out, columns=[c for c in chunk.columns])
+    # Drop rows that cannot be placed on a journey
+    valid = np.ones(len(frame), dtype=bool)
+    if 'event_time' in frame:
+        valid &= frame['event_time'].notna().to_numpy()
+    if 'user_id' in frame:
+        valid &= frame['user_id'].notna().to_numpy()
+    if not valid.all():
+        frame = frame[valid].reset_index(drop=True)
+    return frame
+
+
+def iter_event_chunks(path, columns=None, chunksize=None,
+                      memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, categories=None):
+    """
+    Stream the event CSV as compact DataFrame chunks.
+
+    columns: subset of EVENT_COLUMNS to read (all columns when None)
+    chunksize: rows per chunk; derived from memory_limit_mb when None
+    """
+    if columns is None:
+        columns = list(EVENT_COLUMNS)
+    unknown = [c for c in columns if c not in EVENT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown event columns: {unknown}")
+    if chunksize is None:
+        chunksize = chunk_rows_for_limit(memory_limit_mb)
+    if categories is None:
+        categories = {}
+
+    dtypes = {c: READ_DTYPES[c] for c in columns if c in READ_DTYPES}
+    reader = pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+    for chunk in reader:
+        yield compact_chunk(chunk[columns], categories)
+
+
+def frame_nbytes(frame):
+    """
+    Bytes held by a compact frame's column buffers
+    """
+    return int(frame.memory_usage(index=False, deep=False).sum())
+
+
+def load_events(path, columns=None, chunksize=None,
+                memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    Load the event CSV chunk by chunk into a single compact DataFrame.
+
+    Raises MemoryError when the compact result would exceed what is left of
+    memory_limit_mb after reserving room for the in-flight chunk; read fewer
+    columns or use the journey store instead.
+    """
+    categories = {}
+    limit = memory_limit_mb * 1024 * 1024 * (1 - PARSE_FRACTION)
+    chunks = []
+    held = 0
+    for chunk in iter_event_chunks(path, columns, chunksize, memory_limit_mb, categories):
+        held += frame_nbytes(chunk)
+        if held > limit:
+            raise MemoryError(
+                f"Compact events exceed the {memory_limit_mb}MB ceiling after "
+                f"{sum(len(c) for c in chunks):,} rows; read fewer columns or raise memory_limit_mb"
+            )
+        chunks.append(chunk)
+
+    if not chunks:
+        return pd.DataFrame(columns=columns or EVENT_COLUMNS)
+
+    # Every chunk shares the final category lists (they only ever grow)
+    for chunk in chunks:
+        for column, (cats, _) in categories.items():
+            if column in chunk:
+                chunk[column] = chunk[column].cat.set_categories(cats)
+
+    events = pd.concat(chunks, ignore_index=True)
+    del chunks
+    return events
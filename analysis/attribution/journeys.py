@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+NS_PER_DAY = 86_400 * 1_000_000_000
+
+ATTRIBUTION_COLUMNS = ['user_id', 'purchase_value', 'first_touch_type', 'last_touch_type',
+                       'journey_length', 'journey_days']
+
+
+def tie_run_ends(user_index, event_times):
+    """
+    Exclusive end position of the (user, event_time) tie run each event belongs to.
+
+    Returns (run_starts, run_ends); an event at position p sits in run
+    searchsorted(run_starts, p, 'right') - 1.
+    """
+    n = len(event_times)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    new_run = np.empty(n, dtype=bool)
+    new_run[0] = True
+    np.not_equal(event_times[1:], event_times[:-1], out=new_run[1:])
+    new_run[1:] |= user_index[1:] != user_index[:-1]
+    run_starts = np.flatnonzero(new_run)
+    run_ends = np.append(run_starts[1:], n)
+    return run_starts, run_ends
+
+
+def segment_searchsorted(values, starts, ends, targets):
+    """
+    Per-segment np.searchsorted(values[start:end], target) + start for many
+    sorted segments at once: all segments are bisected together, so the cost
+    is log2(longest segment) vectorized steps rather than a loop over segments.
+    Returns the first position in [start, end) whose value is >= target
+    (end when there is none).
+    """
+    lo = np.array(starts, dtype=np.int64)
+    hi = np.array(ends, dtype=np.int64)
+    targets = np.asarray(targets)
+    last = max(len(values) - 1, 0)
+    active = lo < hi
+    while active.any():
+        mid = (lo + hi) // 2
+        below = values[np.minimum(mid, last)] < targets
+        lo = np.where(active & below, mid + 1, lo)
+        hi = np.where(active & ~below, mid, hi)
+        active = lo < hi
+    return lo
+
+
+def purchase_journey_bounds(store, keep_user=None, purchase_type='purchase', lookback_days=None):
+    """
+    Locate every purchase journey in the store with array operations only.
+
+    A purchase's journey is every event of that user at or before the purchase
+    timestamp. Touchpoints are store positions [touch_start, touch_end); the
+    final event of the journey (the purchase itself) is not a touchpoint.
+
+    keep_user: optional boolean mask over store users (e.g. bot filter)
+    lookback_days: optional window; touches older than this many days before
+    the purchase are dropped (found by binary search over the user's times)
+    Returns a dict of aligned int64 arrays: purchase, user, touch_start, touch_end.
+    """
+    event_types = np.asarray(store['event_type'])
+    event_times = np.asarray(store['event_time']).view(np.int64)
+    user_index = store.user_index()
+
+    purchases = np.flatnonzero(event_types == store.channels.index(purchase_type))
+    users = user_index[purchases].astype(np.int64)
+    if keep_user is not None:
+        kept = np.asarray(keep_user)[users]
+        purchases, users = purchases[kept], users[kept]
+
+    run_starts, run_ends = tie_run_ends(user_index, event_times)
+    journey_end = run_ends[np.searchsorted(run_starts, purchases, side='right') - 1]
+    journey_start = np.asarray(store.offsets)[users]
+    if lookback_days is not None:
+        cutoff = event_times[purchases] - int(lookback_days * NS_PER_DAY)
+        journey_start = segment_searchsorted(event_times, journey_start, purchases, cutoff)
+
+    # Journeys need at least one touchpoint before the purchase
+    valid = journey_end - journey_start > 1
+    return {
+        'purchase': purchases[valid],
+        'user': users[valid],
+        'touch_start': journey_start[valid],
+        'touch_end': journey_end[valid] - 1,
+    }
+
+
+def build_purchase_journeys(store, bounds=None, keep_user=None):
+    """
+    Vectorized attribution_df for every purchase by every user.
+
+    Same schema as the original per-user loop: user_id, purchase_value,
+    first_touch_type, last_touch_type, journey_length, journey_days.
+    """
+    if bounds is None:
+        bounds = purchase_journey_bounds(store, keep_user)
+
+    purchases = bounds['purchase']
+    first = bounds['touch_start']
+    last = bounds['touch_end'] - 1
+
+    event_types = store['event_type']
+    event_times = np.asarray(store['event_time']).view(np.int64)
+
+    return pd.DataFrame({
+        'user_id': np.asarray(store.users)[bounds['user']],
+        'purchase_value': np.asarray(store['price'][purchases], dtype=np.float64),
+        'first_touch_type': store.decode('event_type', event_types[first]),
+        'last_touch_type': store.decode('event_type', event_types[last]),
+        'journey_length': bounds['touch_end'] - bounds['touch_start'],
+        'journey_days': (event_times[purchases] - event_times[first]) // NS_PER_DAY,
+    }, columns=ATTRIBUTION_COLUMNS)
@@ -0,0 +1,561 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve
+except ImportError:  # scipy is optional; large chains fall back to Jacobi iteration
+    sparse = spsolve = None
+
+START = 'START'
+CONVERSION = 'CONVERSION'
+NULL = 'NULL'
+
+# Transient state counts up to this size are solved densely with np.linalg.solve
+DENSE_STATE_LIMIT = 2048
+
+# Pair codes are counted with a dense bincount while n_states**2 stays this small
+DENSE_PAIR_LIMIT = 1 << 24
+
+
+def _count_pairs(src, dst, n_states):
+    """
+    Sparse (src, dst, count) triplets from per-transition state ids, using
+    pair-encoding src * n_states + dst
+    """
+    codes = src.astype(np.int64) * n_states + dst
+    if n_states * n_states <= DENSE_PAIR_LIMIT:
+        counts = np.bincount(codes, minlength=n_states * n_states)
+        codes = np.flatnonzero(counts)
+        counts = counts[codes]
+    else:
+        codes, counts = np.unique(codes, return_counts=True)
+    return codes // n_states, codes % n_states, counts
+
+
+def pack_histories(touch_values, journey_pos, order, base):
+    """
+    Pack each touch's last `order` channels (most recent in the lowest digit)
+    into one integer; digits before the journey start are 0 (padding)
+    """
+    codes = touch_values.astype(np.int64).copy()
+    place = 1
+    for lag in range(1, order):
+        place *= base
+        lagged = np.zeros(len(codes), dtype=np.int64)
+        lagged[lag:] = touch_values[:-lag]
+        lagged[journey_pos < lag] = 0
+        codes += lagged * place
+    return codes
+
+
+def unpack_history(code, order, base):
+    """Channel indices of a packed history, oldest first (padding dropped)"""
+    digits = []
+    for _ in range(order):
+        code, digit = divmod(int(code), base)
+        if digit:
+            digits.append(digit - 1)
+    return digits[::-1]
+
+
+def build_transition_counts(store, keep_user=None, conversion_type='purchase', order=1):
+    """
+    Count state transitions across every user's journeys in one vectorized pass.
+
+    Each user's event stream is split into journeys at every conversion:
+    START -> touches -> CONVERSION, and the trailing touches after the last
+    conversion end in NULL. CONVERSION and NULL are absorbing.
+
+    order: k-th order chain (1-4). A transient state is the last k touches of
+    the journey packed into one integer in base (channels + 1); packed codes
+    are remapped to dense ids over the histories actually observed, so memory
+    grows with observed states rather than channels ** k.
+
+    Returns a chain dict with state codes and sparse src/dst/count triplets.
+    """
+    if not 1 <= order <= 4:
+        raise ValueError("Markov order must be between 1 and 4")
+
+    event_types = np.asarray(store['event_type'])
+    user_index = store.user_index()
+    if keep_user is not None:
+        kept = np.asarray(keep_user)[user_index]
+        event_types, user_index = event_types[kept], user_index[kept]
+
+    conversion_code = store.channels.index(conversion_type)
+    channels = [c for c in store.channels if c != conversion_type]
+    base = len(channels) + 1
+
+    # Event type code -> channel digit (1..K); conversions get 0
+    digit_of = np.zeros(len(store.channels), dtype=np.int64)
+    for code, name in enumerate(store.channels):
+        if code != conversion_code:
+            digit_of[code] = 1 + channels.index(name)
+    digits = digit_of[event_types]
+    converts = event_types == conversion_code
+
+    n = len(digits)
+    first = np.ones(n, dtype=bool)
+    last = np.ones(n, dtype=bool)
+    if n:
+        first[1:] = user_index[1:] != user_index[:-1]
+        last[:-1] = first[1:]
+
+    # A journey opens at a user's first event or right after a conversion
+    opens = first.copy()
+    opens[1:] |= converts[:-1]
+    open_pos = np.maximum.accumulate(np.where(opens, np.arange(n), 0)) if n else np.zeros(0, dtype=np.int64)
+    journey_pos = np.arange(n) - open_pos
+
+    histories = pack_histories(digits, journey_pos, order, base)
+
+    # Dense ids for observed histories; START is state 0
+    state_codes, history_ids = np.unique(histories[~converts], return_inverse=True)
+    n_transient = 1 + len(state_codes)
+    conversion, null = n_transient, n_transient + 1
+    states = np.empty(n, dtype=np.int64)
+    states[~converts] = 1 + history_ids
+    states[converts] = conversion
+
+    # Every event is entered from the previous state, or from START when it opens a journey
+    prev = np.zeros(n, dtype=np.int64)
+    if n:
+        prev[1:] = states[:-1]
+    prev[opens] = 0
+
+    # Streams that do not end in a conversion exit to NULL
+    open_end = last & ~converts
+    src = np.concatenate([prev, states[open_end]])
+    dst = np.concatenate([states, np.full(int(open_end.sum()), null)])
+
+    n_states = n_transient + 2
+    src, dst, counts = _count_pairs(src, dst, n_states)
+    return {
+        'order': order,
+        'base': base,
+        'channels': channels,
+        'state_codes': state_codes,
+        'n_transient': n_transient,
+        'n_states': n_states,
+        'src': src,
+        'dst': dst,
+        'count': counts,
+    }
+
+
+def markov_journeys(store, keep_user=None, conversion_type='purchase'):
+    """
+    Every user's event stream split at conversions into flat touch arrays
+    (the journeys build_transition_counts walks).
+
+    channel holds indices into the non-conversion channels; converted marks
+    journeys that end in a conversion (the rest are unconverted tails) and
+    end_time is the time of each journey's last event.
+    Journeys can be empty: a conversion straight after another one.
+    """
+    event_types = np.asarray(store['event_type'])
+    event_times = np.asarray(store['event_time']).view(np.int64)
+    user_index = store.user_index()
+    if keep_user is not None:
+        kept = np.asarray(keep_user)[user_index]
+        event_types, event_times, user_index = event_types[kept], event_times[kept], user_index[kept]
+
+    conversion_code = store.channels.index(conversion_type)
+    channels = [c for c in store.channels if c != conversion_type]
+    channel_of = np.zeros(len(store.channels), dtype=np.int64)
+    for code, name in enumerate(store.channels):
+        if code != conversion_code:
+            channel_of[code] = channels.index(name)
+    converts = event_types == conversion_code
+
+    n = len(event_types)
+    opens = np.ones(n, dtype=bool)
+    if n:
+        opens[1:] = (user_index[1:] != user_index[:-1]) | converts[:-1]
+    journey_of = np.cumsum(opens) - 1
+    n_journeys = int(opens.sum())
+
+    converted = np.zeros(n_journeys, dtype=bool)
+    converted[journey_of[converts]] = True
+    touch = ~converts
+    journey = journey_of[touch]
+    offsets = np.zeros(n_journeys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(journey, minlength=n_journeys), out=offsets[1:])
+    return {
+        'channel': channel_of[event_types[touch]],
+        'journey': journey.astype(np.int32),
+        'offsets': offsets,
+        'converted': converted,
+        'end_time': event_times[np.append(np.flatnonzero(opens)[1:], n)[:n_journeys] - 1],
+        'channels': channels,
+    }
+
+
+def path_transition_incidence(paths, order=1):
+    """
+    Which transitions every path takes: returns the chain dict of
+    path_transition_counts plus two aligned arrays, transition (index into
+    the chain's src/dst/count) and path, with one entry per step of every
+    path. Weighting the entries by any per-path count vector and summing per
+    transition gives that weighting's transition counts.
+    """
+    if not 1 <= order <= 4:
+        raise ValueError("Markov order must be between 1 and 4")
+
+    channels = list(paths['channels'])
+    base = len(channels) + 1
+    offsets = paths['offsets']
+    lengths = np.diff(offsets)
+    n_paths = len(lengths)
+    weights = np.asarray(paths.get('count', np.ones(n_paths, dtype=np.int64)))
+    journey = np.repeat(np.arange(n_paths), lengths)
+    journey_pos = np.arange(offsets[-1]) - offsets[:-1][journey]
+
+    histories = pack_histories(paths['channel'] + 1, journey_pos, order, base)
+    state_codes, history_ids = np.unique(histories, return_inverse=True)
+    n_transient = 1 + len(state_codes)
+    n_states = n_transient + 2
+    states = 1 + history_ids.astype(np.int64)
+
+    prev = np.zeros(len(states), dtype=np.int64)
+    if len(states):
+        prev[1:] = states[:-1]
+    prev[journey_pos == 0] = 0
+
+    # Every path exits from its last state (START when empty) to CONVERSION or NULL
+    exit_src = np.zeros(n_paths, dtype=np.int64)
+    exit_src[lengths > 0] = states[offsets[1:][lengths > 0] - 1]
+    exit_dst = np.where(paths['converted'], n_transient, n_transient + 1)
+
+    codes = np.concatenate([prev * n_states + states, exit_src * n_states + exit_dst])
+    entry_path = np.concatenate([journey, np.arange(n_paths)])
+    codes, inverse = np.unique(codes, return_inverse=True)
+    counts = np.bincount(inverse, weights=weights[entry_path], minlength=len(codes)).astype(np.int64)
+    chain = {
+        'order': order,
+        'base': base,
+        'channels': channels,
+        'state_codes': state_codes,
+        'n_transient': n_transient,
+        'n_states': n_states,
+        'src': codes // n_states,
+        'dst': codes % n_states,
+        'count': counts,
+    }
+    return chain, inverse.ravel(), entry_path
+
+
+def path_transition_counts(paths, order=1):
+    """
+    Chain dict from markov_journeys output, raw or compressed with
+    compress_paths(..., by='converted'): each path's transitions are counted
+    once and weighted by how many journeys follow it. Identical to
+    build_transition_counts over the same journeys.
+    """
+    return path_transition_incidence(paths, order)[0]
+
+
+def merge_chains(chains):
+    """
+    Sum transition counts from chains built over disjoint sets of users.
+
+    State ids are remapped onto the union of observed history codes, so the
+    result is identical to building one chain over all of those users.
+    """
+    first = chains[0]
+    state_codes = np.unique(np.concatenate([c['state_codes'] for c in chains]))
+    n_transient = 1 + len(state_codes)
+    n_states = n_transient + 2
+
+    src, dst, counts = [], [], []
+    for chain in chains:
+        # Old state id -> merged state id (START stays 0, absorbing states move to the end)
+        remap = np.concatenate([[0], 1 + np.searchsorted(state_codes, chain['state_codes']),
+                                [n_transient, n_transient + 1]])
+        src.append(remap[chain['src']])
+        dst.append(remap[chain['dst']])
+        counts.append(chain['count'])
+
+    codes = np.concatenate(src) * n_states + np.concatenate(dst)
+    codes, inverse = np.unique(codes, return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+    return {
+        'order': first['order'],
+        'base': first['base'],
+        'channels': first['channels'],
+        'state_codes': state_codes,
+        'n_transient': n_transient,
+        'n_states': n_states,
+        'src': codes // n_states,
+        'dst': codes % n_states,
+        'count': totals,
+    }
+
+
+# Absorbing states in packed-code space (histories are always positive)
+CONVERSION_CODE = -1
+NULL_CODE = -2
+
+
+def chain_code_counts(chain):
+    """
+    Transition triplets keyed by packed history codes instead of dense state
+    ids (START = 0, CONVERSION = -1, NULL = -2), so counts from different runs
+    can be added without agreeing on state ids
+    """
+    codes = np.concatenate([[0], chain['state_codes'], [CONVERSION_CODE, NULL_CODE]])
+    return codes[chain['src']], codes[chain['dst']], chain['count']
+
+
+def chain_from_code_counts(src_codes, dst_codes, counts, channels, order):
+    """
+    Inverse of chain_code_counts: build a chain dict from packed-code triplets,
+    dropping transitions whose count is zero
+    """
+    src_codes, dst_codes, counts = (np.asarray(a, dtype=np.int64) for a in (src_codes, dst_codes, counts))
+    live = counts != 0
+    src_codes, dst_codes, counts = src_codes[live], dst_codes[live], counts[live]
+
+    all_codes = np.concatenate([src_codes, dst_codes])
+    state_codes = np.unique(all_codes[all_codes > 0])
+    n_transient = 1 + len(state_codes)
+    n_states = n_transient + 2
+
+    def ids(codes):
+        out = 1 + np.searchsorted(state_codes, codes)
+        out[codes == 0] = 0
+        out[codes == CONVERSION_CODE] = n_transient
+        out[codes == NULL_CODE] = n_transient + 1
+        return out
+
+    pair = ids(src_codes) * n_states + ids(dst_codes)
+    pair, inverse = np.unique(pair, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts).astype(np.int64)
+    return {
+        'order': order,
+        'base': len(channels) + 1,
+        'channels': list(channels),
+        'state_codes': state_codes,
+        'n_transient': n_transient,
+        'n_states': n_states,
+        'src': pair // n_states,
+        'dst': pair % n_states,
+        'count': totals,
+    }
+
+
+def state_labels(chain):
+    """
+    Readable label per state, e.g. 'view>cart' for a second-order history
+    """
+    channels = chain['channels']
+    labels = [START]
+    for code in chain['state_codes']:
+        labels.append('>'.join(channels[c] for c in unpack_history(code, chain['order'], chain['base'])))
+    return labels + [CONVERSION, NULL]
+
+
+def state_channel_matrix(chain):
+    """
+    Boolean (n_transient, channels) matrix: does the state's history contain the channel
+    """
+    codes = chain['state_codes'].astype(np.int64)
+    contains = np.zeros((chain['n_transient'], len(chain['channels'])), dtype=bool)
+    for _ in range(chain['order']):
+        codes, digit = np.divmod(codes, chain['base'])
+        present = digit > 0
+        contains[1 + np.flatnonzero(present), digit[present] - 1] = True
+    return contains
+
+
+def transition_probabilities(chain):
+    """
+    Row-normalized transition probabilities aligned with chain['src'] / chain['dst']
+    """
+    out_totals = np.bincount(chain['src'], weights=chain['count'], minlength=chain['n_states'])
+    return chain['count'] / out_totals[chain['src']]
+
+
+def transition_matrix(chain):
+    """
+    Dense probability matrix as a labelled DataFrame (for display)
+    """
+    n = chain['n_states']
+    matrix = np.zeros((n, n))
+    matrix[chain['src'], chain['dst']] = transition_probabilities(chain)
+    labels = state_labels(chain)
+    return pd.DataFrame(matrix, index=labels, columns=labels)
+
+
+def _removal_masks(chain, removed_channels):
+    """
+    Boolean (scenarios, n_transient) masks of the transient states each
+    removal scenario deletes; scenario 0 is the baseline (nothing removed).
+    Removing a channel deletes every history state that contains it.
+    """
+    contains = state_channel_matrix(chain)
+    masks = np.zeros((len(removed_channels) + 1, chain['n_transient']), dtype=bool)
+    for i, channel in enumerate(removed_channels, start=1):
+        masks[i] = contains[:, chain['channels'].index(channel)]
+    return masks
+
+
+def _sparse_solve(n_transient, q_src, q_dst, q_prob, r, keep):
+    """x per scenario from one sparse LU factorization each (scipy)"""
+    eye = sparse.identity(n_transient, format='csc')
+    x = np.empty((len(keep), n_transient))
+    for k, kept in enumerate(keep):
+        q = sparse.csc_matrix((q_prob * kept[q_dst], (q_src, q_dst)), shape=(n_transient, n_transient))
+        x[k] = spsolve(eye - q, r)
+    return x
+
+
+def _jacobi_solve(n_transient, q_src, q_dst, q_prob, r, keep, tol, max_iter):
+    """
+    (x, iterations, residual): Jacobi iteration on the sparse triplets for
+    every scenario together, one bincount per sweep over the pair code
+    scenario * n_transient + src. Self-loops are moved to the diagonal,
+    x_i = (r_i + sum_j!=i q_ij x_j) / (1 - q_ii), so states that mostly
+    repeat themselves (view -> view) do not stall convergence.
+    """
+    n_scenarios = len(keep)
+    loop = q_src == q_dst
+    diagonal = np.bincount(q_src[loop], weights=q_prob[loop], minlength=n_transient) * keep
+    scale = np.where(diagonal < 1, 1 - diagonal, 1.0)
+    src, dst, prob = q_src[~loop], q_dst[~loop], q_prob[~loop]
+    codes = (np.arange(n_scenarios)[:, None] * n_transient + src).ravel()
+    weights = prob * keep[:, dst]
+    cells = n_scenarios * n_transient
+
+    def step(x):
+        flow = np.bincount(codes, weights=(weights * x[:, dst]).ravel(), minlength=cells)
+        return flow.reshape(n_scenarios, n_transient) + r
+
+    x = np.zeros((n_scenarios, n_transient))
+    iterations = 0
+    while iterations < max_iter:
+        iterations += 1
+        x_new = step(x) / scale
+        delta = np.abs(x_new - x).max(initial=0.0)
+        x = x_new
+        if delta < tol:
+            break
+    residual = np.abs(step(x) - scale * x).max(initial=0.0)
+    return x, iterations, residual
+
+
+def conversion_probabilities(chain, removed_masks, tol=1e-12, max_iter=100_000, info=None):
+    """
+    Exact probability of absorbing in CONVERSION from START, one value per
+    removal scenario.
+
+    Transitions into removed states are redirected to NULL. With T transient
+    states, each scenario solves (I - Q) x = r where Q is the transient block
+    and r the one-step conversion probabilities; small chains are solved
+    densely in one batched np.linalg.solve, large ones with scipy's sparse LU
+    when scipy is installed, else by Jacobi iteration over the transition
+    triplets (all scenarios at once), warning if it has not reached tol after
+    max_iter sweeps. A dict passed as info receives the method used, the
+    iteration count and the max residual |r + Q x - x|.
+    """
+    n_transient = chain['n_transient']
+    src, dst = chain['src'], chain['dst']
+    prob = transition_probabilities(chain)
+
+    to_conversion = dst == n_transient
+    r = np.bincount(src[to_conversion], weights=prob[to_conversion], minlength=n_transient)
+    transient = dst < n_transient
+    q_src, q_dst, q_prob = src[transient], dst[transient], prob[transient]
+    keep = ~removed_masks
+    info = {} if info is None else info
+
+    if n_transient <= DENSE_STATE_LIMIT:
+        q = np.zeros((n_transient, n_transient))
+        np.add.at(q, (q_src, q_dst), q_prob)
+        a = np.eye(n_transient) - q[None, :, :] * keep[:, None, :]
+        b = np.broadcast_to(r, (len(keep), n_transient))[..., None]
+        try:
+            x = np.linalg.solve(a, b)[..., 0]
+        except np.linalg.LinAlgError:
+            x = np.stack([np.linalg.lstsq(a_i, r, rcond=None)[0] for a_i in a])
+        info.update(method='dense', iterations=0, residual=0.0)
+        return x[:, 0]
+
+    if spsolve is not None:
+        x = _sparse_solve(n_transient, q_src, q_dst, q_prob, r, keep)
+        info.update(method='sparse_lu', iterations=0, residual=0.0)
+        return x[:, 0]
+
+    x, iterations, residual = _jacobi_solve(n_transient, q_src, q_dst, q_prob, r, keep, tol, max_iter)
+    info.update(method='jacobi', iterations=iterations, residual=float(residual))
+    if residual >= tol:
+        warnings.warn(f"Markov chain solve did not converge: residual {residual:.3g} after "
+                      f"{iterations} Jacobi iterations (tol {tol:g})", RuntimeWarning)
+    return x[:, 0]
+
+
+def removal_effects(chain, channels=None):
+    """
+    Baseline conversion probability and each channel's removal effect,
+    computed in one batched solve
+    """
+    channels = list(chain['channels'] if channels is None else channels)
+    probs = conversion_probabilities(chain, _removal_masks(chain, channels))
+    baseline = probs[0]
+    effects = pd.DataFrame({
+        'conversion_without': probs[1:],
+        'removal_effect': baseline - probs[1:],
+    }, index=channels)
+    return baseline, effects
+
+
+def markov_revenue(effects, total_revenue, all_channels=None):
+    """
+    Split total_revenue in proportion to the positive removal effects
+    """
+    positive = effects['removal_effect'].clip(lower=0)
+    shares = positive / positive.sum() if positive.sum() > 0 else positive * 0
+    revenue = shares * total_revenue
+    if all_channels is not None:
+        revenue = revenue.reindex(all_channels, fill_value=0.0)
+    return revenue
+
+
+def chain_nbytes(chain):
+    """
+    Bytes held by the chain's state codes and transition triplets
+    """
+    return int(sum(chain[k].nbytes for k in ('state_codes', 'src', 'dst', 'count')))
+
+
+def order_report(store, orders=(1, 2, 3, 4), keep_user=None, conversion_type='purchase'):
+    """
+    State counts, memory and results per Markov order, to pick the highest
+    order a node can afford
+    """
+    rows = []
+    for order in orders:
+        chain = build_transition_counts(store, keep_user, conversion_type, order)
+        n_transient = chain['n_transient']
+        scenarios = len(chain['channels']) + 1
+        if n_transient <= DENSE_STATE_LIMIT:
+            solve_bytes = scenarios * n_transient * n_transient * 8
+        else:
+            solve_bytes = scenarios * (len(chain['src']) + 2 * n_transient) * 8
+        baseline, effects = removal_effects(chain)
+        row = {
+            'order': order,
+            'states': n_transient,
+            'possible_states': sum(len(chain['channels']) ** k for k in range(1, order + 1)) + 1,
+            'transitions': len(chain['src']),
+            'chain_bytes': chain_nbytes(chain),
+            'solve_bytes': solve_bytes,
+            'baseline_conversion': baseline,
+        }
+        for channel, effect in effects['removal_effect'].items():
+            row[f'removal_{channel}'] = effect
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('order')
@@ -0,0 +1,218 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; fall back to /proc or getrusage
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Seconds between RSS samples while a stage runs
+RSS_SAMPLE_INTERVAL = 0.01
+
+# Functions kept per stage from a cProfile run, by cumulative time
+PROFILE_TOP_FUNCTIONS = 15
+
+
+def current_rss():
+    """Resident set size of this process in bytes (None when it cannot be read)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # Lifetime peak, the closest thing getrusage offers (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+    return None
+
+
+def cpu_time():
+    """
+    CPU seconds of this process plus its terminated child processes (e.g. a
+    finished process pool's workers), so sharded stages count their workers
+    """
+    seconds = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        seconds += children.ru_utime + children.ru_stime
+    return seconds
+
+
+class RssSampler:
+    """
+    Tracks the peak RSS while a block runs by sampling from a background thread
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start = current_rss()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+@contextmanager
+def measure(record):
+    """
+    Fill record with wall_s, rss_start and peak_rss for the enclosed block
+    (also when it raises)
+    """
+    started = time.perf_counter()
+    sampler = RssSampler()
+    try:
+        with sampler:
+            yield record
+    finally:
+        record['wall_s'] = time.perf_counter() - started
+        record['rss_start'] = sampler.start
+        record['peak_rss'] = sampler.peak
+
+
+def _builtin(value):
+    """numpy scalars -> Python scalars, recursively, so records serialize to JSON"""
+    if isinstance(value, dict):
+        return {k: _builtin(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_builtin(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _profile_top(profiler, limit=PROFILE_TOP_FUNCTIONS):
+    """Top functions of a cProfile run by cumulative time"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({'function': f'{os.path.basename(filename)}:{line}({name})', 'calls': calls,
+                     'own_s': own, 'cumulative_s': cumulative})
+    rows.sort(key=lambda r: -r['cumulative_s'])
+    return rows[:limit]
+
+
+class RunMetrics:
+    """
+    Per-stage instrumentation for one pipeline run.
+
+    Every stage records wall and CPU time (including worker processes that
+    finish inside it), peak RSS and, when the stage sets them, rows_in,
+    rows_out and cache hits. profile=True runs each stage under cProfile (top
+    functions kept, .prof files written to profile_dir when given);
+    trace_memory=True adds tracemalloc's Python-heap peak per stage.
+    Both cost noticeable time, so they are off by default.
+    """
+
+    def __init__(self, profile=False, trace_memory=False, profile_dir=None):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.totals = {}
+        self._started = time.perf_counter()
+        self._cpu_started = cpu_time()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Measure the enclosed block; yields the stage record so the caller can
+        set rows_out, cache_hits and cache_misses
+        """
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None,
+                  'cache_hits': None, 'cache_misses': None}
+        self.stages.append(record)
+        profiler = cProfile.Profile() if self.profile else None
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        cpu_started = cpu_time()
+        try:
+            with measure(record):
+                if profiler:
+                    profiler.enable()
+                try:
+                    yield record
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            record['cpu_s'] = cpu_time() - cpu_started
+            self._finish(record, profiler)
+
+    def _finish(self, record, profiler):
+        """Attach the tracemalloc peak and profile of a finished stage"""
+        if self.trace_memory:
+            record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        if profiler:
+            record['profile'] = _profile_top(profiler)
+            if self.profile_dir:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{record['stage']}.prof"))
+
+    def summary(self):
+        """run_metrics section: stages, run totals and the slowest stage"""
+        timed = [s for s in self.stages if 'wall_s' in s]
+        peaks = [s['peak_rss'] for s in timed if s.get('peak_rss') is not None]
+        return {
+            'wall_s': time.perf_counter() - self._started,
+            'cpu_s': cpu_time() - self._cpu_started,
+            'peak_rss': max(peaks) if peaks else None,
+            'hot_stage': max(timed, key=lambda s: s['wall_s'])['stage'] if timed else None,
+            'totals': _builtin(self.totals),
+            'stages': _builtin(self.stages),
+        }
+
+    def report(self):
+        """Stage table for printing"""
+        columns = ['stage', 'wall_s', 'cpu_s', 'peak_rss', 'rows_in', 'rows_out', 'cache_hits']
+        return pd.DataFrame([{c: s.get(c) for c in columns} for s in self.stages], columns=columns)
+
+    def write(self, path):
+        """Write the summary to a sidecar JSON file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        return path
@@ -0,0 +1,210 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .bots import (BOT_LABELS, SESSION_BITMAP_BITS, flag_counts, flag_users, human_user_mask,
+                   sessions_per_user)
+from .conversion import SMOOTHING, coalition_counts, conversion_table, empirical_value_function
+from .journeys import NS_PER_DAY, purchase_journey_bounds
+from .markov import build_transition_counts, markov_revenue, merge_chains, removal_effects
+from .rules import RULE_MODELS, flatten_touchpoints, touch_credit
+from .sessions import INACTIVITY_TIMEOUT_MINUTES, touchpoint_store
+from .shapley import ShapleyEngine, heuristic_value_function, journey_masks
+from .store import JourneyStore
+
+# Fibonacci hashing spreads sequential user ids evenly over shards
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# Shards per worker, so a slow shard does not leave the other cores idle
+SHARDS_PER_WORKER = 4
+
+# Shards of a pipeline run: enough for SHARDS_PER_WORKER on a 16-core machine,
+# and fixed so the shard-order float sums do not change with the worker count
+DEFAULT_SHARDS = 64
+
+
+def user_shards(user_ids, n_shards):
+    """
+    Shard id of every user id (stable across runs and machines)
+    """
+    hashed = np.asarray(user_ids).astype(np.uint64) * HASH_MULTIPLIER
+    return ((hashed >> np.uint64(32)) % np.uint64(n_shards)).astype(np.int64)
+
+
+class StoreShard(JourneyStore):
+    """
+    A JourneyStore restricted to a subset of its users.
+
+    Columns are gathered from the parent's memory maps on first access, so a
+    worker only pages in its own users' events. Every stage that accepts a
+    store accepts a shard.
+    """
+
+    def __init__(self, store, user_positions):
+        user_positions = np.asarray(user_positions, dtype=np.int64)
+        parent_offsets = np.asarray(store.offsets)
+        starts = parent_offsets[user_positions]
+        lengths = parent_offsets[user_positions + 1] - starts
+
+        self.path = store.path
+        self.categories = store.categories
+        self.users = np.asarray(store.users)[user_positions]
+        self.offsets = np.zeros(len(user_positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.meta = dict(store.meta, n_events=int(self.offsets[-1]), n_users=len(user_positions))
+        self._parent = store
+        self._positions = np.repeat(starts - self.offsets[:-1], lengths) + np.arange(self.offsets[-1])
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self._parent.column(name)[self._positions]
+        return self._columns[name]
+
+
+def process_shard(store_path, shard, n_shards, markov_order=1, models=None, lookback_days=None,
+                  touchpoint_unit='event', timeout_minutes=INACTIVITY_TIMEOUT_MINUTES,
+                  approximate_sessions=False, bitmap_bits=SESSION_BITMAP_BITS):
+    """
+    Map step: bot filtering, journey building and every model's mergeable
+    partial sums for the users hashed to one shard (with touchpoint_unit
+    'session', journeys are built over the shard's sessions;
+    approximate_sessions counts the bot filter's sessions with bitmaps)
+    """
+    store = JourneyStore(store_path)
+    positions = np.flatnonzero(user_shards(store.users, n_shards) == shard)
+    view = StoreShard(store, positions)
+    models = models or list(RULE_MODELS)
+    n_channels = len(view.channels)
+
+    user_flags = flag_users(sessions_per_user(view, approximate=approximate_sessions, bitmap_bits=bitmap_bits))
+    keep_user = human_user_mask(user_flags)
+    n_events = len(view)
+    view = touchpoint_store(view, touchpoint_unit, timeout_minutes)
+
+    bounds = purchase_journey_bounds(view, keep_user=keep_user, lookback_days=lookback_days)
+    touches = flatten_touchpoints(view, bounds)
+    lengths = np.diff(touches['offsets'])
+    first_times = touches['time'][touches['offsets'][:-1]]
+    journey_days = (touches['conversion_time'] - first_times) // NS_PER_DAY
+
+    masks, mask_inverse = np.unique(journey_masks(touches), return_inverse=True)
+    coalitions, coalition_journeys, coalition_conversions = coalition_counts(view, keep_user)
+
+    return {
+        'shard': shard,
+        'events': n_events,
+        'users': view.n_users,
+        'flags': flag_counts(user_flags),
+        'journeys': len(lengths),
+        'touchpoints': int(lengths.sum()),
+        'journey_days': int(journey_days.sum()),
+        'revenue': float(touches['value'].sum()),
+        'rule_revenue': {
+            model: np.bincount(touches['channel'], weights=touch_credit(touches, model),
+                               minlength=n_channels)
+            for model in models
+        },
+        'shapley_masks': masks,
+        'shapley_values': np.bincount(mask_inverse, weights=touches['value'], minlength=len(masks)),
+        'coalition_masks': coalitions,
+        'coalition_journeys': coalition_journeys,
+        'coalition_conversions': coalition_conversions,
+        'markov': build_transition_counts(view, keep_user, order=markov_order),
+    }
+
+
+def merge_shard_results(results):
+    """
+    Reduce step: combine shard partials in shard order (so the float sums are
+    deterministic regardless of which worker finished first)
+    """
+    results = sorted(results, key=lambda r: r['shard'])
+    merged = {key: sum(r[key] for r in results)
+              for key in ('events', 'users', 'journeys', 'touchpoints', 'journey_days', 'revenue')}
+    merged['flags'] = {label: sum(r['flags'][label] for r in results) for label in BOT_LABELS}
+    merged['rule_revenue'] = {
+        model: np.sum([r['rule_revenue'][model] for r in results], axis=0)
+        for model in results[0]['rule_revenue']
+    }
+
+    masks, inverse = np.unique(np.concatenate([r['shapley_masks'] for r in results]),
+                               return_inverse=True)
+    values = np.concatenate([r['shapley_values'] for r in results])
+    merged['shapley_masks'] = masks
+    merged['shapley_values'] = np.bincount(inverse, weights=values, minlength=len(masks))
+
+    # Coalition conversion counts are additive, so the learned table sees every shard
+    coalitions, inverse = np.unique(np.concatenate([r['coalition_masks'] for r in results]),
+                                    return_inverse=True)
+    inverse = inverse.ravel()
+    merged['coalition_masks'] = coalitions
+    for key in ('coalition_journeys', 'coalition_conversions'):
+        merged[key] = np.bincount(inverse, weights=np.concatenate([r[key] for r in results]),
+                                  minlength=len(coalitions)).astype(np.int64)
+
+    merged['markov'] = merge_chains([r['markov'] for r in results])
+    return merged
+
+
+def run_sharded(store_path, workers=None, n_shards=None, markov_order=1, models=None, lookback_days=None,
+                value_function='empirical', smoothing=SMOOTHING, touchpoint_unit='event',
+                timeout_minutes=INACTIVITY_TIMEOUT_MINUTES, approximate_sessions=False,
+                bitmap_bits=SESSION_BITMAP_BITS, engine_params=None):
+    """
+    Hash-partition users into shards and run the map step in a process pool.
+
+    workers=1 runs every shard in this process. Returns rule-based revenue
+    (channel x model), Shapley and Markov revenue, bot flag counts and journey
+    statistics computed from the merged accumulators. value_function
+    'empirical' learns Shapley's conversion table from the merged coalition
+    counts; 'heuristic' keeps the hand-picked channel weights. engine_params
+    (max_exact, tolerance, ...) go to the ShapleyEngine.
+    """
+    workers = workers or os.cpu_count() or 1
+    n_shards = n_shards or workers * SHARDS_PER_WORKER
+    args = [(store_path, shard, n_shards, markov_order, models, lookback_days, touchpoint_unit, timeout_minutes,
+             approximate_sessions, bitmap_bits)
+            for shard in range(n_shards)]
+
+    if workers == 1:
+        results = [process_shard(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(process_shard, *zip(*args)))
+    merged = merge_shard_results(results)
+
+    channels = JourneyStore(store_path).channels
+    table = None
+    if value_function == 'empirical':
+        table = conversion_table(merged['coalition_masks'], merged['coalition_journeys'],
+                                 merged['coalition_conversions'], len(channels), smoothing)
+        engine = ShapleyEngine(empirical_value_function(table), len(channels), **(engine_params or {}))
+    else:
+        engine = ShapleyEngine(heuristic_value_function(channels), len(channels), **(engine_params or {}))
+    shapley = engine.attribute(merged['shapley_masks'], merged['shapley_values'])
+    baseline, effects = removal_effects(merged['markov'])
+
+    journeys = max(merged['journeys'], 1)
+    return {
+        'rule_revenue': pd.DataFrame(merged['rule_revenue'], index=channels),
+        'shapley_revenue': pd.Series(shapley, index=channels),
+        'conversion_table': table,
+        'markov_chain': merged['markov'],
+        'markov_baseline': baseline,
+        'markov_effects': effects,
+        'markov_revenue': markov_revenue(effects, merged['revenue'], channels),
+        'flags': merged['flags'],
+        'journey_stats': {
+            'events': merged['events'],
+            'users': merged['users'],
+            'journeys': merged['journeys'],
+            'avg_touchpoints': merged['touchpoints'] / journeys,
+            'avg_days': merged['journey_days'] / journeys,
+            'revenue': merged['revenue'],
+        },
+        'shards': n_shards,
+        'workers': workers,
+    }
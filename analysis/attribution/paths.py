@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+# Two independent polynomial hashes (mod 2**64) key each path; groups are
+# verified element-wise afterwards, so a collision raises instead of merging paths
+_HASH_BASES = (np.uint64(0x100000001B3), np.uint64(0x9E3779B97F4A7C15))
+
+
+def _positions(offsets):
+    lengths = np.diff(offsets)
+    return np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths), lengths
+
+
+def _path_hashes(values, offsets):
+    """Per-journey polynomial hashes of the touch sequence (one array per base)"""
+    positions, lengths = _positions(offsets)
+    symbols = values.astype(np.uint64) + np.uint64(1)
+    longest = int(lengths.max()) if len(lengths) else 0
+    hashes = []
+    for base in _HASH_BASES:
+        powers = np.ones(max(longest, 1), dtype=np.uint64)
+        if longest > 1:
+            np.cumprod(np.full(longest - 1, base, dtype=np.uint64), out=powers[1:])
+        terms = symbols * powers[positions]
+        # reduceat needs in-range starts, so empty journeys (hash 0) are left out
+        h = np.zeros(len(lengths), dtype=np.uint64)
+        nonempty = lengths > 0
+        if nonempty.any():
+            h[nonempty] = np.add.reduceat(terms, offsets[:-1][nonempty])
+        hashes.append(h)
+    return hashes
+
+
+def collapse_repeats(journeys):
+    """
+    Run-length collapse: consecutive repeats of a channel inside a journey
+    become one touch (view, view, cart -> view, cart). Changes what the
+    position-dependent models credit, so it is opt-in.
+    """
+    offsets = journeys['offsets']
+    channel = journeys['channel']
+    positions, _ = _positions(offsets)
+    keep = np.ones(len(channel), dtype=bool)
+    keep[1:] = channel[1:] != channel[:-1]
+    keep |= positions == 0
+
+    journey = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[keep]
+    collapsed = dict(journeys)
+    collapsed['channel'] = channel[keep]
+    collapsed['journey'] = journey.astype(np.int32)
+    collapsed['offsets'] = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(np.bincount(journey, minlength=len(offsets) - 1), out=collapsed['offsets'][1:])
+    if 'time' in journeys:
+        collapsed['time'] = journeys['time'][keep]
+    return collapsed
+
+
+def compress_paths(journeys, collapse_runs=False, by=None):
+    """
+    Canonicalize journeys into distinct touchpoint paths.
+
+    journeys: flat touch dict (channel, offsets, value, channels), e.g. from
+    flatten_touchpoints or markov_journeys. by: names of per-journey arrays
+    that are part of the path key (e.g. 'converted').
+
+    Returns the same layout with one entry per distinct path, so every model
+    that reads channel/offsets/journey/value runs on it unchanged: value is
+    the paths' total revenue, count the number of journeys on each path, and
+    path_of_journey maps the input journeys onto paths. Touch times are not
+    part of the key and are dropped.
+    """
+    by = [by] if isinstance(by, str) else list(by or [])
+    source = collapse_repeats(journeys) if collapse_runs else journeys
+    offsets = source['offsets']
+    channel = source['channel']
+    lengths = np.diff(offsets)
+    n_journeys = len(lengths)
+
+    h1, h2 = _path_hashes(channel, offsets)
+    keys = [np.asarray(source[name]) for name in reversed(by)] + [h2, h1, lengths]
+    order = np.lexsort(keys)
+    sorted_keys = [k[order] for k in keys]
+    new_path = np.ones(n_journeys, dtype=bool)
+    if n_journeys:
+        new_path[1:] = np.any([k[1:] != k[:-1] for k in sorted_keys], axis=0)
+    path_ids = np.cumsum(new_path) - 1
+    path_of_journey = np.empty(n_journeys, dtype=np.int64)
+    path_of_journey[order] = path_ids
+    representative = order[new_path]
+
+    # Every journey must match its path's representative touch for touch
+    positions, _ = _positions(offsets)
+    journey = np.repeat(np.arange(n_journeys), lengths)
+    rep_start = offsets[representative][path_of_journey[journey]]
+    if not np.array_equal(channel[rep_start + positions], channel):
+        raise RuntimeError("Path hash collision; journeys could not be grouped exactly")
+
+    rep_lengths = lengths[representative]
+    path_offsets = np.zeros(len(representative) + 1, dtype=np.int64)
+    np.cumsum(rep_lengths, out=path_offsets[1:])
+    gather = np.repeat(offsets[representative] - path_offsets[:-1], rep_lengths) + np.arange(path_offsets[-1])
+
+    n_paths = len(representative)
+    counts = np.asarray(source.get('count', np.ones(n_journeys, dtype=np.int64)))
+    paths = {
+        'channel': channel[gather],
+        'journey': np.repeat(np.arange(n_paths, dtype=np.int32), rep_lengths),
+        'offsets': path_offsets,
+        'count': np.bincount(path_of_journey, weights=counts, minlength=n_paths).astype(np.int64),
+        'channels': source['channels'],
+        'path_of_journey': path_of_journey,
+        'n_journeys': n_journeys,
+        'n_touches': int(journeys['offsets'][-1]),
+    }
+    if 'value' in source:
+        paths['value'] = np.bincount(path_of_journey, weights=source['value'], minlength=n_paths)
+    for name in by:
+        paths[name] = np.asarray(source[name])[representative]
+    return paths
+
+
+def compression_report(paths):
+    """Journey and touch counts before and after compression"""
+    n_paths = len(paths['offsets']) - 1
+    path_touches = int(paths['offsets'][-1])
+    return {
+        'journeys': paths['n_journeys'],
+        'paths': n_paths,
+        'touches': paths['n_touches'],
+        'path_touches': path_touches,
+        'ratio': paths['n_journeys'] / max(n_paths, 1),
+        'touch_ratio': paths['n_touches'] / max(path_touches, 1),
+    }
+
+
+def path_table(paths, separator=' > '):
+    """
+    (path, count, revenue) table of the distinct paths, most frequent first
+    """
+    names = np.asarray(paths['channels'], dtype=object)
+    labels = [separator.join(names[seq]) for seq in np.split(paths['channel'], paths['offsets'][1:-1])]
+    table = pd.DataFrame({'path': labels, 'count': paths['count']})
+    if 'value' in paths:
+        table['revenue'] = paths['value']
+    return table.sort_values('count', ascending=False, kind='stable').reset_index(drop=True)
@@ -0,0 +1,611 @@
+import argparse
+import copy
+import hashlib
+import json
+import os
+import pickle
+import time
+
+from .bootstrap import CONFIDENCE_LEVEL, bootstrap_intervals
+from .conversion import SMOOTHING, empirical_value_function, learn_conversion_table
+from .cube import PRICE_BAND_EDGES, TOP_BRANDS, attribution_cube, write_cube_arrays
+from .bots import (SESSION_BITMAP_BITS, bot_filter_report, bot_user_ids, flag_counts, flag_users,
+                   human_user_mask, session_funnel, sessions_per_user)
+from .export import build_dashboard_export, write_export
+from .journeys import build_purchase_journeys, purchase_journey_bounds
+from .markov import (markov_journeys, markov_revenue, order_report, path_transition_counts,
+                     removal_effects)
+from .metrics import RunMetrics
+from .parallel import DEFAULT_SHARDS, run_sharded
+from .paths import compress_paths, compression_report
+from .rules import RULE_MODELS, flatten_touchpoints, run_rule_models
+from .scenarios import (ALLOCATION_STEP, BASELINE_REVENUE, CURRENT_ALLOCATION, MAX_SHARE, MIN_SHARE,
+                        SPEND_ELASTICITY, TOTAL_BUDGET, budget_scenarios)
+from .sessions import INACTIVITY_TIMEOUT_MINUTES, touchpoint_store
+from .shapley import MAX_EXACT_PLAYERS, ShapleyEngine, heuristic_value_function, shapley_revenue
+from .trends import LOOKBACK_WINDOWS, ROLLING_WINDOW_DAYS, lookback_comparison, rolling_attribution
+from .store import PRODUCT_COLUMNS, STORE_COLUMNS, ensure_store, source_signature, store_is_current
+
+# Bump when a stage's output format or semantics change, so old entries miss
+CACHE_VERSION = 4
+
+CACHE_FILE_SUFFIX = '.pkl'
+
+STAGES = ['ingest', 'clean', 'sessions', 'journeys', 'sharded', 'rule_models', 'shapley', 'markov', 'bootstrap', 'trends',
+          'cube', 'scenarios', 'export']
+
+# Stages whose output already lives on disk elsewhere, or is cheap to rebuild
+UNCACHED_STAGES = {'ingest', 'sessions', 'export'}
+
+DEFAULT_PARAMS = {
+    'ingest': {'memory_limit_mb': 4096},
+    # approximate_sessions counts distinct sessions with per-user bitmaps of
+    # bitmap_bits bits (bounded memory, ~7% error) instead of exactly
+    'clean': {'approximate_sessions': False, 'bitmap_bits': SESSION_BITMAP_BITS},
+    # Touchpoint unit of every model: raw events, or sessions (split on
+    # user_session and on gaps over timeout_minutes) labelled by dominant action
+    'sessions': {'touchpoint_unit': 'event', 'timeout_minutes': INACTIVITY_TIMEOUT_MINUTES},
+    'journeys': {'collapse_runs': False, 'lookback_days': None},
+    # shards is fixed apart from workers, so the merged float sums (and the
+    # cache key) do not depend on how many processes ran them
+    'sharded': {'workers': 1, 'shards': DEFAULT_SHARDS},
+    'rule_models': {'models': list(RULE_MODELS)},
+    # value_function 'empirical' learns conversion rates per touchpoint set from
+    # every journey; 'heuristic' keeps the hand-picked channel weights
+    'shapley': {'value_function': 'empirical', 'smoothing': SMOOTHING, 'max_exact': MAX_EXACT_PLAYERS,
+                'max_permutations': 100_000, 'seed': 0},
+    # report_orders (e.g. [1, 2, 3, 4]) adds a serial per-order chain size sweep
+    'markov': {'order': 1, 'report_orders': None},
+    # Poisson-bootstrap intervals on every model's channel shares (0 = off)
+    'bootstrap': {'replicates': 0, 'confidence': CONFIDENCE_LEVEL, 'seed': 0},
+    # Model shares per lookback window, and the rolling daily series. Trends
+    # and the cube need the serial journeys' per-journey arrays, so
+    # enabled=None runs them only when the run is not sharded; True forces
+    # them (adding a serial journey pass to sharded runs), False skips them
+    'trends': {'enabled': None, 'lookback_windows': list(LOOKBACK_WINDOWS), 'rolling_days': ROLLING_WINDOW_DAYS},
+    'cube': {'enabled': None, 'top_brands': TOP_BRANDS, 'price_edges': list(PRICE_BAND_EDGES)},
+    # Response curves and optimal budget splits from every model's channel credit
+    'scenarios': {'total_budget': TOTAL_BUDGET, 'current_allocation': dict(CURRENT_ALLOCATION),
+                  'baseline_revenue': BASELINE_REVENUE, 'elasticity': SPEND_ELASTICITY,
+                  'min_share': MIN_SHARE, 'max_share': MAX_SHARE, 'step': ALLOCATION_STEP},
+    'export': {'output': os.path.join('output', 'attribution-results.json'),
+               'cube_output': os.path.join('output', 'attribution-cube.json')},
+}
+
+
+class StageCache:
+    """
+    Pickled stage outputs on disk, one file per (stage, key).
+
+    A hit refreshes the file's mtime, so eviction drops the least recently
+    used entries first once the cache exceeds max_bytes, and drops anything
+    unused for longer than max_age_days.
+    """
+
+    def __init__(self, path, max_bytes=None, max_age_days=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, stage, key):
+        return os.path.join(self.path, f'{stage}-{key}{CACHE_FILE_SUFFIX}')
+
+    def contains(self, stage, key):
+        return os.path.exists(self._file(stage, key))
+
+    def get(self, stage, key):
+        """(True, value) on a hit, (False, None) on a miss"""
+        path = self._file(stage, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        os.utime(path)
+        return True, value
+
+    def put(self, stage, key, value):
+        path = self._file(stage, key)
+        partial = path + '.partial'
+        with open(partial, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, path)
+        self.evict()
+
+    def entries(self):
+        """(path, bytes, last used) for every entry, least recently used first"""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(CACHE_FILE_SUFFIX):
+                stat = os.stat(os.path.join(self.path, name))
+                entries.append((os.path.join(self.path, name), stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes=None, max_age_days=None):
+        """
+        Drop entries older than max_age_days, then least recently used entries
+        until the cache fits max_bytes. Returns (entries removed, bytes freed).
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age_days = self.max_age_days if max_age_days is None else max_age_days
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - max_age_days * 86_400 if max_age_days is not None else None
+
+        removed, freed = 0, 0
+        for path, size, used in entries:
+            expired = cutoff is not None and used < cutoff
+            oversized = max_bytes is not None and total > max_bytes
+            if not (expired or oversized):
+                continue
+            os.remove(path)
+            total -= size
+            removed, freed = removed + 1, freed + size
+        return removed, freed
+
+    def clear(self):
+        return self.evict(max_bytes=0)
+
+
+def merge_params(overrides=None):
+    """DEFAULT_PARAMS with per-stage overrides ({'markov': {'order': 2}}) applied"""
+    params = copy.deepcopy(DEFAULT_PARAMS)
+    for stage, values in (overrides or {}).items():
+        if stage not in params:
+            raise KeyError(f"Unknown stage '{stage}'")
+        params[stage].update(values)
+    return params
+
+
+# ---- stages --------------------------------------------------------------
+# Each stage takes the pipeline (for the ingest location) and its inputs by
+# stage name, plus its own parameters, and returns a picklable result.
+
+# The pipeline's store also keeps the product columns the cube groups by
+PIPELINE_COLUMNS = STORE_COLUMNS + PRODUCT_COLUMNS
+
+
+def _ingest(pipeline, inputs, memory_limit_mb):
+    return ensure_store(pipeline.csv_path, pipeline.store_dir, columns=PIPELINE_COLUMNS,
+                        memory_limit_mb=memory_limit_mb)
+
+
+def _clean(pipeline, inputs, approximate_sessions, bitmap_bits):
+    store = inputs['ingest']
+    session_counts = sessions_per_user(store, approximate=approximate_sessions, bitmap_bits=bitmap_bits)
+    user_flags = flag_users(session_counts)
+    row_bytes = sum(store[name].dtype.itemsize for name in store.column_names)
+    keep_user = human_user_mask(user_flags)
+    return {
+        'keep_user': keep_user,
+        'bot_users': bot_user_ids(user_flags, store.users),
+        'funnel': session_funnel(store, keep_user),
+        'flags': flag_counts(user_flags),
+        'sessions': int(session_counts.sum()),
+        'report': bot_filter_report(user_flags, len(store), row_bytes),
+    }
+
+
+def _sessions(pipeline, inputs, touchpoint_unit, timeout_minutes):
+    return touchpoint_store(inputs['ingest'], touchpoint_unit, timeout_minutes)
+
+
+def _journeys(pipeline, inputs, collapse_runs, lookback_days):
+    store, keep_user = inputs['sessions'], inputs['clean']['keep_user']
+    bounds = purchase_journey_bounds(store, keep_user=keep_user, lookback_days=lookback_days)
+    touches = flatten_touchpoints(store, bounds)
+    paths = compress_paths(touches, collapse_runs=collapse_runs)
+    return {
+        'bounds': bounds,
+        'attribution_df': build_purchase_journeys(store, bounds),
+        'touches': touches,
+        'paths': paths,
+        'path_stats': compression_report(paths),
+    }
+
+
+def _sharded(pipeline, inputs, workers, shards):
+    return run_sharded(inputs['ingest'].path, workers=workers, n_shards=shards,
+                       markov_order=pipeline.params['markov']['order'],
+                       models=pipeline.params['rule_models']['models'],
+                       lookback_days=pipeline.params['journeys']['lookback_days'],
+                       value_function=pipeline.params['shapley']['value_function'],
+                       smoothing=pipeline.params['shapley']['smoothing'],
+                       touchpoint_unit=pipeline.params['sessions']['touchpoint_unit'],
+                       timeout_minutes=pipeline.params['sessions']['timeout_minutes'],
+                       approximate_sessions=pipeline.params['clean']['approximate_sessions'],
+                       bitmap_bits=pipeline.params['clean']['bitmap_bits'],
+                       engine_params=_engine_params(pipeline))
+
+
+def _rule_models(pipeline, inputs, models):
+    if 'sharded' in inputs:
+        return inputs['sharded']['rule_revenue'][models]
+    journeys = inputs['journeys']
+    return run_rule_models(journeys['touches'], models=models, paths=journeys['paths'])
+
+
+def _engine_params(pipeline):
+    """ShapleyEngine keyword arguments from the shapley stage parameters"""
+    return {key: value for key, value in pipeline.params['shapley'].items()
+            if key not in ('value_function', 'smoothing')}
+
+
+def _shapley_engine(pipeline, channels, table):
+    """ShapleyEngine over the learned conversion table, or the heuristic weights when table is None"""
+    value_fn = empirical_value_function(table) if table is not None else heuristic_value_function(channels)
+    return ShapleyEngine(value_fn, len(channels), **_engine_params(pipeline))
+
+
+def _shapley(pipeline, inputs, value_function, smoothing, **engine_params):
+    if value_function not in ('empirical', 'heuristic'):
+        raise ValueError(f"Unknown Shapley value function '{value_function}' (use 'empirical' or 'heuristic')")
+    if 'sharded' in inputs:
+        sharded = inputs['sharded']
+        return {'revenue': sharded['shapley_revenue'], 'stats': None, 'table': sharded['conversion_table']}
+    table = None
+    if value_function == 'empirical':
+        table = learn_conversion_table(inputs['sessions'], inputs['clean']['keep_user'], smoothing)
+        engine_params['value_fn'] = empirical_value_function(table)
+    revenue, engine = shapley_revenue(inputs['journeys']['paths'], **engine_params)
+    return {'revenue': revenue, 'stats': dict(engine.stats), 'table': table}
+
+
+def _markov(pipeline, inputs, order, report_orders):
+    if 'sharded' in inputs:
+        sharded = inputs['sharded']
+        chain, baseline, effects = sharded['markov_chain'], sharded['markov_baseline'], sharded['markov_effects']
+        total_revenue = sharded['journey_stats']['revenue']
+        channels = list(sharded['rule_revenue'].index)
+    else:
+        store, keep_user = inputs['sessions'], inputs['clean']['keep_user']
+        paths = compress_paths(markov_journeys(store, keep_user=keep_user), by='converted')
+        chain = path_transition_counts(paths, order=order)
+        baseline, effects = removal_effects(chain)
+        total_revenue = inputs['journeys']['attribution_df']['purchase_value'].sum()
+        channels = store.channels
+    orders = None
+    if report_orders:
+        orders = order_report(inputs['sessions'], report_orders, keep_user=inputs['clean']['keep_user'])
+    return {
+        'chain': chain,
+        'baseline': baseline,
+        'effects': effects,
+        'revenue': markov_revenue(effects, total_revenue, channels),
+        'orders': orders,
+    }
+
+
+def _bootstrap(pipeline, inputs, replicates, confidence, seed):
+    store, keep_user = inputs['sessions'], inputs['clean']['keep_user']
+    engine = _shapley_engine(pipeline, store.channels, inputs['shapley']['table'])
+    return bootstrap_intervals(
+        inputs['journeys']['touches'],
+        markov_paths=compress_paths(markov_journeys(store, keep_user=keep_user), by='converted'),
+        markov_order=pipeline.params['markov']['order'],
+        models=pipeline.params['rule_models']['models'],
+        engine=engine,
+        n_replicates=replicates,
+        confidence=confidence,
+        seed=seed,
+    )
+
+
+def _trends(pipeline, inputs, enabled, lookback_windows, rolling_days):
+    if not pipeline.enabled('trends'):
+        return None
+    store, keep_user = inputs['sessions'], inputs['clean']['keep_user']
+    engine = _shapley_engine(pipeline, store.channels, inputs['shapley']['table'])
+    models = pipeline.params['rule_models']['models']
+    touches = inputs['journeys']['touches']
+    return {
+        'lookback_windows': lookback_comparison(store, lookback_windows, keep_user, models, engine),
+        'attribution_trends': rolling_attribution(store, touches, keep_user, models, engine,
+                                                  markov_order=pipeline.params['markov']['order'],
+                                                  window=rolling_days),
+    }
+
+
+def _cube(pipeline, inputs, enabled, top_brands, price_edges):
+    if not pipeline.enabled('cube'):
+        return None
+    store, journeys = inputs['sessions'], inputs['journeys']
+    engine = _shapley_engine(pipeline, store.channels, inputs['shapley']['table'])
+    return attribution_cube(store, journeys['bounds'], journeys['touches'],
+                            models=pipeline.params['rule_models']['models'], engine=engine,
+                            markov_effects=inputs['markov']['effects'],
+                            top_brands=top_brands, price_edges=price_edges)
+
+
+def _model_revenue(inputs):
+    """Channel x model revenue of the rule-based models, Shapley and Markov"""
+    return inputs['rule_models'].assign(shapley=inputs['shapley']['revenue'],
+                                        markov=inputs['markov']['revenue']).fillna(0)
+
+
+def _scenarios(pipeline, inputs, **scenario_params):
+    return budget_scenarios(_model_revenue(inputs), **scenario_params)
+
+
+def _export(pipeline, inputs, output, cube_output):
+    store, clean = inputs['ingest'], inputs['clean']
+    pipeline.metrics.totals.update(events=len(store), users=store.n_users, sessions=clean['sessions'])
+    if 'sharded' in inputs:
+        # Journey statistics come from the merged shard sums, not a serial journey pass
+        stats = inputs['sharded']['journey_stats']
+        journey_stats = {'avg_touchpoints': stats['avg_touchpoints'], 'avg_days': stats['avg_days'],
+                         'total_journeys_analyzed': stats['journeys']}
+    else:
+        attribution_df = inputs['journeys']['attribution_df']
+        journey_stats = {
+            'avg_touchpoints': attribution_df['journey_length'].mean(),
+            'avg_days': attribution_df['journey_days'].mean(),
+            'total_journeys_analyzed': len(attribution_df),
+        }
+    journey_stats.update(clean['funnel'])
+    payload = build_dashboard_export(
+        _model_revenue(inputs),
+        journey_stats=journey_stats,
+        meta={
+            'total_events': len(store),
+            'total_users': store.n_users,
+            'total_sessions': clean['sessions'],
+            'analysis_sample': journey_stats['total_journeys_analyzed'],
+            'bot_filtered': True,
+            'touchpoint_unit': pipeline.params['sessions']['touchpoint_unit'],
+        },
+        run_metrics=pipeline.metrics.summary(),
+        intervals=inputs.get('bootstrap'),
+        trends=inputs.get('trends'),
+        scenarios=inputs['scenarios'],
+    )
+    if output:
+        write_export(payload, output)
+    if cube_output and inputs.get('cube') is not None:
+        write_export(inputs['cube'], cube_output)
+        write_cube_arrays(inputs['cube'], os.path.splitext(cube_output)[0])
+    return payload
+
+
+# Rows each stage hands downstream, for run metrics
+STAGE_ROWS = {
+    'ingest': len,
+    'clean': lambda clean: int(clean['keep_user'].sum()),
+    'sessions': len,
+    'journeys': lambda journeys: len(journeys['attribution_df']),
+    'sharded': lambda sharded: sharded['journey_stats']['journeys'],
+    'rule_models': lambda revenue: revenue.size,
+    'shapley': lambda shapley: len(shapley['revenue']),
+    'markov': lambda markov: len(markov['chain']['count']),
+    'bootstrap': lambda intervals: intervals['replicates'],
+    'trends': lambda trends: len(trends['attribution_trends']['dates']) if trends else 0,
+    'cube': lambda cube: len(cube['cells']['revenue']) if cube else 0,
+    'scenarios': lambda scenarios: len(scenarios['allocations'][scenarios['channels'][0]]),
+    'export': lambda payload: len(payload['attribution_models']),
+}
+
+STAGE_FUNCTIONS = {
+    'ingest': _ingest,
+    'clean': _clean,
+    'sessions': _sessions,
+    'journeys': _journeys,
+    'sharded': _sharded,
+    'rule_models': _rule_models,
+    'shapley': _shapley,
+    'markov': _markov,
+    'bootstrap': _bootstrap,
+    'trends': _trends,
+    'cube': _cube,
+    'scenarios': _scenarios,
+    'export': _export,
+}
+
+
+class AttributionPipeline:
+    """
+    The attribution analysis as cached stages:
+    ingest -> clean -> sessions -> journeys -> rule_models / shapley / markov / bootstrap / trends / cube / scenarios -> export.
+
+    Every stage's cache key hashes its name, its parameters and its inputs'
+    keys (the ingest key hashes the CSV's path, size and mtime), so changing
+    one parameter only recomputes that stage and the stages downstream of it.
+    A stage that hits the cache never loads its inputs.
+    """
+
+    def __init__(self, csv_path, store_dir, cache_dir, params=None, max_cache_bytes=None,
+                 max_cache_age_days=None, metrics=None):
+        self.csv_path = csv_path
+        self.store_dir = store_dir
+        self.params = merge_params(params)
+        self.cache = StageCache(cache_dir, max_cache_bytes, max_cache_age_days)
+        self.metrics = metrics or RunMetrics()
+        self._results = {}
+        self._keys = {}
+
+    def dependencies(self, stage):
+        """
+        Input stages of stage. When workers > 1 the model stages and the export
+        read the sharded run instead of the serial journeys; only bootstrap,
+        and trends and the cube when forced on, still need the journeys'
+        per-journey arrays. Disabled trends and cube stages have no inputs.
+        """
+        sharded = self.sharded()
+        if stage in ('trends', 'cube') and not self.enabled(stage):
+            return []
+        if sharded and stage in ('rule_models', 'shapley'):
+            return ['sharded']
+        if sharded and stage == 'markov':
+            return ['sharded'] + (['sessions', 'clean'] if self.params['markov']['report_orders'] else [])
+        return {
+            'ingest': [],
+            'clean': ['ingest'],
+            'sessions': ['ingest'],
+            'journeys': ['sessions', 'clean'],
+            'sharded': ['ingest'],
+            'rule_models': ['journeys'],
+            'shapley': ['sessions', 'clean', 'journeys'],
+            'markov': ['sessions', 'clean', 'journeys'],
+            'bootstrap': ['sessions', 'clean', 'journeys', 'shapley'],
+            'trends': ['sessions', 'clean', 'journeys', 'shapley'],
+            'cube': ['sessions', 'journeys', 'shapley', 'markov'],
+            'scenarios': ['rule_models', 'shapley', 'markov'],
+            'export': ['ingest', 'clean', 'sharded' if sharded else 'journeys', 'rule_models', 'shapley', 'markov',
+                       'scenarios'] + [name for name in ('trends', 'cube') if self.enabled(name)] + (
+                ['bootstrap'] if self.params['bootstrap']['replicates'] > 0 else []),
+        }[stage]
+
+    def sharded(self):
+        """Whether the model stages read the process-pool run"""
+        return self.params['sharded']['workers'] > 1
+
+    def enabled(self, stage):
+        """Whether trends / cube run: their enabled param, or None = only in serial runs"""
+        enabled = self.params[stage]['enabled']
+        return not self.sharded() if enabled is None else bool(enabled)
+
+    def key(self, stage):
+        if stage not in self._keys:
+            params = dict(self.params[stage])
+            if stage == 'ingest':
+                params['source'] = source_signature(self.csv_path)
+                params['store_dir'] = os.path.abspath(self.store_dir)
+            if stage == 'sharded':
+                # Worker count only schedules the shards; the output is the same
+                del params['workers']
+                params.update(markov_order=self.params['markov']['order'],
+                              models=self.params['rule_models']['models'],
+                              lookback_days=self.params['journeys']['lookback_days'],
+                              shapley=self.params['shapley'], sessions=self.params['sessions'],
+                              clean=self.params['clean'])
+            if stage in ('bootstrap', 'trends', 'cube'):
+                params.update(markov_order=self.params['markov']['order'],
+                              models=self.params['rule_models']['models'], shapley=self.params['shapley'])
+            payload = json.dumps({
+                'version': CACHE_VERSION,
+                'stage': stage,
+                'params': params,
+                'inputs': {dep: self.key(dep) for dep in self.dependencies(stage)},
+            }, sort_keys=True, default=str)
+            self._keys[stage] = hashlib.sha256(payload.encode()).hexdigest()[:20]
+        return self._keys[stage]
+
+    def run(self, stage):
+        """Output of stage, from memory, the disk cache or by computing it"""
+        if stage in self._results:
+            return self._results[stage]
+        if stage not in STAGE_FUNCTIONS:
+            raise KeyError(f"Unknown stage '{stage}'")
+
+        cacheable = stage not in UNCACHED_STAGES
+        if cacheable and self.cache.contains(stage, self.key(stage)):
+            with self.metrics.stage(stage) as record:
+                hit, value = self.cache.get(stage, self.key(stage))
+                record.update(cache_hits=int(hit), cache_misses=int(not hit))
+                if hit:
+                    record['rows_out'] = STAGE_ROWS[stage](value)
+            if hit:
+                self._results[stage] = value
+                return value
+
+        inputs = {dep: self.run(dep) for dep in self.dependencies(stage)}
+        with self.metrics.stage(stage) as record:
+            if stage == 'ingest':
+                hit = store_is_current(self.store_dir, self.csv_path, PIPELINE_COLUMNS)
+                record.update(cache_hits=int(hit), cache_misses=int(not hit))
+            elif cacheable:
+                record.update(cache_hits=0, cache_misses=1)
+            value = STAGE_FUNCTIONS[stage](self, inputs, **self.params[stage])
+            record['rows_out'] = STAGE_ROWS[stage](value)
+        if cacheable:
+            self.cache.put(stage, self.key(stage), value)
+        self._results[stage] = value
+        return value
+
+    def invalidate(self, stage):
+        """Forget in-memory results and keys of stage and everything downstream"""
+        downstream = {stage}
+        for name in STAGES:
+            if any(dep in downstream for dep in self.dependencies(name)):
+                downstream.add(name)
+        for name in downstream:
+            self._results.pop(name, None)
+            self._keys.pop(name, None)
+
+    def set_params(self, stage, **values):
+        """
+        Change a stage's parameters; only it and its downstream stages
+        recompute, plus any stage whose inputs the change rewires (e.g.
+        switching between one and several workers)
+        """
+        before = {name: self.dependencies(name) for name in STAGES}
+        self.params[stage].update(values)
+        self.invalidate(stage)
+        for name in STAGES:
+            if self.dependencies(name) != before[name]:
+                self.invalidate(name)
+        if stage in ('markov', 'rule_models', 'journeys', 'shapley', 'sessions', 'clean'):
+            self.invalidate('sharded')
+        if stage in ('markov', 'rule_models', 'shapley'):
+            self.invalidate('bootstrap')
+            self.invalidate('trends')
+            self.invalidate('cube')
+
+
+def _parse_assignment(text):
+    """'markov.order=2' -> ('markov', 'order', 2)"""
+    name, _, raw = text.partition('=')
+    stage, _, param = name.partition('.')
+    if not param or not raw:
+        raise argparse.ArgumentTypeError(f"Expected stage.param=value, got '{text}'")
+    try:
+        value = json.loads(raw)
+    except json.JSONDecodeError:
+        value = raw
+    return stage, param, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run attribution stages with an on-disk stage cache")
+    parser.add_argument('csv', help="event CSV")
+    parser.add_argument('--store-dir', default=os.path.join('data', 'journey-store'))
+    parser.add_argument('--cache-dir', default=os.path.join('data', 'stage-cache'))
+    parser.add_argument('--stage', default='export', choices=STAGES, help="stage to produce (default: export)")
+    parser.add_argument('--set', action='append', default=[], type=_parse_assignment, metavar='STAGE.PARAM=VALUE',
+                        help="override a stage parameter, e.g. markov.order=2")
+    parser.add_argument('--output', help="export path (export stage)")
+    parser.add_argument('--max-cache-mb', type=float, help="evict least recently used entries above this size")
+    parser.add_argument('--max-cache-age-days', type=float, help="evict entries unused for this long")
+    parser.add_argument('--clear-cache', action='store_true', help="drop every cached stage first")
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for stage, param, value in args.set:
+        overrides.setdefault(stage, {})[param] = value
+    if args.output:
+        overrides.setdefault('export', {})['output'] = args.output
+
+    max_bytes = int(args.max_cache_mb * 2**20) if args.max_cache_mb is not None else None
+    pipeline = AttributionPipeline(args.csv, args.store_dir, args.cache_dir, overrides,
+                                   max_cache_bytes=max_bytes, max_cache_age_days=args.max_cache_age_days)
+    if args.clear_cache:
+        removed, freed = pipeline.cache.clear()
+        print(f"Cleared {removed} cached stages ({freed / 2**20:,.1f} MB)")
+    pipeline.cache.evict()
+
+    pipeline.run(args.stage)
+    report = pipeline.metrics.report()
+    print(report.to_string(index=False, float_format='%.3f'))
+    if args.stage == 'export' and pipeline.params['export']['output']:
+        print(f"Results exported to {pipeline.params['export']['output']}")
+    if args.stage == 'export' and pipeline.params['export']['cube_output']:
+        print(f"Attribution cube written to {pipeline.params['export']['cube_output']}")
+    print(f"Stage cache: {pipeline.cache.nbytes / 2**20:,.1f} MB in {args.cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
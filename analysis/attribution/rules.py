@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+from .journeys import NS_PER_DAY
+
+# Default time-decay half-life and position-based (U-shaped) end shares
+HALF_LIFE_DAYS = 7.0
+FIRST_SHARE = 0.4
+LAST_SHARE = 0.4
+
+
+def flatten_touchpoints(store, bounds):
+    """
+    Gather every journey's touchpoints into flat arrays plus journey offsets.
+
+    Journey j owns touches offsets[j]:offsets[j + 1]. Returns a dict with
+    channel (event_type codes), time (int64 ns), journey (journey id per touch),
+    offsets, value (revenue per journey), conversion_time and channel names.
+    """
+    starts = bounds['touch_start']
+    lengths = bounds['touch_end'] - starts
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # Position of every touch in the store: journey start + rank inside journey
+    positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+    event_times = np.asarray(store['event_time']).view(np.int64)
+    return {
+        'channel': np.asarray(store['event_type'])[positions],
+        'time': event_times[positions],
+        'journey': np.repeat(np.arange(len(lengths), dtype=np.int32), lengths),
+        'offsets': offsets,
+        'value': np.asarray(store['price'][bounds['purchase']], dtype=np.float64),
+        'conversion_time': event_times[bounds['purchase']],
+        'channels': store.channels,
+    }
+
+
+def _segment_sum(values, offsets):
+    return np.add.reduceat(values, offsets[:-1]) if len(values) else np.zeros(len(offsets) - 1)
+
+
+def first_touch_weights(touches):
+    weights = np.zeros(len(touches['channel']))
+    weights[touches['offsets'][:-1]] = 1.0
+    return weights
+
+
+def last_touch_weights(touches):
+    weights = np.zeros(len(touches['channel']))
+    weights[touches['offsets'][1:] - 1] = 1.0
+    return weights
+
+
+def linear_weights(touches):
+    lengths = np.diff(touches['offsets'])
+    return np.repeat(1.0 / lengths, lengths)
+
+
+def time_decay_weights(touches, half_life_days=HALF_LIFE_DAYS):
+    """
+    Exponential decay: a touch half_life_days older than the journey's latest
+    touch gets half its weight
+    """
+    offsets = touches['offsets']
+    latest = touches['time'][offsets[1:] - 1]
+    age_days = (latest[touches['journey']] - touches['time']) / NS_PER_DAY
+    raw = np.exp2(-age_days / half_life_days)
+    return raw / _segment_sum(raw, offsets)[touches['journey']]
+
+
+def position_based_weights(touches, first_share=FIRST_SHARE, last_share=LAST_SHARE):
+    """
+    U-shaped weighting: first_share to the first touch, last_share to the last
+    touch and the remainder spread evenly over the touches in between
+    """
+    offsets = touches['offsets']
+    lengths = np.diff(offsets)
+    middle_share = 1.0 - first_share - last_share
+
+    # Default every touch to its even share of the middle credit
+    per_middle = np.where(lengths > 2, middle_share / np.maximum(lengths - 2, 1), 0.0)
+    weights = per_middle[touches['journey']]
+
+    firsts, lasts = offsets[:-1], offsets[1:] - 1
+    # Two-touch journeys split the middle share between the ends
+    end_share = np.where(lengths > 2, 0.0, middle_share / 2)
+    weights[firsts] = first_share + end_share
+    weights[lasts] = last_share + end_share
+    # A single touch takes all the credit
+    single = lengths == 1
+    weights[firsts[single]] = 1.0
+    return weights
+
+
+# Adding a rule-based model means adding a per-touch weight function here
+RULE_MODELS = {
+    'first_touch': first_touch_weights,
+    'last_touch': last_touch_weights,
+    'linear': linear_weights,
+    'time_decay': time_decay_weights,
+    'position_based': position_based_weights,
+}
+
+
+def touch_credit(touches, model, **params):
+    """
+    Revenue credited to every touch in every journey under a rule-based model
+    """
+    weights = RULE_MODELS[model](touches, **params)
+    return weights * touches['value'][touches['journey']]
+
+
+def rule_based_revenue(touches, model, **params):
+    """
+    Revenue per channel (indexed by channel name) for one rule-based model
+    """
+    credit = touch_credit(touches, model, **params)
+    channels = touches['channels']
+    revenue = np.bincount(touches['channel'], weights=credit, minlength=len(channels))
+    return pd.Series(revenue, index=channels)
+
+
+# Models whose weights depend on touch times, not only on the touch sequence
+TIMED_MODELS = {'time_decay'}
+
+
+def run_rule_models(touches, models=None, paths=None):
+    """
+    Channel x model revenue table for the requested rule-based models.
+
+    paths: compress_paths output for the same journeys; models that only
+    depend on the touch sequence then run once per distinct path.
+    """
+    models = models or list(RULE_MODELS)
+    return pd.DataFrame({
+        model: rule_based_revenue(touches if paths is None or model in TIMED_MODELS else paths, model)
+        for model in models
+    })
@@ -0,0 +1,242 @@
+import numpy as np
+
+from .export import channel_shares
+
+# Annual marketing budget and its current split, as on the dashboard
+# (view = brand awareness, cart = cart optimization)
+TOTAL_BUDGET = 5_000_000
+CURRENT_ALLOCATION = {'view': 3_000_000, 'cart': 2_000_000}
+
+# Annual revenue at the current allocation; each model credits its channels'
+# share of it to their spend, the rest (e.g. purchase) is held fixed
+BASELINE_REVENUE = 50_000_000
+
+# d log(revenue) / d log(spend) of every channel at its current spend: how
+# much of the channel's credit the next dollar still buys (1 = linear, no saturation)
+SPEND_ELASTICITY = 0.35
+
+# Each channel's share of the budget stays within SHARE_SPREAD of an even
+# split: 30-70% for the two dashboard channels (the slider range), 15-35%
+# for four. MIN_SHARE / MAX_SHARE = None derive the bounds this way.
+SHARE_SPREAD = 0.4
+MIN_SHARE = None
+MAX_SHARE = None
+
+# Points per exported response curve
+CURVE_POINTS = 101
+
+# Allocation grid step in USD (the dashboard slider step); None picks an even
+# fraction of the budget that puts on the order of ALLOCATION_POINTS splits on the grid
+ALLOCATION_STEP = 50_000
+ALLOCATION_POINTS = 20_000
+
+# Allocations evaluated per batch ((block, models, channels) float64s in memory)
+SCENARIO_BLOCK = 16_384
+
+_BISECTION_STEPS = 100
+
+
+def share_bounds(n_channels, min_share=MIN_SHARE, max_share=MAX_SHARE):
+    """
+    (min_share, max_share) of every channel for n_channels; None derives a
+    bound from SHARE_SPREAD. Raises ValueError when no split of the budget
+    satisfies the bounds.
+    """
+    if min_share is None:
+        min_share = (1 - SHARE_SPREAD) / n_channels
+    if max_share is None:
+        max_share = min((1 + SHARE_SPREAD) / n_channels, 1.0)
+    if not 0 <= min_share <= max_share <= 1 or n_channels * min_share > 1 + 1e-9 or \
+            n_channels * max_share < 1 - 1e-9:
+        raise ValueError(f"Share bounds {min_share:g}-{max_share:g} admit no split of the budget "
+                         f"over {n_channels} channels")
+    return min_share, max_share
+
+
+def saturation_ratio(elasticity):
+    """
+    x = spend / saturation at which the curve a * (1 - exp(-s / k)) has the
+    given spend elasticity, x / (exp(x) - 1), solved by vectorized bisection
+    """
+    elasticity = np.asarray(elasticity, dtype=np.float64)
+    if ((elasticity <= 0) | (elasticity >= 1)).any():
+        raise ValueError("Spend elasticity must be between 0 and 1 (exclusive)")
+    lo, hi = np.zeros_like(elasticity), np.full_like(elasticity, 50.0)
+    for _ in range(_BISECTION_STEPS):
+        mid = (lo + hi) / 2
+        too_elastic = mid / np.expm1(mid) > elasticity
+        lo, hi = np.where(too_elastic, mid, lo), np.where(too_elastic, hi, mid)
+    return (lo + hi) / 2
+
+
+def fit_response_curves(revenue, current_allocation=None, baseline_revenue=BASELINE_REVENUE,
+                        elasticity=SPEND_ELASTICITY):
+    """
+    Diminishing-returns curve revenue_c(s) = scale * (1 - exp(-s / saturation))
+    for every model and budget channel.
+
+    revenue: channel x model revenue. Each curve passes through (current spend,
+    the model's share of baseline_revenue for the channel) with the given
+    spend elasticity there, so models that credit a channel more also earn
+    more from each extra dollar of its spend. Channels without spend keep
+    their share as fixed base revenue.
+    """
+    current_allocation = dict(current_allocation or CURRENT_ALLOCATION)
+    channels = list(current_allocation)
+    shares = channel_shares(revenue) / 100
+    models = list(shares.columns)
+    credited = shares.reindex(channels, fill_value=0.0).to_numpy().T * baseline_revenue
+    spend = np.array([current_allocation[c] for c in channels], dtype=np.float64)
+
+    x = saturation_ratio(np.broadcast_to(elasticity, spend.shape))
+    return {
+        'models': models,
+        'channels': channels,
+        'current': spend,
+        'scale': credited / -np.expm1(-x),
+        'saturation': np.broadcast_to(spend / x, credited.shape).copy(),
+        'base': baseline_revenue - credited.sum(axis=1),
+    }
+
+
+def curve_revenue(curves, spend):
+    """(..., models, channels) channel revenue for (..., channels) spend"""
+    spend = np.asarray(spend, dtype=np.float64)[..., None, :]
+    return curves['scale'] * -np.expm1(-spend / curves['saturation'])
+
+
+def evaluate_allocations(curves, allocations, block=SCENARIO_BLOCK):
+    """
+    (allocations, models) total revenue for (allocations, channels) spend,
+    in blocks of at most block allocations
+    """
+    allocations = np.asarray(allocations, dtype=np.float64).reshape(-1, len(curves['channels']))
+    out = np.empty((len(allocations), len(curves['models'])))
+    for start in range(0, len(allocations), block):
+        part = allocations[start:start + block]
+        out[start:start + block] = curve_revenue(curves, part).sum(axis=2) + curves['base']
+    return out
+
+
+def allocation_step(total_budget, n_channels, min_share=MIN_SHARE, max_share=MAX_SHARE, points=ALLOCATION_POINTS):
+    """
+    Step dividing total_budget evenly that gives each of the n_channels - 1
+    free channels about points ** (1 / (n_channels - 1)) levels across its
+    share bounds. The step count is the smallest one from there on at which
+    both bounds fall on the grid (within 100 more for whole-percent bounds).
+    """
+    min_share, max_share = share_bounds(n_channels, min_share, max_share)
+    levels = max(int(points ** (1 / max(n_channels - 1, 1))), 2)
+    candidates = int(np.ceil((levels - 1) / (max_share - min_share))) + np.arange(101)
+    bounds = np.outer(candidates, [min_share, max_share])
+    aligned = np.abs(bounds - np.round(bounds)).max(axis=1) < 1e-9
+    return total_budget / int(candidates[aligned.argmax()] if aligned.any() else candidates[0])
+
+
+def allocation_grid(total_budget, n_channels, step=ALLOCATION_STEP, min_share=MIN_SHARE, max_share=MAX_SHARE):
+    """
+    (allocations, channels) every split of total_budget in step increments
+    with each channel's share within [min_share, max_share], built with
+    np.indices over the free channels and filtered on the last one.
+    step=None uses allocation_step.
+    """
+    min_share, max_share = share_bounds(n_channels, min_share, max_share)
+    if step is None:
+        step = allocation_step(total_budget, n_channels, min_share, max_share)
+    units = int(round(total_budget / step))
+    lower = int(np.ceil(units * min_share - 1e-9))
+    upper = int(np.floor(units * max_share + 1e-9))
+    levels = max(upper - lower + 1, 0)
+    grid = np.indices((levels,) * (n_channels - 1), dtype=np.int64).reshape(n_channels - 1, -1).T + lower
+    last = units - grid.sum(axis=1)
+    grid = np.column_stack([grid, last])[(last >= lower) & (last <= upper)]
+    return grid * (total_budget / units)
+
+
+def optimal_allocation(curves, total_budget, min_share=MIN_SHARE, max_share=MAX_SHARE):
+    """
+    (models, channels) revenue-maximizing split of total_budget within the
+    share bounds. The curves are concave, so the optimum equalizes marginal
+    revenue scale / saturation * exp(-s / saturation) across the channels not
+    at a bound; the common marginal is found by bisection for every model at once.
+    """
+    scale, saturation = curves['scale'], curves['saturation']
+    min_share, max_share = share_bounds(len(curves['channels']), min_share, max_share)
+    lower, upper = total_budget * min_share, total_budget * max_share
+    peak = np.where(saturation > 0, scale / np.where(saturation > 0, saturation, 1), 0.0)
+
+    def spend_at(log_marginal):
+        # Spend where each channel's marginal revenue falls to exp(log_marginal)
+        ratio = np.log(np.maximum(peak, 1e-300)) - log_marginal[:, None]
+        return np.clip(saturation * ratio, lower, upper)
+
+    lo = np.full(len(scale), np.log(max(peak.min(), 1e-300)) - 50.0)
+    hi = np.full(len(scale), np.log(max(peak.max(), 1e-300)) + 1.0)
+    for _ in range(_BISECTION_STEPS):
+        mid = (lo + hi) / 2
+        over = spend_at(mid).sum(axis=1) > total_budget
+        lo, hi = np.where(over, mid, lo), np.where(over, hi, mid)
+    return spend_at((lo + hi) / 2)
+
+
+def _scenario(curves, spend, revenue, current_revenue, total_budget):
+    return {
+        'allocation': {c: float(s) for c, s in zip(curves['channels'], spend)},
+        'revenue': float(revenue),
+        'lift': float((revenue / current_revenue - 1) * 100) if current_revenue else 0.0,
+        'roas': float(revenue / total_budget) if total_budget else 0.0,
+    }
+
+
+def budget_scenarios(revenue, total_budget=TOTAL_BUDGET, current_allocation=None,
+                     baseline_revenue=BASELINE_REVENUE, elasticity=SPEND_ELASTICITY,
+                     min_share=MIN_SHARE, max_share=MAX_SHARE, step=ALLOCATION_STEP, curve_points=CURVE_POINTS):
+    """
+    budget_scenarios export block, from channel x model revenue:
+
+    curves: every model's revenue per channel at curve_points spends from 0
+    to total_budget, plus each curve's scale and saturation, so any split can
+    be evaluated exactly as base + sum(scale * (1 - exp(-spend / saturation))).
+    allocations: total revenue of every model for each split on the step grid
+    (by default the dashboard slider's $50K step).
+    current / optimal: the current split and each model's optimal split,
+    with revenue, lift over current and ROAS.
+    Share bounds left as None are derived from the channel count (share_bounds).
+    """
+    current_allocation = dict(current_allocation or CURRENT_ALLOCATION)
+    min_share, max_share = share_bounds(len(current_allocation), min_share, max_share)
+    curves = fit_response_curves(revenue, current_allocation, baseline_revenue, elasticity)
+    models, channels = curves['models'], curves['channels']
+
+    spend = np.linspace(0, total_budget, curve_points)
+    channel_curves = curve_revenue(curves, spend[:, None])
+
+    grid = allocation_grid(total_budget, len(channels), step, min_share, max_share)
+    grid_revenue = evaluate_allocations(curves, grid)
+    current = evaluate_allocations(curves, curves['current'])[0]
+    optimal = optimal_allocation(curves, total_budget, min_share, max_share)
+    optimal_revenue = evaluate_allocations(curves, optimal).diagonal()
+
+    return {
+        'total_budget': total_budget,
+        'baseline_revenue': baseline_revenue,
+        'elasticity': elasticity,
+        'channels': channels,
+        'bounds': {'min_share': min_share, 'max_share': max_share},
+        'curves': {
+            'spend': spend.tolist(),
+            'models': {m: {c: channel_curves[:, i, j].tolist() for j, c in enumerate(channels)}
+                       for i, m in enumerate(models)},
+            'base': {m: float(curves['base'][i]) for i, m in enumerate(models)},
+            **{param: {m: {c: float(curves[param][i, j]) for j, c in enumerate(channels)}
+                       for i, m in enumerate(models)} for param in ('scale', 'saturation')},
+        },
+        'allocations': {
+            **{c: grid[:, j].tolist() for j, c in enumerate(channels)},
+            'revenue': {m: grid_revenue[:, i].tolist() for i, m in enumerate(models)},
+        },
+        'current': {m: _scenario(curves, curves['current'], current[i], current[i], total_budget)
+                    for i, m in enumerate(models)},
+        'optimal': {m: _scenario(curves, optimal[i], optimal_revenue[i], current[i], total_budget)
+                    for i, m in enumerate(models)},
+    }
@@ -0,0 +1,460 @@
+import argparse
+import asyncio
+import gzip
+import json
+import mmap
+import os
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from .cube import DAILY_PREFIX, load_cube_arrays
+
+RESULTS_FILE = 'attribution-results.json'
+CUBE_DIR = 'attribution-cube'
+
+# Responses kept in the LRU cache, and the smallest body worth compressing
+CACHE_SIZE = 256
+GZIP_MIN_BYTES = 1024
+
+# Request timings kept for the latency percentiles
+LATENCY_WINDOW = 10_000
+
+MAX_HEADER_BYTES = 64 * 1024
+KEEP_ALIVE_SECONDS = 15
+
+# Seconds between checks for a newer batch export (artifacts are reopened and
+# the cache cleared when the results file or any cube file changes)
+RELOAD_CHECK_SECONDS = 1.0
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            500: 'Internal Server Error'}
+
+
+class QueryError(ValueError):
+    """A query the artifacts cannot answer (reported as 400 or 404)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ResponseCache:
+    """
+    LRU cache of encoded responses keyed by (path, normalized query, encoding)
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return self._entries[key]
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LatencyTracker:
+    """Server-side request latencies over the last LATENCY_WINDOW requests"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.requests += 1
+
+    def summary(self):
+        if not self.samples:
+            return {'requests': self.requests, 'p50_ms': None, 'p99_ms': None}
+        p50, p99 = np.percentile(np.fromiter(self.samples, dtype=np.float64), [50, 99]) * 1000
+        return {'requests': self.requests, 'p50_ms': float(p50), 'p99_ms': float(p99)}
+
+
+def _map_file(path):
+    """Read-only memory map of a file (None for an empty file)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _file_signature(path):
+    """(size, mtime, inode) of a file, or None when it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def artifacts_signature(directory):
+    """
+    Signatures of the results file and of every file of the cube (header and
+    columns); exports replace files, so any rewrite changes the inode
+    """
+    cube_dir = os.path.join(directory, CUBE_DIR)
+    try:
+        names = sorted(name for name in os.listdir(cube_dir) if not name.endswith('.partial'))
+    except FileNotFoundError:
+        names = []
+    return ((RESULTS_FILE, _file_signature(os.path.join(directory, RESULTS_FILE))),) + tuple(
+        (name, _file_signature(os.path.join(cube_dir, name))) for name in names)
+
+
+def _date_window(dates, start, end):
+    """(lo, hi) indices of the sorted datetime64[D] dates between start and end (inclusive ISO dates)"""
+    try:
+        lo = np.searchsorted(dates, np.datetime64(start, 'D')) if start else 0
+        hi = np.searchsorted(dates, np.datetime64(end, 'D'), side='right') if end else len(dates)
+    except ValueError:
+        raise QueryError("start and end must be ISO dates (YYYY-MM-DD)")
+    return int(lo), max(int(lo), int(hi))
+
+
+class Artifacts:
+    """
+    Precomputed attribution outputs, opened once: the results JSON is
+    memory-mapped (served as-is and parsed once for queries), the cube's
+    .npy columns are memory-mapped, and a (category, brand, price_band)
+    -> row index answers segment lookups in O(1).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        results_path = os.path.join(directory, RESULTS_FILE)
+        self.signature = artifacts_signature(directory)
+        self.results_map = _map_file(results_path)
+        self.results = json.loads(self.results_map[:]) if self.results_map is not None else {}
+
+        cube_dir = os.path.join(directory, CUBE_DIR)
+        self.cube_header, self.cube = (load_cube_arrays(cube_dir) if os.path.isdir(cube_dir) else (None, None))
+        self._cells = {}
+        if self.cube is not None:
+            codes = np.stack([np.asarray(self.cube[name]) for name in self.cube_header['dimensions']], axis=1)
+            self._cells = {tuple(row): i for i, row in enumerate(codes.tolist())}
+
+        dates = (self.cube_header or {}).get('dates')
+        self.cube_dates = np.array(dates, dtype='datetime64[D]') if dates is not None else None
+
+        trends = self.results.get('attribution_trends')
+        self.trend_dates = np.array(trends['dates'], dtype='datetime64[D]') if trends else None
+
+    def raw_results(self):
+        """The results file as a view of its map (no copy), or b'{}'"""
+        return memoryview(self.results_map) if self.results_map is not None else b'{}'
+
+    def close(self):
+        """
+        Unmap the artifacts. The cube's numpy maps unmap with their last
+        reference; a results map still exported to an in-flight response is
+        unmapped when that response lets go of it.
+        """
+        self.cube = None
+        if self.results_map is not None:
+            try:
+                self.results_map.close()
+            except BufferError:
+                pass
+            self.results_map = None
+
+    # ---- queries ---------------------------------------------------------
+
+    def _models(self, available, model):
+        if model is None:
+            return list(available)
+        if model not in available:
+            raise QueryError(f"Unknown model '{model}'")
+        return [model]
+
+    def _channels(self, available, channel):
+        if channel is None:
+            return list(available)
+        if channel not in available:
+            raise QueryError(f"Unknown channel '{channel}'")
+        return [channel]
+
+    def attribution(self, model=None, channel=None):
+        """Channel shares per model, with bootstrap intervals when exported"""
+        shares = self.results.get('attribution_models', {})
+        models = self._models(shares, model)
+        channels = self._channels(next(iter(shares.values()), {}), channel)
+        out = {'models': {m: {c: shares[m][c] for c in channels} for m in models}}
+        intervals = self.results.get('attribution_intervals')
+        if intervals:
+            out['intervals'] = {m: {c: intervals['models'][m][c] for c in channels if c in intervals['models'][m]}
+                                for m in models if m in intervals['models']}
+            out['confidence'] = intervals['confidence']
+        return out
+
+    def segment(self, model=None, channel=None, start=None, end=None, **segment):
+        """
+        Credit and shares for one cube cell; dimensions left out are rolled up.
+        With start and/or end (inclusive ISO dates) the cell is summed over the
+        cube's daily cells for purchases in that range instead.
+        """
+        if self.cube is None:
+            raise QueryError("No attribution cube in the artifacts", status=404)
+        header = self.cube_header
+        key = []
+        for name, labels in header['dimensions'].items():
+            label = segment.get(name)
+            if label is None:
+                key.append(header['all_code'])
+            elif label in labels:
+                key.append(labels.index(label))
+            else:
+                raise QueryError(f"Unknown {name} '{label}'")
+        models = self._models(header['models'], model)
+        channels = self._channels(header['channels'], channel)
+
+        if start is None and end is None:
+            row = self._cells.get(tuple(key))
+            rows = [] if row is None else [row]
+            prefix = ''
+        else:
+            if self.cube_dates is None:
+                raise QueryError("No daily cells in the attribution cube", status=404)
+            lo, hi = _date_window(self.cube_dates, start, end)
+            # Daily rows are sorted by day, so the range is one contiguous run
+            prefix = DAILY_PREFIX
+            first, last = np.searchsorted(self.cube[prefix + 'day'], [lo, hi])
+            rows = np.arange(first, last)
+            for name, code in zip(header['dimensions'], key):
+                if code != header['all_code']:
+                    rows = rows[self.cube[prefix + name][rows] == code]
+        credit = self.cube[prefix + 'credit'][:, :, rows].sum(axis=2)
+
+        out = {
+            'segment': {name: segment.get(name) for name in header['dimensions']},
+            'journeys': int(self.cube[prefix + 'journeys'][rows].sum()),
+            'revenue': float(self.cube[prefix + 'revenue'][rows].sum()),
+            'models': {},
+        }
+        if prefix:
+            out['start'], out['end'] = start, end
+        for m in models:
+            revenue = credit[header['models'].index(m)]
+            total = float(revenue.sum())
+            out['models'][m] = {
+                c: {'revenue': float(revenue[header['channels'].index(c)]),
+                    'share': float(revenue[header['channels'].index(c)] / total * 100) if total else 0.0}
+                for c in channels
+            }
+        return out
+
+    def trends(self, model=None, channel=None, start=None, end=None):
+        """Rolling daily series between start and end (inclusive ISO dates)"""
+        series = self.results.get('attribution_trends')
+        if not series:
+            raise QueryError("No attribution trends in the artifacts", status=404)
+        window = slice(*_date_window(self.trend_dates, start, end))
+        models = self._models(series['models'], model)
+        channels = self._channels(next(iter(series['models'].values()), {}), channel)
+        missing = [(m, c) for m in models for c in channels if c not in series['models'][m]]
+        if missing:
+            raise QueryError(f"No {missing[0][1]} series for model '{missing[0][0]}'", status=404)
+        return {
+            'window_days': series['window_days'],
+            'dates': series['dates'][window],
+            'journeys': series['journeys'][window],
+            'revenue': series['revenue'][window],
+            'models': {m: {c: series['models'][m][c][window] for c in channels} for m in models},
+        }
+
+
+class AttributionService:
+    """
+    Keep-alive HTTP/1.1 service over one artifacts directory.
+
+    GET /data/attribution-results.json  the dashboard export, unchanged
+    GET /attribution?model=&channel=    model shares (+ intervals)
+    GET /segment?category=&brand=&price_band=&model=&channel=&start=&end=
+    GET /trends?model=&channel=&start=&end=
+    GET /stats                          latency p50/p99 and cache counters
+
+    JSON bodies are cached per normalized query (LRU) and gzip-compressed
+    when the client accepts it. The results file is served straight from its
+    map, uncached; only its gzip encoding is cached.
+    """
+
+    QUERIES = {
+        '/attribution': ('attribution', {'model', 'channel'}),
+        '/segment': ('segment', {'model', 'channel', 'category', 'brand', 'price_band', 'start', 'end'}),
+        '/trends': ('trends', {'model', 'channel', 'start', 'end'}),
+    }
+
+    def __init__(self, artifacts, cache_size=CACHE_SIZE):
+        self.artifacts = artifacts
+        self.cache = ResponseCache(cache_size)
+        self.latency = LatencyTracker()
+        self._checked = time.monotonic()
+
+    def refresh(self):
+        """
+        Reopen the artifacts when a new export replaced them (checked at most
+        once a second). An export caught half-written fails to load and the
+        old artifacts keep serving until the next check.
+        """
+        now = time.monotonic()
+        if now - self._checked < RELOAD_CHECK_SECONDS:
+            return False
+        self._checked = now
+        if artifacts_signature(self.artifacts.directory) == self.artifacts.signature:
+            return False
+        try:
+            artifacts = Artifacts(self.artifacts.directory)
+        except (OSError, ValueError, KeyError):
+            return False
+        self.artifacts, replaced = artifacts, self.artifacts
+        replaced.close()
+        self.cache.clear()
+        return True
+
+    def stats(self):
+        return {'latency': self.latency.summary(), 'cache': dict(self.cache.stats, entries=len(self.cache))}
+
+    def _body(self, path, params):
+        """(status, JSON bytes or a view of the results map) for a request path"""
+        if path == '/data/' + RESULTS_FILE:
+            return 200, self.artifacts.raw_results()
+        if path == '/stats':
+            return 200, json.dumps(self.stats()).encode()
+        if path not in self.QUERIES:
+            return 404, json.dumps({'error': f"Unknown path '{path}'"}).encode()
+        method, allowed = self.QUERIES[path]
+        unknown = sorted(set(params) - allowed)
+        if unknown:
+            return 400, json.dumps({'error': f"Unknown parameters: {', '.join(unknown)}"}).encode()
+        try:
+            result = getattr(self.artifacts, method)(**params)
+        except QueryError as exc:
+            return exc.status, json.dumps({'error': str(exc)}).encode()
+        except Exception as exc:
+            # Answer rather than drop the connection; the query is not cached
+            return 500, json.dumps({'error': f"{type(exc).__name__}: {exc}"}).encode()
+        return 200, json.dumps(result).encode()
+
+    def respond(self, target, accept_gzip):
+        """(status, body bytes, content encoding or None) for a GET target"""
+        self.refresh()
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        key = (url.path, tuple(sorted(params.items())), accept_gzip)
+        cached = self.cache.get(key) if url.path != '/stats' else None
+        if cached is not None:
+            return cached
+        status, body = self._body(url.path, params)
+        encoding = None
+        if accept_gzip and len(body) >= GZIP_MIN_BYTES:
+            body, encoding = gzip.compress(body, compresslevel=6), 'gzip'
+        response = (status, body, encoding)
+        # The raw results view is already in memory; caching it would copy or pin the map
+        if status == 200 and url.path != '/stats' and not isinstance(body, memoryview):
+            self.cache.put(key, response)
+        return response
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_SECONDS)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                started = time.perf_counter()
+                lines = head.decode('latin-1').split('\r\n')
+                method, target, version = (lines[0].split(' ') + ['', '', ''])[:3]
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+                if method not in ('GET', 'HEAD'):
+                    status, body, encoding = 405, b'{"error": "Only GET and HEAD are supported"}', None
+                else:
+                    status, body, encoding = self.respond(target, 'gzip' in headers.get('accept-encoding', ''))
+
+                response = [
+                    f'HTTP/1.1 {status} {_REASONS.get(status, "")}',
+                    'Content-Type: application/json',
+                    f'Content-Length: {len(body)}',
+                    'Access-Control-Allow-Origin: *',
+                    'Vary: Accept-Encoding',
+                    f'Connection: {"keep-alive" if keep_alive else "close"}',
+                ]
+                if encoding:
+                    response.append(f'Content-Encoding: {encoding}')
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                self.latency.record(time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000, report_every=None):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        print(f"Serving {self.artifacts.directory} on http://{host}:{port}")
+        reporter = asyncio.create_task(self._report(report_every)) if report_every else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if reporter:
+                reporter.cancel()
+
+    async def _report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            latency = self.latency.summary()
+            if latency['requests']:
+                print(f"{latency['requests']:,} requests, p50 {latency['p50_ms']:.2f} ms, "
+                      f"p99 {latency['p99_ms']:.2f} ms, cache hits {self.cache.stats['hits']:,}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve attribution slices from precomputed artifacts")
+    parser.add_argument('artifacts', nargs='?', default='output',
+                        help=f"directory holding {RESULTS_FILE} and {CUBE_DIR}/")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="responses kept in the LRU cache")
+    parser.add_argument('--report-every', type=float, default=60.0,
+                        help="seconds between latency reports (0 = never)")
+    args = parser.parse_args(argv)
+
+    service = AttributionService(Artifacts(args.artifacts), cache_size=args.cache_size)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.report_every or None))
+    except KeyboardInterrupt:
+        print(json.dumps(service.stats()))
+
+
+if __name__ == '__main__':
+    main()
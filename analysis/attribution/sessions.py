@@ -0,0 +1,128 @@
+import numpy as np
+
+from .store import JourneyStore
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+
+# A gap longer than this between a user's events starts a new session
+INACTIVITY_TIMEOUT_MINUTES = 30
+
+# A session's dominant action is its deepest funnel step, in this order;
+# event types not listed rank below all of them
+ACTION_PRIORITY = ('purchase', 'cart', 'view')
+
+TOUCHPOINT_UNITS = ('event', 'session')
+
+
+def session_starts(store, timeout_minutes=INACTIVITY_TIMEOUT_MINUTES, split_on_session_id=True):
+    """
+    Store positions where a session begins, from vectorized time diffs over
+    the (user, time) sorted store: a new user, a gap longer than
+    timeout_minutes (None = no timeout) or, with split_on_session_id, a
+    change of user_session between consecutive events
+    """
+    n = len(store)
+    starts = np.ones(n, dtype=bool)
+    if n:
+        user_index = store.user_index()
+        starts[1:] = user_index[1:] != user_index[:-1]
+        if timeout_minutes is not None:
+            event_times = np.asarray(store['event_time']).view(np.int64)
+            starts[1:] |= np.diff(event_times) > int(timeout_minutes * NS_PER_MINUTE)
+        if split_on_session_id and 'user_session' in store.column_names:
+            sessions = np.asarray(store['user_session'])
+            starts[1:] |= sessions[1:] != sessions[:-1]
+    return np.flatnonzero(starts)
+
+
+def dominant_actions(event_types, starts, channels, priority=ACTION_PRIORITY):
+    """
+    (event_type code, store position) of every session's dominant action:
+    the highest-priority event type in the session, represented by its last
+    event of that type
+    """
+    event_types = np.asarray(event_types)
+    rank_of = len(priority) + np.arange(len(channels))
+    for rank, name in enumerate(priority):
+        if name in channels:
+            rank_of[channels.index(name)] = rank
+    if len(starts) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return event_types[empty], empty
+
+    rank = rank_of[event_types]
+    lengths = np.diff(np.append(starts, len(event_types)))
+    best = np.repeat(np.minimum.reduceat(rank, starts), lengths)
+    positions = np.where(rank == best, np.arange(len(event_types)), -1)
+    last = np.maximum.reduceat(positions, starts)
+    return event_types[last], last
+
+
+class SessionStore(JourneyStore):
+    """
+    A JourneyStore with one event per session, so every model runs on
+    session-level paths.
+
+    Each session becomes its dominant action: event_type is the deepest
+    funnel step reached, event_time the session's last event, price the
+    session's purchase total for purchase sessions, and every other column is
+    gathered from the session's last event of the dominant type.
+    session_events holds the number of raw events per session. Users keep
+    their positions, so per-user masks (e.g. the bot filter) still apply.
+    """
+
+    def __init__(self, store, timeout_minutes=INACTIVITY_TIMEOUT_MINUTES, split_on_session_id=True,
+                 priority=ACTION_PRIORITY, purchase_type='purchase'):
+        starts = session_starts(store, timeout_minutes, split_on_session_id)
+        ends = np.append(starts[1:], len(store)).astype(np.int64)
+        event_types = np.asarray(store['event_type'])
+        dominant, positions = dominant_actions(event_types, starts, store.channels, priority)
+
+        sessions_per_user = np.bincount(np.asarray(store.user_index())[starts], minlength=store.n_users)
+        self.path = store.path
+        self.categories = store.categories
+        self.users = np.asarray(store.users)
+        self.offsets = np.zeros(store.n_users + 1, dtype=np.int64)
+        np.cumsum(sessions_per_user, out=self.offsets[1:])
+
+        price = np.asarray(store['price'], dtype=np.float64)
+        purchases = event_types == store.channels.index(purchase_type)
+        session_price = price[positions]
+        if len(starts):
+            purchase_total = np.add.reduceat(np.where(purchases, price, 0.0), starts)
+            session_price = np.where(dominant == store.channels.index(purchase_type), purchase_total, session_price)
+
+        self._parent = store
+        self._positions = positions
+        self._columns = {
+            'event_type': dominant,
+            'event_time': np.asarray(store['event_time'])[ends - 1],
+            'price': session_price,
+            'session_events': ends - starts,
+        }
+        columns = dict(store.meta['columns'], session_events='int64')
+        self.meta = dict(store.meta, n_events=len(starts), columns=columns, touchpoint_unit='session',
+                         timeout_minutes=timeout_minutes, raw_events=len(store))
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self._parent.column(name)[self._positions]
+        return self._columns[name]
+
+
+def touchpoint_store(store, unit='event', timeout_minutes=INACTIVITY_TIMEOUT_MINUTES):
+    """store itself for unit 'event', its SessionStore for unit 'session'"""
+    if unit not in TOUCHPOINT_UNITS:
+        raise ValueError(f"Unknown touchpoint unit '{unit}' (use 'event' or 'session')")
+    return store if unit == 'event' else SessionStore(store, timeout_minutes)
+
+
+def session_summary(sessions):
+    """Session count, raw events per session and sessions per dominant action"""
+    counts = np.bincount(np.asarray(sessions['event_type']), minlength=len(sessions.channels))
+    n_sessions = len(sessions)
+    return {
+        'sessions': n_sessions,
+        'avg_events_per_session': float(sessions.meta['raw_events'] / n_sessions) if n_sessions else 0.0,
+        'dominant_actions': {name: int(count) for name, count in zip(sessions.channels, counts)},
+    }
@@ -0,0 +1,197 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Hand-picked conversion impact per touchpoint type (unknown types get 0.1)
+HEURISTIC_WEIGHTS = {'view': 0.3, 'cart': 0.6, 'purchase': 1.0}
+
+# Coalitions up to this many players are enumerated exactly; larger ones are sampled
+MAX_EXACT_PLAYERS = 15
+
+
+def journey_masks(touches):
+    """
+    Bitmask of the distinct channels touched in each journey (bit c = channel code c)
+    """
+    bits = np.left_shift(np.uint64(1), touches['channel'].astype(np.uint64))
+    if len(bits) == 0:
+        return np.zeros(len(touches['offsets']) - 1, dtype=np.uint64)
+    return np.bitwise_or.reduceat(bits, touches['offsets'][:-1])
+
+
+def mask_to_channels(mask, channels):
+    return [channels[c] for c in range(len(channels)) if int(mask) >> c & 1]
+
+
+def heuristic_value_function(channels, weights=None):
+    """
+    Vectorized version of the original conversion_probability: coalition weight
+    summed over its channels, then min(0.95, 1 - exp(-w / 2)); empty coalition is 0
+    """
+    weights = HEURISTIC_WEIGHTS if weights is None else weights
+    channel_weights = np.array([weights.get(c, 0.1) for c in channels])
+
+    def value(masks):
+        masks = np.asarray(masks, dtype=np.uint64)
+        total = np.zeros(masks.shape)
+        for c, w in enumerate(channel_weights):
+            total += w * ((masks >> np.uint64(c)) & np.uint64(1))
+        return np.where(masks == 0, 0.0, np.minimum(0.95, 1 - np.exp(-total / 2)))
+
+    return value
+
+
+def _players(mask):
+    mask = int(mask)
+    return [c for c in range(mask.bit_length()) if mask >> c & 1]
+
+
+class ShapleyEngine:
+    """
+    Shapley attribution over channel coalitions encoded as bitmasks.
+
+    value_fn maps an array of coalition masks to conversion probabilities. It
+    is called at most once per distinct coalition; Shapley vectors are cached
+    per distinct journey mask, so a month of journeys costs one evaluation per
+    distinct touchpoint set. Coalitions with more than max_exact players switch
+    to permutation-sampling Monte Carlo, stopping once every channel's standard
+    error is below tolerance (relative to the coalition's value); sampled
+    coalitions are evaluated per batch and not cached, since they rarely repeat
+    and would grow the cache with every draw.
+    """
+
+    def __init__(self, value_fn, n_channels, max_exact=MAX_EXACT_PLAYERS,
+                 tolerance=1e-3, batch_size=256, max_permutations=100_000, seed=0):
+        if n_channels > 63:
+            raise ValueError("Bitmask coalitions support at most 63 channels")
+        self.value_fn = value_fn
+        self.n_channels = n_channels
+        self.max_exact = max_exact
+        self.tolerance = tolerance
+        self.batch_size = batch_size
+        self.max_permutations = max_permutations
+        self.rng = np.random.default_rng(seed)
+        self._values = {}
+        self._vectors = {}
+        self.stats = {'value_calls': 0, 'value_hits': 0, 'vector_calls': 0, 'vector_hits': 0,
+                      'sampled_sets': 0}
+
+    def coalition_values(self, masks):
+        """Characteristic function with a per-coalition cache"""
+        masks = np.asarray(masks, dtype=np.uint64)
+        unique, inverse = np.unique(masks, return_inverse=True)
+        missing = [m for m in unique.tolist() if m not in self._values]
+        self.stats['value_hits'] += len(unique) - len(missing)
+        if missing:
+            computed = self.value_fn(np.array(missing, dtype=np.uint64))
+            self.stats['value_calls'] += len(missing)
+            self._values.update(zip(missing, np.asarray(computed, dtype=np.float64).tolist()))
+        lookup = np.array([self._values[m] for m in unique.tolist()])
+        return lookup[inverse].reshape(masks.shape)
+
+    def _batch_values(self, masks):
+        """Characteristic function for one batch, bypassing the cache"""
+        unique, inverse = np.unique(np.asarray(masks, dtype=np.uint64), return_inverse=True)
+        self.stats['value_calls'] += len(unique)
+        values = np.asarray(self.value_fn(unique), dtype=np.float64)
+        return values[inverse.ravel()].reshape(np.shape(masks))
+
+    def _exact(self, players):
+        n = len(players)
+        subsets = np.arange(1 << n, dtype=np.int64)
+        # Lift compressed subsets (bit j = j-th player) to global channel masks
+        global_masks = np.zeros(len(subsets), dtype=np.uint64)
+        sizes = np.zeros(len(subsets), dtype=np.int64)
+        for j, channel in enumerate(players):
+            bit = (subsets >> j) & 1
+            global_masks |= bit.astype(np.uint64) << np.uint64(channel)
+            sizes += bit
+        v = self.coalition_values(global_masks)
+
+        # weight[s] = s! (n - s - 1)! / n! for coalitions of size s
+        weight = np.array([math.factorial(s) * math.factorial(n - s - 1) / math.factorial(n)
+                           for s in range(n)])
+        phi = np.zeros(self.n_channels)
+        for j, channel in enumerate(players):
+            without = subsets[((subsets >> j) & 1) == 0]
+            marginal = v[without | (1 << j)] - v[without]
+            phi[channel] = np.dot(weight[sizes[without]], marginal)
+        return phi
+
+    def _sampled(self, players, total_value):
+        players = np.array(players, dtype=np.uint64)
+        n = len(players)
+        sums = np.zeros(n)
+        sq_sums = np.zeros(n)
+        drawn = 0
+        scale = max(abs(total_value), 1e-12)
+        while drawn < self.max_permutations:
+            # Each row is a random ordering of the players (indices into players)
+            order = np.argsort(self.rng.random((self.batch_size, n)), axis=1)
+            bits = np.left_shift(np.uint64(1), players[order])
+            prefix = np.bitwise_or.accumulate(bits, axis=1)
+            before = np.concatenate([np.zeros((self.batch_size, 1), dtype=np.uint64),
+                                     prefix[:, :-1]], axis=1)
+            values = self._batch_values(np.stack([prefix, before]))
+            marginal = values[0] - values[1]
+            # Scatter marginals back to player slots
+            per_player = np.empty_like(marginal)
+            np.put_along_axis(per_player, order, marginal, axis=1)
+            sums += per_player.sum(axis=0)
+            sq_sums += (per_player ** 2).sum(axis=0)
+            drawn += self.batch_size
+
+            mean = sums / drawn
+            stderr = np.sqrt(np.maximum(sq_sums / drawn - mean ** 2, 0) / drawn)
+            if stderr.max() <= self.tolerance * scale:
+                break
+        phi = np.zeros(self.n_channels)
+        phi[players.astype(np.int64)] = sums / drawn
+        return phi
+
+    def shapley_vector(self, mask):
+        """
+        Shapley value of every channel for the coalition of channels in mask
+        """
+        mask = int(mask)
+        if mask in self._vectors:
+            self.stats['vector_hits'] += 1
+            return self._vectors[mask]
+        self.stats['vector_calls'] += 1
+        players = _players(mask)
+        if len(players) == 1:
+            # A lone touchpoint takes the whole conversion, as in the original model
+            phi = np.zeros(self.n_channels)
+            phi[players[0]] = 1.0
+        elif len(players) <= self.max_exact:
+            phi = self._exact(players)
+        else:
+            self.stats['sampled_sets'] += 1
+            phi = self._sampled(players, self.coalition_values([mask])[0])
+        self._vectors[mask] = phi
+        return phi
+
+    def attribute(self, masks, values):
+        """
+        Channel credit summed over journeys: each distinct mask's Shapley vector
+        times the total conversion value of the journeys sharing that mask
+        """
+        unique, inverse = np.unique(np.asarray(masks, dtype=np.uint64), return_inverse=True)
+        totals = np.bincount(inverse, weights=values, minlength=len(unique))
+        credit = np.zeros(self.n_channels)
+        for mask, total in zip(unique.tolist(), totals):
+            credit += self.shapley_vector(mask) * total
+        return credit
+
+
+def shapley_revenue(touches, value_fn=None, **engine_params):
+    """
+    Shapley revenue per channel (indexed by channel name) for every journey
+    """
+    channels = touches['channels']
+    if value_fn is None:
+        value_fn = heuristic_value_function(channels)
+    engine = ShapleyEngine(value_fn, len(channels), **engine_params)
+    credit = engine.attribute(journey_masks(touches), touches['value'])
+    return pd.Series(credit, index=channels), engine
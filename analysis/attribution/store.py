@@ -0,0 +1,323 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .ingest import DEFAULT_MEMORY_LIMIT_MB, EVENT_TYPES, iter_event_chunks, recode_categorical
+
+# Columns every journey store carries; the sort keys must always be present
+STORE_COLUMNS = ['event_time', 'event_type', 'price', 'user_id', 'user_session']
+SORT_KEYS = ['user_id', 'event_time']
+
+# Product attributes of every event, kept when the attribution cube is built
+PRODUCT_COLUMNS = ['category_code', 'brand']
+
+META_FILE = 'meta.json'
+OFFSETS_FILE = 'offsets.npy'
+USERS_FILE = 'users.npy'
+SPILL_DIR = '_spill'
+
+# Rows gathered per block when permuting spilled columns into sorted order
+GATHER_BLOCK = 4_000_000
+
+
+def _spill_dtype(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return np.dtype(np.int32)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return np.dtype(np.int64)
+    return np.dtype(values.dtype)
+
+
+def _spill_values(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.int32)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    return values.to_numpy()
+
+
+def _id_dtype(low, high):
+    """int32 when every id fits, else int64"""
+    info = np.iinfo(np.int32)
+    return np.dtype(np.int32 if info.min <= low and high <= info.max else np.int64)
+
+
+def _code_dtype(n_categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def build_store(source, store_dir, columns=None, chunksize=None,
+                memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    One-time conversion of events into a columnar store sorted by (user_id, event_time).
+
+    source: CSV path, a compact events DataFrame, or an iterable of compact chunks.
+    Chunks are spilled to raw column files, the sort permutation is computed from
+    the two key columns only, and every column is then gathered into sorted .npy
+    files block by block, so peak memory is the keys plus one block.
+
+    An existing store_dir is replaced only when it is empty or holds a store
+    (or a half-built one); any other directory raises FileExistsError.
+    """
+    if columns is None:
+        columns = list(STORE_COLUMNS)
+    columns = list(dict.fromkeys(SORT_KEYS + list(columns)))
+
+    signature = None
+    if isinstance(source, (str, os.PathLike)):
+        signature = source_signature(source)
+        chunks = iter_event_chunks(source, columns, chunksize, memory_limit_mb)
+    elif isinstance(source, pd.DataFrame):
+        chunks = [source]
+    else:
+        chunks = source
+
+    if os.path.exists(store_dir):
+        entries = os.listdir(store_dir)
+        if entries and META_FILE not in entries and SPILL_DIR not in entries:
+            raise FileExistsError(f"'{store_dir}' exists and is not a journey store; refusing to replace it")
+        shutil.rmtree(store_dir)
+    spill_dir = os.path.join(store_dir, SPILL_DIR)
+    os.makedirs(spill_dir)
+
+    # Spill every chunk column to an append-only raw file; categoricals are
+    # recoded onto one running category list so codes agree across chunks
+    categories = {}
+    spill_dtypes = {}
+    id_low, id_high = 0, 0
+    n_events = 0
+    handles = {c: open(os.path.join(spill_dir, c + '.bin'), 'wb') for c in columns}
+    try:
+        for chunk in chunks:
+            for column in columns:
+                values = chunk[column]
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    if column not in categories:
+                        seed = list(EVENT_TYPES) if column == 'event_type' else []
+                        categories[column] = (seed, {v: i for i, v in enumerate(seed)})
+                    cats, index = categories[column]
+                    values = pd.Series(recode_categorical(values, cats, index))
+                raw = _spill_values(values)
+                spill_dtypes.setdefault(column, _spill_dtype(values))
+                if not np.can_cast(raw.dtype, spill_dtypes[column], casting='same_kind') or \
+                        raw.dtype.itemsize > spill_dtypes[column].itemsize:
+                    raise ValueError(f"Column '{column}' changed from {spill_dtypes[column]} to {raw.dtype} "
+                                     f"between chunks; it would be truncated")
+                if column == 'user_id' and len(raw):
+                    id_low, id_high = min(id_low, int(raw.min())), max(id_high, int(raw.max()))
+                raw.astype(spill_dtypes[column], copy=False).tofile(handles[column])
+            n_events += len(chunk)
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    def spilled(column):
+        if n_events == 0:
+            return np.empty(0, dtype=spill_dtypes.get(column, np.int64))
+        return np.memmap(os.path.join(spill_dir, column + '.bin'),
+                         dtype=spill_dtypes[column], mode='r', shape=(n_events,))
+
+    # Sort permutation from the key columns only
+    order = np.lexsort((np.asarray(spilled('event_time')), np.asarray(spilled('user_id'))))
+
+    out_dtypes = {}
+    for column in columns:
+        dtype = spill_dtypes.get(column, np.dtype(np.int64))
+        if column in categories:
+            dtype = _code_dtype(len(categories[column][0]))
+        elif column == 'event_time':
+            dtype = np.dtype('datetime64[ns]')
+        elif column == 'user_id':
+            dtype = _id_dtype(id_low, id_high)
+        out_dtypes[column] = dtype
+
+        src = spilled(column)
+        dst = np.lib.format.open_memmap(os.path.join(store_dir, column + '.npy'),
+                                        mode='w+', dtype=dtype, shape=(n_events,))
+        for start in range(0, n_events, GATHER_BLOCK):
+            block = np.asarray(src[order[start:start + GATHER_BLOCK]])
+            dst[start:start + GATHER_BLOCK] = block.view(dtype) if column == 'event_time' else block
+        dst.flush()
+        del src, dst
+
+    # Per-user offsets: events of users[i] live in [offsets[i], offsets[i + 1])
+    user_col = np.load(os.path.join(store_dir, 'user_id.npy'), mmap_mode='r')
+    if n_events:
+        starts = np.flatnonzero(np.diff(user_col)) + 1
+        starts = np.concatenate(([0], starts))
+    else:
+        starts = np.empty(0, dtype=np.int64)
+    users = np.asarray(user_col[starts])
+    offsets = np.append(starts, n_events).astype(np.int64)
+    np.save(os.path.join(store_dir, USERS_FILE), users)
+    np.save(os.path.join(store_dir, OFFSETS_FILE), offsets)
+    del user_col, order
+
+    shutil.rmtree(spill_dir)
+
+    meta = {
+        'n_events': int(n_events),
+        'n_users': int(len(users)),
+        'columns': {c: str(out_dtypes[c]) for c in columns},
+        'categories': {c: cats for c, (cats, _) in categories.items()},
+        'source': signature,
+    }
+    with open(os.path.join(store_dir, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    return JourneyStore(store_dir)
+
+
+def store_is_current(store_dir, csv_path, columns=None):
+    """
+    True when store_dir holds a complete store built from the current csv_path
+    (and, when given, carrying every one of columns)
+    """
+    meta_path = os.path.join(store_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if columns is not None and not set(columns) <= set(meta.get('columns', {})):
+        return False
+    return meta.get('source') == source_signature(csv_path)
+
+
+def ensure_store(csv_path, store_dir, columns=None, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB):
+    """
+    Open the store for csv_path, converting the CSV first if the store is missing or stale
+    """
+    if store_is_current(store_dir, csv_path, columns):
+        return JourneyStore(store_dir)
+    return build_store(csv_path, store_dir, columns=columns, memory_limit_mb=memory_limit_mb)
+
+
+class JourneyStore:
+    """
+    Read-only view over a sorted, memory-mapped event store.
+
+    Columns are opened lazily with mmap_mode='r', so slicing a user's journey
+    touches only that user's pages and never copies.
+    """
+
+    def __init__(self, store_dir):
+        self.path = store_dir
+        with open(os.path.join(store_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.users = np.load(os.path.join(store_dir, USERS_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(store_dir, OFFSETS_FILE), mmap_mode='r')
+        self.categories = self.meta['categories']
+        self._columns = {}
+
+    def __len__(self):
+        return self.meta['n_events']
+
+    @property
+    def n_users(self):
+        return self.meta['n_users']
+
+    @property
+    def column_names(self):
+        return list(self.meta['columns'])
+
+    @property
+    def channels(self):
+        """Touchpoint names in event_type code order"""
+        return list(self.categories['event_type'])
+
+    def column(self, name):
+        if name not in self._columns:
+            if name not in self.meta['columns']:
+                raise KeyError(f"Column '{name}' is not in the journey store")
+            self._columns[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self._columns[name]
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def user_position(self, user_id):
+        """Index of user_id in self.users, or -1 when the user has no events"""
+        pos = int(np.searchsorted(self.users, user_id))
+        if pos < len(self.users) and self.users[pos] == user_id:
+            return pos
+        return -1
+
+    def user_bounds(self, user_id):
+        pos = self.user_position(user_id)
+        if pos < 0:
+            return 0, 0
+        return int(self.offsets[pos]), int(self.offsets[pos + 1])
+
+    def journey(self, user_id, columns=None):
+        """
+        Zero-copy slices of one user's time-ordered events, keyed by column
+        """
+        start, end = self.user_bounds(user_id)
+        names = columns or self.column_names
+        return {name: self.column(name)[start:end] for name in names}
+
+    def decode(self, name, codes):
+        """Map categorical codes back to their labels (None for missing, -1, codes)"""
+        labels = np.append(np.asarray(self.categories[name], dtype=object), None)
+        codes = np.asarray(codes)
+        return labels[np.where(codes < 0, len(labels) - 1, codes)]
+
+    def user_index(self):
+        """Store position of the user owning each event (int32 when it fits)"""
+        counts = np.diff(self.offsets)
+        dtype = np.int32 if self.n_users < np.iinfo(np.int32).max else np.int64
+        return np.repeat(np.arange(self.n_users, dtype=dtype), counts)
+
+    def frame(self, columns=None):
+        """
+        pandas view of the store with categoricals restored
+        """
+        names = columns or self.column_names
+        data = {}
+        for name in names:
+            values = self.column(name)
+            if name in self.categories:
+                data[name] = pd.Categorical.from_codes(np.asarray(values, dtype=np.int32),
+                                                       categories=self.categories[name])
+            else:
+                data[name] = values
+        return pd.DataFrame(data, copy=False)
+
+
+class MemoryStore(JourneyStore):
+    """
+    In-memory store over already sorted column arrays (same interface as
+    JourneyStore, for small event sets that are not worth writing to disk)
+
+    columns: dict of name -> array sorted by (user_id, event_time); categorical
+    columns hold codes into categories[name].
+    """
+
+    def __init__(self, columns, categories):
+        self.path = None
+        self.categories = {name: list(labels) for name, labels in categories.items()}
+        self._columns = {name: np.asarray(values) for name, values in columns.items()}
+        user_col = self._columns['user_id']
+        n_events = len(user_col)
+        starts = np.flatnonzero(np.diff(user_col)) + 1 if n_events else np.empty(0, dtype=np.int64)
+        starts = np.concatenate(([0], starts)).astype(np.int64) if n_events else starts
+        self.users = user_col[starts]
+        self.offsets = np.append(starts, n_events).astype(np.int64)
+        self.meta = {
+            'n_events': n_events,
+            'n_users': len(starts),
+            'columns': {name: str(values.dtype) for name, values in self._columns.items()},
+            'categories': self.categories,
+            'source': None,
+        }
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+from .ingest import EVENT_COLUMNS, EVENT_TYPES
+
+# Knob defaults, roughly matching the shape of the November 2019 sample
+DEFAULT_SESSIONS_PER_USER = 2.8
+DEFAULT_JOURNEY_MEAN = 3.5         # events per session
+DEFAULT_JOURNEY_SIGMA = 0.8        # lognormal spread of session lengths
+DEFAULT_BOT_SHARE = 0.001
+DEFAULT_PURCHASE_RATE = 0.06       # sessions that end in a purchase
+BOT_SESSIONS = (63, 300)           # bots fall above the 62-session threshold
+START_TIME = '2019-11-01'
+SPAN_DAYS = 30
+USERS_PER_BLOCK = 200_000
+
+FIRST_USER_ID = 500_000_000
+N_PRODUCTS = 50_000
+CATEGORY_CODES = ['electronics.smartphone', 'electronics.audio.headphone', 'appliances.kitchen.washer',
+                  'computers.notebook', 'apparel.shoes', 'furniture.living_room.sofa', 'auto.accessories',
+                  'kids.toys', None]
+BRANDS = ['samsung', 'apple', 'xiaomi', 'huawei', 'lg', 'sony', 'bosch', 'lenovo', 'nike', None]
+
+# Share of non-purchase events per touch channel: view, cart, then extra channels
+VIEW_SHARE = 0.85
+CART_SHARE = 0.1
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_HEX = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def channel_names(n_channels=len(EVENT_TYPES)):
+    """Event type alphabet: view, cart, purchase, then channel_3, channel_4, ..."""
+    if n_channels < len(EVENT_TYPES):
+        raise ValueError(f"n_channels must be at least {len(EVENT_TYPES)}")
+    return list(EVENT_TYPES) + [f'channel_{i}' for i in range(len(EVENT_TYPES), n_channels)]
+
+
+def _touch_probabilities(n_channels):
+    """Probabilities over the touch (non-purchase) channels in channel_names order"""
+    extra = n_channels - len(EVENT_TYPES)
+    if extra == 0:
+        return np.array([VIEW_SHARE, 1 - VIEW_SHARE, 0.0])
+    rest = (1 - VIEW_SHARE - CART_SHARE) / extra
+    return np.array([VIEW_SHARE, CART_SHARE, 0.0] + [rest] * extra)
+
+
+def _hex_ids(values):
+    """uint64 values as 16-character lowercase hex strings, without a Python loop"""
+    shifts = np.arange(60, -4, -4, dtype=np.uint64)
+    nibbles = (values[:, None] >> shifts) & np.uint64(0xF)
+    return _HEX[nibbles].view('S16').ravel().astype(str)
+
+
+def _format_times(seconds):
+    """Epoch seconds as EVENT_TIME_FORMAT strings (ISO text with the 'T' patched out)"""
+    text = np.datetime_as_string(seconds.astype('datetime64[s]')).astype('S19')
+    chars = text.view(np.uint8).reshape(-1, 19)
+    chars[:, 10] = ord(' ')
+    return np.char.add(chars.ravel().view('S19').astype(str), ' UTC')
+
+
+def _catalog(seed):
+    rng = np.random.default_rng([seed, 0])
+    return {
+        'product_id': 1_000_000 + np.arange(N_PRODUCTS, dtype=np.int64),
+        'category': rng.integers(0, len(CATEGORY_CODES), N_PRODUCTS),
+        'brand': rng.integers(0, len(BRANDS), N_PRODUCTS),
+        'price': np.round(rng.lognormal(4.5, 1.0, N_PRODUCTS), 2),
+    }
+
+
+def events_per_user(sessions_per_user=DEFAULT_SESSIONS_PER_USER, journey_mean=DEFAULT_JOURNEY_MEAN,
+                    bot_share=DEFAULT_BOT_SHARE):
+    """Expected events per user for the given knobs"""
+    bot_sessions = sum(BOT_SESSIONS) / 2
+    return journey_mean * ((1 - bot_share) * sessions_per_user + bot_share * bot_sessions)
+
+
+def users_for_events(n_events, **knobs):
+    """Number of users that yields about n_events events"""
+    return max(1, int(round(n_events / events_per_user(**knobs))))
+
+
+def generate_block(block, n_users, seed=0, n_channels=len(EVENT_TYPES),
+                   sessions_per_user=DEFAULT_SESSIONS_PER_USER, journey_mean=DEFAULT_JOURNEY_MEAN,
+                   journey_sigma=DEFAULT_JOURNEY_SIGMA, bot_share=DEFAULT_BOT_SHARE,
+                   purchase_rate=DEFAULT_PURCHASE_RATE, catalog=None):
+    """
+    Events for users [block * USERS_PER_BLOCK, ...) as a raw-schema DataFrame
+    sorted by event_time. Each block draws from its own (seed, block) random
+    stream, so the same seed and knobs always give the same events.
+    """
+    first = block * USERS_PER_BLOCK
+    users = np.arange(first, min(first + USERS_PER_BLOCK, n_users), dtype=np.int64)
+    rng = np.random.default_rng([seed, block + 1])
+    catalog = catalog or _catalog(seed)
+
+    is_bot = rng.random(len(users)) < bot_share
+    sessions = np.where(is_bot, rng.integers(BOT_SESSIONS[0], BOT_SESSIONS[1] + 1, len(users)),
+                        1 + rng.poisson(max(sessions_per_user - 1, 0), len(users)))
+    session_user = np.repeat(users, sessions)
+    session_rank = np.arange(len(session_user)) - np.repeat(np.cumsum(sessions) - sessions, sessions)
+
+    # Lognormal session lengths with the requested mean
+    mu = np.log(journey_mean) - journey_sigma ** 2 / 2
+    lengths = np.maximum(1, np.rint(rng.lognormal(mu, journey_sigma, len(session_user)))).astype(np.int64)
+    event_session = np.repeat(np.arange(len(session_user)), lengths)
+    n_events = len(event_session)
+    session_end = np.cumsum(lengths) - 1
+
+    start = np.datetime64(START_TIME, 's').astype(np.int64)
+    session_start = start + rng.integers(0, SPAN_DAYS * 86_400, len(session_user))
+    gaps = rng.exponential(60.0, n_events).astype(np.int64)
+    gaps[session_end - lengths + 1] = 0
+    offsets_in_session = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[session_end - lengths + 1], lengths)
+    event_time = session_start[event_session] + offsets_in_session
+
+    names = channel_names(n_channels)
+    touch_p = _touch_probabilities(n_channels)
+    event_type = rng.choice(len(names), size=n_events, p=touch_p)
+    purchased = rng.random(len(session_user)) < purchase_rate
+    event_type[session_end[purchased]] = EVENT_TYPES.index('purchase')
+
+    # Sessions mostly revolve around one product
+    session_product = rng.integers(0, N_PRODUCTS, len(session_user))
+    product = np.where(rng.random(n_events) < 0.7, session_product[event_session],
+                       rng.integers(0, N_PRODUCTS, n_events))
+
+    session_keys = (session_user.astype(np.uint64) << np.uint64(16)) | session_rank.astype(np.uint64)
+    session_ids = _hex_ids((session_keys ^ np.uint64(seed)) * _MIX)
+
+    order = np.argsort(event_time, kind='stable')
+    event_session, event_time, event_type, product = (a[order] for a in (event_session, event_time,
+                                                                         event_type, product))
+    frame = pd.DataFrame({
+        'event_time': _format_times(event_time),
+        'event_type': np.asarray(names, dtype=object)[event_type],
+        'product_id': catalog['product_id'][product],
+        'category_id': 2_053_013_552_226_107_603 + catalog['category'][product],
+        'category_code': np.asarray(CATEGORY_CODES, dtype=object)[catalog['category'][product]],
+        'brand': np.asarray(BRANDS, dtype=object)[catalog['brand'][product]],
+        'price': catalog['price'][product],
+        'user_id': FIRST_USER_ID + session_user[event_session],
+        'user_session': session_ids[event_session],
+    }, columns=EVENT_COLUMNS)
+    return frame
+
+
+def generate_events(n_users, seed=0, **knobs):
+    """All synthetic events for n_users users as one DataFrame"""
+    catalog = _catalog(seed)
+    n_blocks = -(-n_users // USERS_PER_BLOCK)
+    return pd.concat([generate_block(b, n_users, seed, catalog=catalog, **knobs) for b in range(n_blocks)],
+                     ignore_index=True)
+
+
+def write_events_csv(path, n_users, seed=0, **knobs):
+    """
+    Stream synthetic events for n_users users to a CSV in the Kaggle layout,
+    one user block at a time. Returns the number of events written.
+    """
+    catalog = _catalog(seed)
+    n_blocks = -(-n_users // USERS_PER_BLOCK)
+    written = 0
+    for block in range(n_blocks):
+        frame = generate_block(block, n_users, seed, catalog=catalog, **knobs)
+        frame.to_csv(path, mode='w' if block == 0 else 'a', header=block == 0, index=False)
+        written += len(frame)
+    return written
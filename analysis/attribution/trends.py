@@ -0,0 +1,126 @@
+import numpy as np
+
+from .bootstrap import journey_credit, removal_shares, replicate_conversion_probabilities, replicate_shares
+from .export import EXPORT_CHANNELS, channel_shares
+from .journeys import NS_PER_DAY, purchase_journey_bounds
+from .markov import _removal_masks, markov_journeys, path_transition_incidence
+from .paths import compress_paths
+from .rules import flatten_touchpoints, run_rule_models
+from .shapley import journey_masks
+
+LOOKBACK_WINDOWS = (7, 14, 30)
+
+# Trailing days summed into each point of the rolling daily series
+ROLLING_WINDOW_DAYS = 7
+
+
+def lookback_revenue(store, lookback_days, keep_user=None, models=None, engine=None):
+    """
+    Channel x model revenue when journeys only reach lookback_days back from
+    each purchase. engine (a ShapleyEngine, shared across windows so its
+    coalition cache is reused) adds a 'shapley' column.
+    """
+    bounds = purchase_journey_bounds(store, keep_user=keep_user, lookback_days=lookback_days)
+    touches = flatten_touchpoints(store, bounds)
+    paths = compress_paths(touches)
+    revenue = run_rule_models(touches, models=models, paths=paths)
+    if engine is not None:
+        revenue['shapley'] = engine.attribute(journey_masks(paths), paths['value'])
+    return revenue, len(bounds['purchase'])
+
+
+def lookback_comparison(store, windows=LOOKBACK_WINDOWS, keep_user=None, models=None, engine=None):
+    """
+    lookback_windows export block: journey count and every model's channel
+    shares (percent) per window, keyed by the window length in days
+    """
+    out = {}
+    for days in windows:
+        revenue, n_journeys = lookback_revenue(store, days, keep_user, models, engine)
+        shares = channel_shares(revenue)
+        out[str(days)] = {
+            'journeys': n_journeys,
+            'models': {model: shares[model].to_dict() for model in shares.columns},
+        }
+    return out
+
+
+def day_range(store):
+    """(first midnight in ns, number of days) spanned by the store's events"""
+    event_times = np.asarray(store['event_time']).view(np.int64)
+    if len(event_times) == 0:
+        return 0, 0
+    origin = event_times.min() // NS_PER_DAY * NS_PER_DAY
+    return int(origin), int((event_times.max() - origin) // NS_PER_DAY) + 1
+
+
+def group_totals(values, groups, n_groups):
+    """(n_groups, columns) sums of (rows, columns) values grouped by each row's group (e.g. day)"""
+    values = np.asarray(values, dtype=np.float64)
+    # Rows are explicit so no groups (e.g. no journeys) still keeps the column count
+    n_columns = int(np.prod(values.shape[1:], dtype=np.int64)) if values.ndim > 1 else 1
+    values = values.reshape(len(groups), n_columns)
+    cells = (np.asarray(groups, dtype=np.int64)[:, None] * n_columns + np.arange(n_columns)).ravel()
+    return np.bincount(cells, weights=values.ravel(), minlength=n_groups * n_columns).reshape(n_groups, n_columns)
+
+
+def rolling_sum(daily, window):
+    """
+    Trailing window-day sums for every day: one running total, and each day
+    subtracts the total from window days earlier (no per-day recomputation)
+    """
+    running = np.zeros((len(daily) + 1,) + daily.shape[1:])
+    np.cumsum(daily, axis=0, out=running[1:])
+    ends = np.arange(1, len(daily) + 1)
+    return running[ends] - running[np.maximum(ends - window, 0)]
+
+
+def rolling_markov_shares(store, origin, n_days, window, keep_user=None, order=1):
+    """
+    (n_days, channels) Markov shares over the journeys that ended in each
+    trailing window: per-day transition counts are accumulated once, slid
+    with rolling_sum and solved for every day in one batch
+    """
+    journeys = markov_journeys(store, keep_user=keep_user)
+    journeys['day'] = (journeys['end_time'] - origin) // NS_PER_DAY
+    paths = compress_paths(journeys, by=['converted', 'day'])
+    chain, transition, entry_path = path_transition_incidence(paths, order)
+
+    weights = paths['count'][entry_path]
+    cells = paths['day'][entry_path] * len(chain['count']) + transition
+    counts = np.bincount(cells, weights=weights, minlength=n_days * len(chain['count']))
+    counts = rolling_sum(counts.reshape(n_days, len(chain['count'])), window)
+    probs = replicate_conversion_probabilities(chain, counts, _removal_masks(chain, chain['channels']))
+    return removal_shares(probs), journeys['channels']
+
+
+def rolling_attribution(store, touches, keep_user=None, models=None, engine=None, markov_order=1,
+                        window=ROLLING_WINDOW_DAYS):
+    """
+    attribution_trends export block: for every day of the data, each model's
+    channel shares (percent) over the purchases of the trailing window days,
+    with the window's journey count and revenue. Columnar (one list per
+    series) for the dashboard's trend charts.
+    """
+    origin, n_days = day_range(store)
+    days = (touches['conversion_time'] - origin) // NS_PER_DAY
+    channels = list(touches['channels'])
+
+    series = {}
+    for model, credit in journey_credit(touches, models, engine).items():
+        series[model] = replicate_shares(rolling_sum(group_totals(credit, days, n_days), window), channels)
+    if markov_order:
+        markov, markov_channels = rolling_markov_shares(store, origin, n_days, window, keep_user, markov_order)
+        series['markov'] = replicate_shares(markov, list(markov_channels))
+
+    dates = np.datetime64(origin, 'ns').astype('datetime64[D]') + np.arange(n_days)
+    return {
+        'window_days': window,
+        'dates': [str(d) for d in dates],
+        'journeys': rolling_sum(np.bincount(days, minlength=n_days), window).astype(np.int64).tolist(),
+        'revenue': rolling_sum(group_totals(touches['value'], days, n_days), window)[:, 0].tolist(),
+        'models': {
+            model: {channel: shares[:, i].tolist() for i, channel in enumerate(EXPORT_CHANNELS)}
+            for model, shares in series.items()
+        },
+    }
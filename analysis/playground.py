@@ -1,58 +1,100 @@
-import pandas as pd
-import numpy as np
+import os
 
-# Load and clean bot data (silent processing)
-df = pd.read_csv('data/2019-Nov.csv')
-sessions_per_user = df.groupby('user_id')['user_session'].nunique()
-user_bot_flags = pd.cut(sessions_per_user, bins=[0, 27, 62, float('inf')], 
-                       labels=['human', 'suspicious', 'bot'], include_lowest=True)
+import pandas as pd
 
-user_flags_df = pd.DataFrame({
-    'user_id': sessions_per_user.index,
-    'bot_flag': user_bot_flags.values
-})
+from attribution import RunMetrics, session_summary, table_summary, transition_matrix
+from attribution.pipeline import AttributionPipeline
+
+# Worker processes for the sharded map-reduce mode (1 = serial, in-process)
+WORKERS = int(os.environ.get('ATTRIBUTION_WORKERS', '1'))
+
+# Markov chain order k (1-4): states are the last k touches of the journey
+MARKOV_ORDER = 1
+
+# Orders to size in the Markov order report (None = skip the extra chain builds)
+MARKOV_REPORT_ORDERS = [1, 2, 3, 4]
+
+# Lookback window in days for every purchase journey (None = all earlier events)
+LOOKBACK_DAYS = None
+
+# Touchpoint unit: 'event' (every raw event) or 'session' (one touch per
+# session, labelled by its deepest action; sessions also break after
+# SESSION_TIMEOUT_MINUTES of inactivity)
+TOUCHPOINT_UNIT = 'event'
+SESSION_TIMEOUT_MINUTES = 30
+
+# Poisson-bootstrap replicates for the channel-share confidence intervals (0 = off)
+BOOTSTRAP_REPLICATES = 1000
+
+# Per-stage wall/CPU time, peak memory and row counts, exported as run_metrics;
+# ATTRIBUTION_PROFILE=1 adds cProfile and tracemalloc samples per stage
+PROFILE = os.environ.get('ATTRIBUTION_PROFILE', '0') == '1'
+metrics = RunMetrics(profile=PROFILE, trace_memory=PROFILE, profile_dir='output/profiles' if PROFILE else None)
+
+# Every stage's output is cached on disk under a hash of its inputs and
+# parameters: changing MARKOV_ORDER only reruns the Markov stage and the export
+pipeline = AttributionPipeline(
+    'data/2019-Nov.csv', 'data/journey-store', 'data/stage-cache',
+    params={
+        'sharded': {'workers': WORKERS},
+        'sessions': {'touchpoint_unit': TOUCHPOINT_UNIT, 'timeout_minutes': SESSION_TIMEOUT_MINUTES},
+        'journeys': {'lookback_days': LOOKBACK_DAYS},
+        'markov': {'order': MARKOV_ORDER, 'report_orders': MARKOV_REPORT_ORDERS},
+        'bootstrap': {'replicates': BOOTSTRAP_REPLICATES},
+        'export': {'output': os.path.join('output', 'attribution-results.json'),
+                   'cube_output': os.path.join('output', 'attribution-cube.json')},
+    },
+    metrics=metrics,
+)
 
-df_clean = df.merge(user_flags_df, on='user_id', how='left')
-df_clean = df_clean[df_clean['bot_flag'] != 'bot']
-df_clean['event_time'] = pd.to_datetime(df_clean['event_time'])
+# Load and clean bot data (silent processing)
+# One-time conversion into a sorted, memory-mapped journey store; later runs
+# open the store directly and skip CSV parsing
+store = pipeline.run('ingest')
+
+# Distinct sessions per user in one blocked pass over the memory-mapped store;
+# bot users are dropped by store position instead of merging a flag onto every event
+clean = pipeline.run('clean')
+human_user = clean['keep_user']
+bot_report = clean['report']
+print(f"Flagged {bot_report['bot']:,} bots and {bot_report['suspicious']:,} suspicious users "
+      f"of {bot_report['users']:,}; user mask saves an estimated "
+      f"{bot_report['estimated_saved_bytes'] / 1e6:,.1f} MB over a merged copy")
+
+# Session mode: sessionized with vectorized time diffs over the sorted store,
+# so every model below runs on much shorter session-level paths
+if TOUCHPOINT_UNIT == 'session':
+    sessions = session_summary(pipeline.run('sessions'))
+    print(f"{sessions['sessions']:,} sessions ({sessions['avg_events_per_session']:.1f} events each); "
+          "dominant actions: " + ", ".join(f"{a} {n:,}" for a, n in sessions['dominant_actions'].items()))
 
 # ATTRIBUTION ANALYSIS
 print("=== ATTRIBUTION MODELS ===")
 
 # Build purchase journey dataset
-purchase_events = df_clean[df_clean['event_type'] == 'purchase'][['user_id', 'price', 'event_time']].copy()
-attribution_data = []
-
-for user_id in purchase_events['user_id'].unique()[:1000]:  # Sample for speed
-    user_journey = df_clean[df_clean['user_id'] == user_id].sort_values('event_time')
-    user_purchases = user_journey[user_journey['event_type'] == 'purchase']
-    
-    for _, purchase in user_purchases.iterrows():
-        journey_before = user_journey[user_journey['event_time'] <= purchase['event_time']]
-        
-        if len(journey_before) > 1:
-            first_touch = journey_before.iloc[0]
-            last_touch = journey_before.iloc[-2]
-            
-            attribution_data.append({
-                'user_id': user_id,
-                'purchase_value': purchase['price'],
-                'first_touch_type': first_touch['event_type'],
-                'last_touch_type': last_touch['event_type'],
-                'journey_length': len(journey_before) - 1,
-                'journey_days': (purchase['event_time'] - first_touch['event_time']).days
-            })
-
-attribution_df = pd.DataFrame(attribution_data)
+# Every purchase by every (non-bot) user, located with sort order + user offsets
+journeys = pipeline.run('journeys')
+attribution_df = journeys['attribution_df']
 
 # Key insights
 print(f"Analyzed {len(attribution_df)} purchase journeys")
 print(f"Avg journey: {attribution_df['journey_length'].mean():.1f} touchpoints over {attribution_df['journey_days'].mean():.1f} days")
 print(f"Total revenue: ${attribution_df['purchase_value'].sum():,.2f}")
 
+# RULE-BASED ATTRIBUTION
+# One segment-reduction pass per model over the flat touchpoint arrays
+touches = journeys['touches']
+print(f"Flattened {len(touches['channel']):,} touchpoints across {len(attribution_df):,} journeys")
+
+# Journeys collapse to far fewer distinct paths; sequence-only models run once
+# per path weighted by its journey count and total revenue
+path_stats = journeys['path_stats']
+print(f"Compressed to {path_stats['paths']:,} distinct paths ({path_stats['ratio']:.1f}x fewer)")
+rule_revenue = pipeline.run('rule_models')
+
 #FIRST-TOUCH vs LAST-TOUCH ATTRIBUTION
-first_touch_revenue = attribution_df.groupby('first_touch_type')['purchase_value'].sum()
-last_touch_revenue = attribution_df.groupby('last_touch_type')['purchase_value'].sum()
+first_touch_revenue = rule_revenue['first_touch']
+last_touch_revenue = rule_revenue['last_touch']
 
 print("\n=== FIRST-TOUCH vs LAST-TOUCH ===")
 print("First-touch attribution:", first_touch_revenue.round(2))
@@ -61,34 +103,20 @@ print("Last-touch attribution:", last_touch_revenue.round(2))
 # LINEAR ATTRIBUTION
 print("\n=== LINEAR ATTRIBUTION ===")
 
-linear_attribution_data = []
-
-for _, row in attribution_df.iterrows():
-    revenue_per_touchpoint = row['purchase_value'] / row['journey_length']
-    
-    # First touchpoint gets credit
-    linear_attribution_data.append({
-        'touchpoint_type': row['first_touch_type'],
-        'attributed_revenue': revenue_per_touchpoint,
-        'journey_id': row['user_id']
-    })
-    
-    # Last touchpoint gets credit (if different from first)
-    if row['journey_length'] > 1 and row['first_touch_type'] != row['last_touch_type']:
-        linear_attribution_data.append({
-            'touchpoint_type': row['last_touch_type'],
-            'attributed_revenue': revenue_per_touchpoint,
-            'journey_id': row['user_id']
-        })
-
-linear_df = pd.DataFrame(linear_attribution_data)
-linear_revenue = linear_df.groupby('touchpoint_type')['attributed_revenue'].sum()
+# Equal credit to every touchpoint in the journey
+linear_revenue = rule_revenue['linear']
+
+# Recency- and position-weighted variants
+time_decay_revenue = rule_revenue['time_decay']
+position_based_revenue = rule_revenue['position_based']
 
 # ATTRIBUTION COMPARISON 
 attribution_comparison = pd.DataFrame({
     'First_Touch': first_touch_revenue,
     'Last_Touch': last_touch_revenue, 
-    'Linear': linear_revenue
+    'Linear': linear_revenue,
+    'Time_Decay': time_decay_revenue,
+    'Position_Based': position_based_revenue
 }).fillna(0)
 
 print("Linear attribution:", linear_revenue.round(2))
@@ -96,291 +124,96 @@ print("\n=== ATTRIBUTION MODEL COMPARISON ===")
 print(attribution_comparison.round(2))
 
 # Show percentage differences
-for model in ['Last_Touch', 'Linear']:
+for model in ['Last_Touch', 'Linear', 'Time_Decay', 'Position_Based']:
     attribution_comparison[f'{model}_vs_First_%'] = (
         (attribution_comparison[model] - attribution_comparison['First_Touch']) / 
         attribution_comparison['First_Touch'] * 100
     ).round(1)
 
 print("\nPercentage differences from First-Touch:")
-print(attribution_comparison[['First_Touch', 'Last_Touch_vs_First_%', 'Linear_vs_First_%']])
+print(attribution_comparison[['First_Touch', 'Last_Touch_vs_First_%', 'Linear_vs_First_%',
+                              'Time_Decay_vs_First_%', 'Position_Based_vs_First_%']])
 
 # SHAPLEY VALUE ATTRIBUTION
 print("\n=== SHAPLEY VALUE ATTRIBUTION ===")
 
-from itertools import combinations, permutations
-import math
-
-def calculate_shapley_values(journey_touchpoints, conversion_value):
-    """
-    Calculate Shapley values for touchpoints in a customer journey
-    Based on marginal contribution across all possible coalitions
-    """
-    touchpoints = list(set(journey_touchpoints))  # Unique touchpoints
-    n = len(touchpoints)
-    
-    if n == 1:
-        return {touchpoints[0]: conversion_value}
-    
-    shapley_values = {tp: 0 for tp in touchpoints}
-    
-    # For each touchpoint, calculate its marginal contribution
-    for touchpoint in touchpoints:
-        marginal_contributions = []
-        
-        # Consider all possible coalitions without this touchpoint
-        other_touchpoints = [tp for tp in touchpoints if tp != touchpoint]
-        
-        for r in range(len(other_touchpoints) + 1):
-            for coalition in combinations(other_touchpoints, r):
-                coalition = list(coalition)
-                
-                # Conversion probability with coalition
-                prob_without = conversion_probability(coalition)
-                
-                # Conversion probability with coalition + touchpoint
-                prob_with = conversion_probability(coalition + [touchpoint])
-                
-                # Marginal contribution
-                marginal_contribution = prob_with - prob_without
-                
-                # Weight by coalition size (Shapley formula)
-                weight = (math.factorial(len(coalition)) * 
-                         math.factorial(n - len(coalition) - 1)) / math.factorial(n)
-                
-                marginal_contributions.append(weight * marginal_contribution)
-        
-        shapley_values[touchpoint] = sum(marginal_contributions) * conversion_value
-    
-    return shapley_values
-
-def conversion_probability(touchpoint_set):
-    """
-    Simplified conversion probability based on touchpoint types
-    In reality, this would be learned from data
-    """
-    if not touchpoint_set:
-        return 0.0
-    
-    # Business logic: different touchpoints have different conversion impacts
-    weights = {'view': 0.3, 'cart': 0.6, 'purchase': 1.0}
-    
-    # Probability increases with touchpoint diversity and strength
-    total_weight = sum(weights.get(tp, 0.1) for tp in set(touchpoint_set))
-    
-    # Diminishing returns formula
-    return min(0.95, 1 - math.exp(-total_weight / 2))
-
-# Apply Shapley attribution to sample journeys
+# Coalitions are channel bitmasks: the characteristic function runs once per
+# distinct coalition and the Shapley vector once per distinct touchpoint set,
+# then is scaled by the total revenue of the journeys sharing that set.
+# Touchpoint sets above 15 channels switch to Monte Carlo permutation sampling.
+# The characteristic function is learned: each touchpoint set's conversion
+# rate over all journeys (converting or not), smoothed toward a logistic fit
+# and read from a table indexed by the coalition's bitmask.
 print("Calculating Shapley values for purchase journeys...")
 
-shapley_results = []
-sample_journeys = attribution_df.head(100)  # Sample for demo
-
-for _, row in sample_journeys.iterrows():
-    # Create journey touchpoint sequence
-    journey = [row['first_touch_type']]
-    if row['journey_length'] > 1:
-        journey.append(row['last_touch_type'])
-    
-    # Calculate Shapley values
-    shapley_values = calculate_shapley_values(journey, row['purchase_value'])
-    
-    # Store results
-    for touchpoint, value in shapley_values.items():
-        shapley_results.append({
-            'touchpoint_type': touchpoint,
-            'shapley_value': value,
-            'journey_id': row['user_id']
-        })
-
-shapley_df = pd.DataFrame(shapley_results)
-shapley_revenue = shapley_df.groupby('touchpoint_type')['shapley_value'].sum()
-
+shapley = pipeline.run('shapley')
+shapley_revenue = shapley['revenue']
+if shapley['table'] is not None:
+    learned = table_summary(shapley['table'], store.channels)
+    print(f"Conversion table: {learned['coalitions']} touchpoint sets from {learned['journeys']:,} journeys "
+          f"({learned['conversions']:,} converting), logistic fallback " +
+          ", ".join(f"{name} {coef:+.2f}" for name, coef in learned['logistic'].items()))
+if shapley['stats']:
+    print(f"Distinct touchpoint sets: {shapley['stats']['vector_calls']}, "
+          f"coalitions evaluated: {shapley['stats']['value_calls']}")
 print("Shapley Value Attribution:")
 print(shapley_revenue.round(2))
 
 # MARKOV CHAIN ATTRIBUTION 
 print("\n=== MARKOV CHAIN ATTRIBUTION ===")
 
-from collections import defaultdict, Counter
-
-def build_markov_chain(df_clean, sample_size=5000):
-    """
-    Build transition probability matrix from customer journeys
-    """
-    # Get sample of user journeys for Markov analysis
-    sample_users = df_clean['user_id'].unique()[:sample_size]
-    sample_data = df_clean[df_clean['user_id'].isin(sample_users)]
-    
-    transitions = []
-    conversions = defaultdict(int)
-    total_transitions = defaultdict(int)
-    
-    print(f"Building Markov chain from {len(sample_users)} users...")
-    
-    for user_id in sample_users:
-        user_journey = sample_data[sample_data['user_id'] == user_id].sort_values('event_time')
-        
-        if len(user_journey) < 2:
-            continue
-            
-        journey_events = user_journey['event_type'].tolist()
-        
-        # Add START state
-        journey_path = ['START'] + journey_events
-        
-        # Count transitions
-        for i in range(len(journey_path) - 1):
-            from_state = journey_path[i]
-            to_state = journey_path[i + 1]
-            
-            transitions.append((from_state, to_state))
-            total_transitions[from_state] += 1
-            
-            # Track conversions
-            if to_state == 'purchase':
-                conversions[from_state] += 1
-    
-    # Calculate transition probabilities
-    transition_probs = {}
-    for from_state, to_state in transitions:
-        if from_state not in transition_probs:
-            transition_probs[from_state] = {}
-        if to_state not in transition_probs[from_state]:
-            transition_probs[from_state][to_state] = 0
-        transition_probs[from_state][to_state] += 1
-    
-    # Normalize to probabilities
-    for from_state in transition_probs:
-        total = sum(transition_probs[from_state].values())
-        for to_state in transition_probs[from_state]:
-            transition_probs[from_state][to_state] /= total
-    
-    return transition_probs, conversions, total_transitions
-
-def calculate_removal_effect(transition_probs, touchpoint_to_remove):
-    """
-    Calculate what happens to conversion probability when we remove a touchpoint
-    """
-    # Create modified transition matrix without the touchpoint
-    modified_probs = {}
-    
-    for from_state in transition_probs:
-        if from_state == touchpoint_to_remove:
-            continue
-            
-        modified_probs[from_state] = {}
-        total_remaining = 0
-        
-        # Redistribute probabilities, excluding removed touchpoint
-        for to_state, prob in transition_probs[from_state].items():
-            if to_state != touchpoint_to_remove:
-                modified_probs[from_state][to_state] = prob
-                total_remaining += prob
-        
-        # Renormalize
-        if total_remaining > 0:
-            for to_state in modified_probs[from_state]:
-                modified_probs[from_state][to_state] /= total_remaining
-    
-    return modified_probs
-
-def calculate_conversion_probability(transition_probs, max_steps=10):
-    """
-    Calculate probability of reaching 'purchase' from 'START'
-    """
-    # Simple approximation using matrix powers
-    current_state_probs = {'START': 1.0}
-    conversion_prob = 0.0
-    
-    for step in range(max_steps):
-        next_state_probs = defaultdict(float)
-        
-        for current_state, current_prob in current_state_probs.items():
-            if current_state == 'purchase':
-                conversion_prob += current_prob
-                continue
-                
-            if current_state in transition_probs:
-                for next_state, trans_prob in transition_probs[current_state].items():
-                    next_state_probs[next_state] += current_prob * trans_prob
-        
-        current_state_probs = dict(next_state_probs)
-        
-        # Stop if probabilities converge
-        if sum(current_state_probs.values()) < 0.001:
-            break
-    
-    return conversion_prob
-
-# Build the Markov chain
-transition_probs, conversions, total_transitions = build_markov_chain(df_clean)
+# Transition counts for every (non-bot) user: journeys run START -> touches ->
+# CONVERSION, unconverted tails end in NULL; each distinct path is counted once
+# and weighted by the number of journeys that follow it. The exact
+# absorbing-chain solve gives the baseline and every channel's removal in one batch
+markov = pipeline.run('markov')
+
+# State counts and memory per order, to choose the highest affordable order
+if markov['orders'] is not None:
+    print("Markov order report:")
+    print(markov['orders'][['states', 'transitions', 'chain_bytes', 'solve_bytes']])
+
+markov_chain = markov['chain']
+transition_probs = transition_matrix(markov_chain)
+print(f"\nBuilt order-{MARKOV_ORDER} Markov chain from {int(human_user.sum()):,} users "
+      f"({int(markov_chain['count'].sum()):,} transitions, {markov_chain['n_transient']} states)")
 
 # Show transition probabilities
 print("\nKey Transition Probabilities:")
 for from_state in ['START', 'view', 'cart']:
-    if from_state in transition_probs:
+    if from_state in transition_probs.index:
         print(f"From {from_state}:")
-        for to_state, prob in sorted(transition_probs[from_state].items(), 
-                                   key=lambda x: x[1], reverse=True)[:3]:
+        for to_state, prob in transition_probs.loc[from_state].nlargest(3).items():
             print(f"  → {to_state}: {prob:.3f}")
 
-# Calculate baseline conversion probability
-baseline_conversion = calculate_conversion_probability(transition_probs)
+baseline_conversion, markov_effects = markov['baseline'], markov['effects']
 print(f"\nBaseline conversion probability: {baseline_conversion:.4f}")
 
-# Calculate removal effects (Markov attribution)
-touchpoints = ['view', 'cart']
-markov_attribution = {}
-
-for touchpoint in touchpoints:
-    # Calculate conversion probability without this touchpoint
-    modified_probs = calculate_removal_effect(transition_probs, touchpoint)
-    new_conversion = calculate_conversion_probability(modified_probs)
-    
-    # Attribution = loss in conversion probability when removed
-    attribution_value = baseline_conversion - new_conversion
-    markov_attribution[touchpoint] = attribution_value
-    
+for touchpoint, row in markov_effects.iterrows():
     print(f"\nRemoving '{touchpoint}':")
-    print(f"  Conversion drops to: {new_conversion:.4f}")
-    print(f"  Attribution value: {attribution_value:.4f}")
-
-# Fix the Markov revenue calculation
-print(f"\n=== MARKOV ATTRIBUTION RESULTS (FIXED) ===")
-
-# Only use positive attribution values (cart removal effect)
-valid_attribution = {k: max(0, v) for k, v in markov_attribution.items()}
-total_attribution = sum(valid_attribution.values())
-
-if total_attribution > 0:
-    sample_revenue = attribution_df.head(100)['purchase_value'].sum()
-    
-    for touchpoint, attribution in valid_attribution.items():
-        if attribution > 0:
-            revenue_share = (attribution / total_attribution) * sample_revenue
-            print(f"{touchpoint}: ${revenue_share:.2f} ({attribution/total_attribution*100:.1f}%)")
-else:
-    print("Need to debug Markov calculation...")
+    print(f"  Conversion drops to: {row['conversion_without']:.4f}")
+    print(f"  Attribution value: {row['removal_effect']:.4f}")
+
+print(f"\n=== MARKOV ATTRIBUTION RESULTS ===")
 
-# DEFINE MARKOV REVENUE DICTIONARY
-markov_revenue = {'view': 0.0, 'cart': 0.0, 'purchase': 0.0}
+# Revenue split in proportion to positive removal effects
+total_revenue = attribution_df['purchase_value'].sum()
+markov_revenue = markov['revenue']
 
-# Update with actual values from valid attribution
-if total_attribution > 0:
-    for touchpoint, attribution in valid_attribution.items():
-        if attribution > 0:
-            revenue_share = (attribution / total_attribution) * sample_revenue
-            markov_revenue[touchpoint] = revenue_share
+if markov_revenue.sum() > 0:
+    for touchpoint, revenue_share in markov_revenue.items():
+        if revenue_share > 0:
+            print(f"{touchpoint}: ${revenue_share:.2f} ({revenue_share/total_revenue*100:.1f}%)")
+else:
+    print("No channel has a positive removal effect")
 
 # COMPLETE ATTRIBUTION MODEL COMPARISON 
 print("\n" + "="*60)
 print("COMPLETE ATTRIBUTION MODEL COMPARISON")
 print("="*60)
 
-# Compile all results (using sample of 100 journeys for fair comparison)
-sample_revenue = attribution_df.head(100)['purchase_value'].sum()
+# Compile all results (every model scores the same full set of journeys)
+sample_revenue = attribution_df['purchase_value'].sum()
 
 # Extract values for comparison (handling missing touchpoints)
 comparison_models = pd.DataFrame({
@@ -399,6 +232,16 @@ comparison_models = pd.DataFrame({
         linear_revenue.get('cart', 0),
         linear_revenue.get('purchase', 0)
     ],
+    'Time_Decay': [
+        time_decay_revenue.get('view', 0),
+        time_decay_revenue.get('cart', 0),
+        time_decay_revenue.get('purchase', 0)
+    ],
+    'Position_Based': [
+        position_based_revenue.get('view', 0),
+        position_based_revenue.get('cart', 0),
+        position_based_revenue.get('purchase', 0)
+    ],
     'Shapley': [
         shapley_revenue.get('view', 0),
         shapley_revenue.get('cart', 0),
@@ -411,7 +254,7 @@ comparison_models = pd.DataFrame({
     ]
 }, index=['View', 'Cart', 'Purchase'])
 
-print(f"\nSample Revenue Pool: ${sample_revenue:,.2f}")
+print(f"\nRevenue Pool: ${sample_revenue:,.2f}")
 print("\nAttribution by Model ($):")
 print(comparison_models.round(2))
 
@@ -420,6 +263,48 @@ print("\nAttribution by Model (%):")
 percentage_comparison = comparison_models.div(comparison_models.sum(axis=0), axis=1) * 100
 print(percentage_comparison.round(1))
 
+# Bootstrap intervals: journeys are resampled with Poisson(1) weights applied
+# to per-journey credit arrays (and to the Markov paths' transition counts),
+# so every replicate is a weighted sum instead of a pipeline rerun
+if BOOTSTRAP_REPLICATES:
+    intervals = pipeline.run('bootstrap')
+    print(f"\n{intervals['confidence']:.0%} bootstrap intervals ({intervals['replicates']} replicates, % of revenue):")
+    for model, channels in intervals['models'].items():
+        print(f"  {model}: " + ", ".join(f"{c} {ci['lower']:.1f}-{ci['upper']:.1f}" for c, ci in channels.items()))
+
+# Lookback windows: each journey only reaches N days back from its purchase,
+# located by binary search over the user's sorted event times. The rolling
+# series slides a 7-day accumulator over per-day credit instead of
+# recomputing each day. Sharded runs skip trends and the cube, which need a
+# serial journey pass
+trends = pipeline.run('trends')
+if trends is not None:
+    print("\nView share by lookback window (%):")
+    for days, window in trends['lookback_windows'].items():
+        print(f"  {days:>2} days ({window['journeys']} journeys): " +
+              ", ".join(f"{model} {shares['view']:.1f}" for model, shares in window['models'].items()))
+    rolling = trends['attribution_trends']
+    print(f"Rolling {rolling['window_days']}-day series: {len(rolling['dates'])} days "
+          f"({rolling['dates'][0]} to {rolling['dates'][-1]})" if rolling['dates'] else "No days to trend")
+
+# Attribution cube: every model's credit by category, brand and price band
+# of the purchased product, with roll-up totals, so the dashboard can filter
+# without another run
+cube = pipeline.run('cube')
+if cube is not None:
+    sizes = ", ".join(f"{name} {len(labels)}" for name, labels in cube['dimensions'].items())
+    print(f"Attribution cube: {len(cube['cells']['revenue']):,} cells (values per dimension: {sizes})")
+
+# Budget scenarios: every model's channel credit becomes a diminishing-returns
+# response curve through the current split, so the optimal split (and the
+# dashboard's allocator) follow from the attribution instead of fixed numbers
+scenarios = pipeline.run('scenarios')
+print(f"\nOptimal split of ${scenarios['total_budget'] / 1e6:.1f}M "
+      f"({len(scenarios['allocations'][scenarios['channels'][0]]):,} grid splits evaluated):")
+for model, optimal in scenarios['optimal'].items():
+    split = ", ".join(f"{channel} ${spend / 1e6:.2f}M" for channel, spend in optimal['allocation'].items())
+    print(f"  {model}: {split} -> ${optimal['revenue'] / 1e6:.1f}M ({optimal['lift']:+.1f}%)")
+
 # Key insights
 print("\n" + "="*60)
 print("KEY INSIGHTS")
@@ -439,6 +324,8 @@ print("BUSINESS RECOMMENDATIONS:")
 print("First-Touch: 'Invest everything in awareness campaigns'")
 print("Last-Touch: 'Invest everything in cart recovery'") 
 print("Linear: 'Balanced investment across touchpoints'")
+print("Time-Decay: 'Credit the touches closest to the sale'")
+print("Position-Based: 'Reward the opener and the closer'")
 print("Shapley: 'Views build foundation, cart adds value'")
 print("Markov: 'Cart interactions are conversion multipliers'")
 
@@ -464,75 +351,16 @@ print("\n" + "="*60)
 print("EXPORTING RESULTS FOR DASHBOARD")
 print("="*60)
 
-import json
-import os
-
-# Prepare data for export
-dashboard_export = {
-    'meta': {
-        'total_events': 67500000,
-        'total_users': 3700000,
-        'total_sessions': 13800000,
-        'analysis_sample': len(attribution_df),
-        'bot_filtered': True
-    },
-    
-    'attribution_models': {
-        'first_touch': {
-            'view': float(percentage_comparison.loc['View', 'First_Touch']),
-            'cart': float(percentage_comparison.loc['Cart', 'First_Touch']),
-            'purchase': float(percentage_comparison.loc['Purchase', 'First_Touch'])
-        },
-        'last_touch': {
-            'view': float(percentage_comparison.loc['View', 'Last_Touch']),
-            'cart': float(percentage_comparison.loc['Cart', 'Last_Touch']),
-            'purchase': float(percentage_comparison.loc['Purchase', 'Last_Touch'])
-        },
-        'linear': {
-            'view': float(percentage_comparison.loc['View', 'Linear']),
-            'cart': float(percentage_comparison.loc['Cart', 'Linear']),
-            'purchase': float(percentage_comparison.loc['Purchase', 'Linear'])
-        },
-        'shapley': {
-            'view': float(percentage_comparison.loc['View', 'Shapley']),
-            'cart': float(percentage_comparison.loc['Cart', 'Shapley']),
-            'purchase': float(percentage_comparison.loc['Purchase', 'Shapley'])
-        },
-        'markov': {
-            'view': float(percentage_comparison.loc['View', 'Markov']),
-            'cart': float(percentage_comparison.loc['Cart', 'Markov']),
-            'purchase': float(percentage_comparison.loc['Purchase', 'Markov'])
-        }
-    },
-    
-    'journey_stats': {
-        'avg_touchpoints': float(attribution_df['journey_length'].mean()),
-        'avg_days': float(attribution_df['journey_days'].mean()),
-        'total_journeys_analyzed': len(attribution_df),
-        'conversion_rate': 11.9,
-        'cart_abandonment_rate': 71.8
-    },
-    
-    'model_comparison': {
-        'first_touch': {'accuracy': 3, 'fairness': 2, 'business_value': 4},
-        'last_touch': {'accuracy': 3, 'fairness': 2, 'business_value': 4},
-        'linear': {'accuracy': 5, 'fairness': 6, 'business_value': 6},
-        'shapley': {'accuracy': 8, 'fairness': 9, 'business_value': 8},
-        'markov': {'accuracy': 9, 'fairness': 8, 'business_value': 9}
-    }
-}
-
-# Create output directory if it doesn't exist
-os.makedirs('output', exist_ok=True)
-
-# Export to JSON
-output_path = 'output\\attribution-results.json'
-with open(output_path, 'w') as f:
-    json.dump(dashboard_export, f, indent=2)
+# Export stage: channel shares per model, journey stats, measured totals and run metrics
+dashboard_export = pipeline.run('export')
+output_path = pipeline.params['export']['output']
 
 print(f"Results exported to {output_path}")
 print(f"Attribution models: {len(dashboard_export['attribution_models'])}")
 print(f"Journey stats: {len(dashboard_export['journey_stats'])} metrics")
+print(f"Run metrics: {dashboard_export['run_metrics']['wall_s']:.1f}s, "
+      f"hot stage '{dashboard_export['run_metrics']['hot_stage']}'")
+print(metrics.report().to_string(index=False, float_format='%.3f'))
 print(f" Next step: Copy this file to your dashboard")
-print(f"   copy {output_path} ..\\dashboard\\public\\data\\attribution-results.json")
+print(f"   copy {output_path} {os.path.join('..', 'dashboard', 'public', 'data', 'attribution-results.json')}")
 
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attribution.pipeline import AttributionPipeline  # noqa: E402
+from attribution.store import JourneyStore  # noqa: E402
+from attribution.synthetic import write_events_csv  # noqa: E402
+
+# Small enough to run in seconds, with enough bots (63+ sessions) to exercise the filter
+N_USERS = 2_000
+SEED = 7
+BOT_SHARE = 0.02
+
+
+@pytest.fixture(scope='session')
+def workdir(tmp_path_factory):
+    return tmp_path_factory.mktemp('attribution')
+
+
+@pytest.fixture(scope='session')
+def events_csv(workdir):
+    path = str(workdir / 'events.csv')
+    write_events_csv(path, N_USERS, seed=SEED, bot_share=BOT_SHARE)
+    return path
+
+
+@pytest.fixture(scope='session')
+def events(events_csv):
+    return pd.read_csv(events_csv)
+
+
+def make_pipeline(workdir, events_csv, name, **params):
+    """Pipeline over the shared journey store, with its own stage cache"""
+    return AttributionPipeline(events_csv, str(workdir / 'store'), str(workdir / f'cache-{name}'), params)
+
+
+@pytest.fixture(scope='session')
+def serial(workdir, events_csv):
+    return make_pipeline(workdir, events_csv, 'serial')
+
+
+@pytest.fixture(scope='session')
+def store(serial):
+    serial.run('ingest')
+    return JourneyStore(serial.store_dir)
+
+
+@pytest.fixture(scope='session')
+def keep_user(serial):
+    return serial.run('clean')['keep_user']
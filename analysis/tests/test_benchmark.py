@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from attribution import benchmark
+from attribution.benchmark import find_regressions, main, parse_size, run_stages, size_label, synthetic_csv
+from attribution.conversion import learn_conversion_table
+from attribution.ingest import EVENT_COLUMNS
+from attribution.synthetic import channel_names, events_per_user, users_for_events, write_events_csv
+
+STAGES = ['ingest', 'bot_filter', 'journeys', 'rule_models', 'shapley', 'markov']
+
+
+@pytest.mark.parametrize('text, n', [('1M', 1_000_000), ('10m', 10_000_000), ('2.5K', 2_500), ('1234', 1234)])
+def test_sizes_round_trip(text, n):
+    assert parse_size(text) == n
+    assert parse_size(size_label(n)) == n
+
+
+def test_synthetic_events_are_deterministic(tmp_path):
+    first, second = str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')
+    write_events_csv(first, 300, seed=3, n_channels=5)
+    write_events_csv(second, 300, seed=3, n_channels=5)
+    with open(first) as a, open(second) as b:
+        assert a.read() == b.read()
+    events = pd.read_csv(first)
+    assert list(events.columns) == list(EVENT_COLUMNS)
+    assert set(events['event_type']) <= set(channel_names(5))
+    assert events['user_id'].nunique() == 300
+
+
+def test_users_for_events_hits_the_target_size(tmp_path):
+    users = users_for_events(50_000)
+    assert np.isclose(users * events_per_user(), 50_000, rtol=0.01)
+    path = synthetic_csv(str(tmp_path), 20_000, seed=1)
+    assert synthetic_csv(str(tmp_path), 20_000, seed=1) == path
+    assert abs(len(pd.read_csv(path)) - 20_000) / 20_000 < 0.2
+
+
+def test_run_stages_uses_the_pipeline_value_function(events_csv, tmp_path, monkeypatch):
+    fitted = []
+
+    def learn(*args, **kwargs):
+        fitted.append(kwargs)
+        return learn_conversion_table(*args, **kwargs)
+    monkeypatch.setattr(benchmark, 'learn_conversion_table', learn)
+
+    records = run_stages(events_csv, str(tmp_path / 'store-a'))
+    assert [r['stage'] for r in records] == STAGES
+    assert all(r['rows_out'] > 0 for r in records)
+    assert len(fitted) == 1
+
+    run_stages(events_csv, str(tmp_path / 'store-b'), {'shapley': {'value_function': 'heuristic'}})
+    assert len(fitted) == 1
+
+
+def test_find_regressions():
+    baseline = pd.DataFrame({'size': [1, 1], 'stage': ['ingest', 'markov'], 'wall_s': [10.0, 0.1],
+                             'peak_rss': [100, 100]})
+    results = baseline.assign(wall_s=[20.0, 0.5], peak_rss=[100, 200])
+    flagged = find_regressions(results, baseline)
+    # ingest is 2x slower; markov is only 0.4s slower but doubled its memory
+    assert flagged['stage'].tolist() == ['ingest', 'markov']
+    assert find_regressions(baseline, baseline).empty
+
+
+def test_cli_writes_and_checks_a_baseline(tmp_path):
+    output = str(tmp_path / 'benchmark.json')
+    args = ['--sizes', '5K', '--workdir', str(tmp_path / 'data'), '--output', output, '--value-function', 'heuristic']
+    assert main(args) == 0
+    with open(output) as f:
+        written = json.load(f)
+    assert written['params'] == {'shapley': {'value_function': 'heuristic'}}
+    assert [r['stage'] for r in written['results']] == STAGES
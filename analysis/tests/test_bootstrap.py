@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from attribution.bootstrap import (_each_replicate, bootstrap_journey_revenue, journey_credit,
+                                   replicate_conversion_probabilities, replicate_transition_counts,
+                                   share_intervals)
+from attribution.conversion import empirical_value_function
+from attribution.export import EXPORT_CHANNELS
+from attribution.markov import _removal_masks, markov_journeys, path_transition_counts
+from attribution.paths import compress_paths
+from attribution.rules import run_rule_models
+from attribution.shapley import ShapleyEngine
+from conftest import make_pipeline
+
+REPLICATES = 40
+
+
+@pytest.fixture(scope='module')
+def markov_paths(store, keep_user):
+    return compress_paths(markov_journeys(store, keep_user=keep_user), by='converted')
+
+
+def test_journey_credit_sums_to_model_revenue(serial):
+    touches = serial.run('journeys')['touches']
+    shapley = serial.run('shapley')
+    engine = ShapleyEngine(empirical_value_function(shapley['table']), len(touches['channels']))
+    credit = journey_credit(touches, engine=engine)
+    rules = run_rule_models(touches)
+    for model in rules.columns:
+        assert np.allclose(credit[model].sum(axis=0), rules[model].to_numpy())
+        assert np.allclose(credit[model].sum(axis=1), touches['value'])
+    assert np.allclose(credit['shapley'].sum(axis=0), shapley['revenue'].to_numpy())
+
+
+def test_replicate_revenue_centres_on_the_estimate(serial):
+    touches = serial.run('journeys')['touches']
+    credit = journey_credit(touches, models=['linear'])
+    revenue = bootstrap_journey_revenue(credit, n_replicates=400, seed=1, block=500)['linear']
+    estimate = credit['linear'].sum(axis=0)
+    assert revenue.shape == (400, len(touches['channels']))
+    spread = revenue.std(axis=0) / np.sqrt(400)
+    assert (np.abs(revenue.mean(axis=0) - estimate) <= 4 * spread + 1e-9).all()
+    # Seeds make replicates reproducible
+    again = bootstrap_journey_revenue(credit, n_replicates=400, seed=1, block=500)['linear']
+    assert np.array_equal(revenue, again)
+
+
+def test_replicate_counts_match_reweighted_paths(markov_paths):
+    chain, counts = replicate_transition_counts(markov_paths, n_replicates=5, seed=3)
+    weights = np.random.default_rng([3, 1]).poisson(markov_paths['count'].astype(np.float64),
+                                                    (5, len(markov_paths['count'])))
+    for row, w in zip(counts, weights):
+        reweighted = path_transition_counts(dict(markov_paths, count=w))
+        expected = dict(zip(zip(reweighted['src'], reweighted['dst']), reweighted['count']))
+        got = dict(zip(zip(chain['src'], chain['dst']), row))
+        assert {k: v for k, v in got.items() if v} == {k: v for k, v in expected.items() if v}
+
+
+def test_batched_solve_matches_per_replicate(markov_paths):
+    chain, counts = replicate_transition_counts(markov_paths, n_replicates=6, seed=0)
+    masks = _removal_masks(chain, chain['channels'])
+    batched = replicate_conversion_probabilities(chain, counts, masks, max_bytes=1)
+    assert np.allclose(batched, _each_replicate(chain, counts.astype(np.float64), masks))
+
+
+def test_share_intervals():
+    shares = np.random.default_rng(0).normal([50, 30, 20], 2, (500, 3))
+    intervals = share_intervals(shares, confidence=0.9)
+    assert list(intervals) == EXPORT_CHANNELS
+    for i, channel in enumerate(EXPORT_CHANNELS):
+        low, high = intervals[channel]['lower'], intervals[channel]['upper']
+        assert low < [50, 30, 20][i] < high
+        assert np.isclose(high - low, 2 * 1.645 * 2, rtol=0.15)
+        assert np.isclose(intervals[channel]['std_error'], 2, rtol=0.1)
+
+
+def test_pipeline_exports_intervals(workdir, events_csv):
+    pipeline = make_pipeline(workdir, events_csv, 'serial', bootstrap={'replicates': REPLICATES},
+                             export={'output': None, 'cube_output': None})
+    intervals = pipeline.run('export')['attribution_intervals']
+    assert intervals['replicates'] == REPLICATES
+    assert set(intervals['models']) == set(pipeline.params['rule_models']['models']) | {'shapley', 'markov'}
+    shares = pipeline.run('export')['attribution_models']
+    for model, channels in intervals['models'].items():
+        for channel, bounds in channels.items():
+            assert bounds['lower'] <= bounds['upper']
+            assert bounds['lower'] - 5 <= shares[model][channel] <= bounds['upper'] + 5
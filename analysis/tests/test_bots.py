@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from attribution.bots import (SessionCounter, bot_user_ids, flag_users, human_event_mask, session_funnel,
+                              sessions_per_user, stream_sessions_per_user)
+from attribution.ingest import hash_sessions
+from attribution.store import MemoryStore
+from conftest import make_pipeline
+
+
+def test_sessions_per_user_matches_nunique(store, events):
+    expected = events.groupby('user_id')['user_session'].nunique()
+    counts = sessions_per_user(store, block_events=1000)
+    assert np.array_equal(counts, expected.loc[store.users])
+
+
+def test_missing_sessions_are_not_counted():
+    user_ids = np.array([1, 1, 1, 2, 2, 3])
+    sessions = hash_sessions(np.array(['a', None, 'b', None, None, 'c'], dtype=object))
+    store = MemoryStore({'user_id': user_ids, 'user_session': sessions}, {})
+    assert sessions_per_user(store).tolist() == [2, 0, 1]
+    assert sessions_per_user(store, approximate=True).tolist() == [2, 0, 1]
+    counts, _ = stream_sessions_per_user([{'user_id': user_ids, 'user_session': sessions}])
+    assert counts.to_dict() == {1: 2, 3: 1}
+
+
+def test_streaming_counter_over_unsorted_chunks(events):
+    expected = events.groupby('user_id')['user_session'].nunique()
+    shuffled = events.sample(frac=1, random_state=0)
+    chunks = [shuffled.iloc[i:i + 2000] for i in range(0, len(shuffled), 2000)]
+    exact, counter = stream_sessions_per_user(chunks)
+    assert np.array_equal(exact.index, expected.index)
+    assert np.array_equal(exact, expected)
+    assert counter.nbytes > 0
+
+    approximate, counter = stream_sessions_per_user(chunks, approximate=True)
+    assert np.array_equal(approximate.index, expected.index)
+    assert counter.nbytes == counter.users.nbytes + counter.bitmaps.nbytes
+    # Linear counting stays close below the bot threshold
+    small = expected <= 62
+    error = np.abs(approximate[small] - expected[small]) / expected[small]
+    assert error.mean() < 0.05
+
+
+def test_counter_rejects_bad_bitmaps():
+    with pytest.raises(ValueError):
+        SessionCounter(approximate=True, bitmap_bits=96)
+
+
+def test_exclusion_set_matches_user_mask(store, serial, keep_user):
+    clean = serial.run('clean')
+    assert np.array_equal(clean['bot_users'], np.asarray(store.users)[~keep_user])
+    event_users = np.asarray(store['user_id'])
+    assert np.array_equal(human_event_mask(event_users, clean['bot_users']),
+                          np.repeat(keep_user, np.diff(store.offsets)))
+    assert human_event_mask(event_users, np.empty(0, dtype=np.int64)).all()
+
+
+def test_bot_user_ids_default_to_flag_index():
+    flags = flag_users(pd.Series([3, 70, 40, 90], index=[40, 10, 30, 20]))
+    assert bot_user_ids(flags).tolist() == [10, 20]
+
+
+def test_approximate_clean_stage(workdir, events_csv, keep_user):
+    pipeline = make_pipeline(workdir, events_csv, 'approximate', clean={'approximate_sessions': True})
+    clean = pipeline.run('clean')
+    # Bots sit far above the threshold, so the estimate flags the same users
+    assert np.array_equal(clean['keep_user'], keep_user)
+    assert clean['report']['estimated_saved_bytes'] > 0
+
+
+def test_session_funnel_matches_groupby(store, events, keep_user):
+    humans = events[events['user_id'].isin(np.asarray(store.users)[keep_user])]
+    by_session = humans.groupby(['user_id', 'user_session'])['event_type']
+    cart = by_session.apply(lambda types: (types == 'cart').any())
+    purchase = by_session.apply(lambda types: (types == 'purchase').any())
+    funnel = session_funnel(store, keep_user, block_events=1000)
+    assert funnel == {'cart_sessions': int(cart.sum()), 'purchase_sessions': int(purchase.sum()),
+                      'abandoned_carts': int((cart & ~purchase).sum())}
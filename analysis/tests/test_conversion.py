@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from attribution.conversion import (coalition_counts, conversion_table, empirical_value_function, fit_logistic,
+                                    learn_conversion_table, mask_features, table_summary, table_values)
+from test_shapley import assert_engine_matches_enumeration
+
+
+@pytest.fixture(scope='module')
+def table(store, keep_user):
+    return learn_conversion_table(store, keep_user=keep_user)
+
+
+def test_exact_shapley_matches_enumeration_learned_table(store, table):
+    assert_engine_matches_enumeration(empirical_value_function(table), len(store.channels))
+
+
+def test_coalition_counts_match_a_per_user_walk(store, keep_user):
+    event_types = np.asarray(store['event_type'])
+    offsets = np.asarray(store.offsets)
+    purchase = store.channels.index('purchase')
+    expected = {}
+    for user in np.flatnonzero(keep_user):
+        seen = 0
+        for code in event_types[offsets[user]:offsets[user + 1]]:
+            if code == purchase and seen:
+                journeys, conversions = expected.get(seen, (0, 0))
+                expected[seen] = (journeys + 1, conversions + 1)
+            seen |= 1 << int(code)
+        if code != purchase:
+            journeys, conversions = expected.get(seen, (0, 0))
+            expected[seen] = (journeys + 1, conversions)
+
+    masks, journeys, conversions = coalition_counts(store, keep_user)
+    assert (np.diff(masks.astype(np.int64)) > 0).all()
+    assert {int(m): (int(j), int(c)) for m, j, c in zip(masks, journeys, conversions)} == expected
+
+
+def test_logistic_fit_recovers_coefficients():
+    beta = np.array([-2.0, 1.5, -0.5, 0.8])
+    masks = np.arange(1, 8, dtype=np.uint64)
+    p = 1 / (1 + np.exp(-(mask_features(masks, 3) @ beta)))
+    journeys = np.full(len(masks), 1_000_000)
+    conversions = np.round(journeys * p).astype(np.int64)
+    assert np.allclose(fit_logistic(masks, journeys, conversions, 3, ridge=0.0), beta, atol=1e-3)
+
+
+def test_table_smooths_observed_and_fits_unobserved():
+    masks = np.array([1, 3], dtype=np.uint64)
+    journeys, conversions = np.array([10, 1000]), np.array([1, 500])
+    table = conversion_table(masks, journeys, conversions, 3, smoothing=20.0)
+    fit = 1 / (1 + np.exp(-(mask_features(np.arange(8, dtype=np.uint64), 3) @ table['coefficients'])))
+    values = table_values(table, np.arange(8, dtype=np.uint64))
+    assert values[0] == 0.0
+    assert values[1] == pytest.approx((1 + 20 * fit[1]) / 30)
+    assert values[3] == pytest.approx((500 + 20 * fit[3]) / 1020)
+    assert np.allclose(values[[2, 4, 5, 6, 7]], fit[[2, 4, 5, 6, 7]])
+
+    # Tables too wide for a dense array read the same values from the observed coalitions and the fit
+    sparse = dict(table, dense=None)
+    assert np.array_equal(table_values(sparse, np.arange(8, dtype=np.uint64)), values)
+
+
+def test_table_summary(store, table):
+    summary = table_summary(table, store.channels)
+    assert summary['coalitions'] == len(table['masks'])
+    assert summary['conversions'] == int(table['conversions'].sum()) > 0
+    assert set(summary['logistic']) == {'intercept', *store.channels}
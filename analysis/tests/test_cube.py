@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from attribution.cube import (ALL, CUBE_DIMENSIONS, OTHER, build_cube, journey_dimensions, load_cube_arrays,
+                              price_band_labels, write_cube_arrays)
+from attribution.export import EXPORT_CHANNELS
+
+
+@pytest.fixture(scope='module')
+def cube(serial):
+    return serial.run('cube')
+
+
+def _cells(cube):
+    cells = cube['cells']
+    return pd.DataFrame({name: cells[name] for name in CUBE_DIMENSIONS + ['journeys', 'revenue']})
+
+
+def test_price_band_labels():
+    assert price_band_labels((25, 50, 100)) == ['<25', '25-50', '50-100', '100+']
+
+
+def test_grand_total_matches_model_revenue(serial, cube):
+    touches = serial.run('journeys')['touches']
+    cells = _cells(cube)
+    total = (cells[CUBE_DIMENSIONS] == ALL).all(axis=1)
+    assert total.sum() == 1 and total.iloc[0]
+    assert cells['journeys'][0] == len(touches['value'])
+    assert cells['revenue'][0] == pytest.approx(touches['value'].sum(), abs=0.01)
+
+    revenue = serial.run('rule_models').assign(shapley=serial.run('shapley')['revenue'],
+                                                markov=serial.run('markov')['revenue'])
+    assert set(cube['cells']['credit']) == set(revenue.columns)
+    for model, credit in cube['cells']['credit'].items():
+        for channel in cube['channels']:
+            assert credit[channel][0] == pytest.approx(revenue.loc[channel, model], abs=0.01)
+
+
+def test_every_rollup_adds_up_to_the_total(cube):
+    cells = _cells(cube)
+    credit = cube['cells']['credit']['linear']['view']
+    rolled = cells[CUBE_DIMENSIONS] == ALL
+    for pattern, group in cells.groupby([rolled[name] for name in CUBE_DIMENSIONS]):
+        if all(pattern):
+            continue
+        # Each grouping set partitions the journeys exactly once
+        assert group['journeys'].sum() == cells['journeys'][0]
+        assert group['revenue'].sum() == pytest.approx(cells['revenue'][0], abs=0.01 * len(group))
+        assert sum(credit[i] for i in group.index) == pytest.approx(credit[0], abs=0.01 * len(group))
+        assert not group[CUBE_DIMENSIONS].duplicated().any()
+
+
+def test_base_cells_match_a_journey_groupby(store, serial, cube):
+    journeys = serial.run('journeys')
+    values = journeys['touches']['value']
+    dimensions = journey_dimensions(store, journeys['bounds']['purchase'], values)
+    expected = pd.DataFrame({name: dimensions[name][0] for name in CUBE_DIMENSIONS}).assign(
+        journeys=1, revenue=values).groupby(CUBE_DIMENSIONS).sum()
+    cells = _cells(cube)
+    base = cells[(cells[CUBE_DIMENSIONS] != ALL).all(axis=1)].set_index(CUBE_DIMENSIONS).sort_index()
+    assert base.index.equals(expected.index)
+    assert np.array_equal(base['journeys'], expected['journeys'])
+    assert np.allclose(base['revenue'], expected['revenue'], atol=0.01)
+
+
+def test_minor_brands_are_pooled(store, serial):
+    journeys = serial.run('journeys')
+    values = journeys['touches']['value']
+    codes, labels = journey_dimensions(store, journeys['bounds']['purchase'], values, top_brands=3)['brand']
+    assert labels[3] == OTHER and len(labels) <= 5
+    brands = np.asarray(store['brand'])[journeys['bounds']['purchase']].astype(np.int64)
+    revenue = pd.Series(values[brands >= 0]).groupby(brands[brands >= 0]).sum().sort_values(ascending=False)
+    # The kept brands are the three top earners; every other named brand pools into OTHER
+    assert labels[:3] == [store.categories['brand'][b] for b in revenue.index[:3]]
+    assert (codes[np.isin(brands, revenue.index[3:])] == 3).all()
+
+
+def test_unknown_and_empty_dimensions():
+    dimensions = {'category': (np.array([0, 1, 1]), ['a', 'unknown']), 'brand': (np.array([0, 0, 0]), ['x'])}
+    credit = {'linear': np.array([[1.0, 0, 0], [0, 2.0, 0], [0, 0, 3.0]])}
+    cube = build_cube(dimensions, credit, np.array([1.0, 2.0, 3.0]), EXPORT_CHANNELS)
+    cells = cube['cells']
+    rows = {(c, b): i for i, (c, b) in enumerate(zip(cells['category'], cells['brand']))}
+    assert cells['revenue'][rows[(1, 0)]] == 5.0
+    assert cells['revenue'][rows[(ALL, 0)]] == 6.0
+    assert cells['credit']['linear']['purchase'][rows[(1, ALL)]] == 3.0
+
+    empty = build_cube({'category': (np.array([], dtype=np.int64), ['a'])}, {'linear': np.zeros((0, 3))},
+                       np.zeros(0), EXPORT_CHANNELS)
+    assert empty['cells']['category'] == [ALL] and empty['cells']['journeys'] == [0]
+
+
+def test_cube_arrays_round_trip(cube, tmp_path):
+    directory = write_cube_arrays(cube, str(tmp_path / 'cube'))
+    header, columns = load_cube_arrays(directory)
+    assert header['dimensions'] == cube['dimensions']
+    assert header['models'] == list(cube['cells']['credit'])
+    for name in CUBE_DIMENSIONS + ['journeys', 'revenue']:
+        assert columns[name].tolist() == cube['cells'][name]
+    for m, model in enumerate(header['models']):
+        for c, channel in enumerate(header['channels']):
+            assert columns['credit'][m, c].tolist() == cube['cells']['credit'][model][channel]
+
+    # Rewriting replaces the files, so an open map still reads the old cube
+    mapped = columns['revenue']
+    before = np.array(mapped)
+    write_cube_arrays(dict(cube, cells=dict(cube['cells'], revenue=[0.0] * len(before))), directory)
+    assert np.array_equal(mapped, before)
+    assert not load_cube_arrays(directory)[1]['revenue'].any()
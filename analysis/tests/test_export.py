@@ -0,0 +1,37 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from attribution.export import EXPORT_CHANNELS, build_dashboard_export, funnel_rates
+from conftest import make_pipeline
+
+
+def test_funnel_rates():
+    funnel = {'cart_sessions': 400, 'purchase_sessions': 50, 'abandoned_carts': 300}
+    assert funnel_rates(funnel) == {'conversion_rate': 12.5, 'cart_abandonment_rate': 75.0}
+    assert funnel_rates(dict.fromkeys(funnel, 0)) == {'conversion_rate': 0.0, 'cart_abandonment_rate': 0.0}
+
+
+def test_export_reports_measured_funnel(workdir, events_csv, store):
+    pipeline = make_pipeline(workdir, events_csv, 'serial',
+                             export={'output': str(workdir / 'results.json'), 'cube_output': None})
+    payload = pipeline.run('export')
+    clean = pipeline.run('clean')
+    stats = payload['journey_stats']
+    assert stats['conversion_rate'] == funnel_rates(clean['funnel'])['conversion_rate']
+    assert 0 < stats['cart_abandonment_rate'] < 100
+    assert payload['meta']['total_events'] == len(store)
+    assert payload['meta']['total_users'] == store.n_users
+    with open(workdir / 'results.json') as f:
+        assert json.load(f)['journey_stats'] == stats
+
+
+def test_shares_sum_to_100():
+    revenue = pd.DataFrame({'linear': [3.0, 1.0, 0.0]}, index=['view', 'cart', 'purchase'])
+    stats = {'avg_touchpoints': 2, 'avg_days': 1, 'total_journeys_analyzed': 4,
+             'cart_sessions': 1, 'purchase_sessions': 1, 'abandoned_carts': 0}
+    payload = build_dashboard_export(revenue, stats, meta={})
+    shares = payload['attribution_models']['linear']
+    assert set(shares) == set(EXPORT_CHANNELS)
+    assert np.isclose(sum(shares.values()), 100)
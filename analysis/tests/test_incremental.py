@@ -0,0 +1,118 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from attribution.incremental import (CHECKPOINT_META, MERGE_RATIO, STATE_FILE, USERS_DIR,
+                                     AttributionCheckpoint)
+from attribution.rules import HALF_LIFE_DAYS
+
+
+def day_csvs(workdir, events):
+    """One CSV per day of events, in date order"""
+    days = events['event_time'].str[:10]
+    paths = []
+    for day in sorted(days.unique()):
+        path = str(workdir / f'{day}.csv')
+        events[days == day].to_csv(path, index=False)
+        paths.append((day, path))
+    return paths
+
+
+@pytest.fixture(scope='module')
+def checkpoint(workdir, events):
+    checkpoint = AttributionCheckpoint.create(str(workdir / 'checkpoint'))
+    for day, path in day_csvs(workdir, events):
+        checkpoint.fold(path, day)
+    return AttributionCheckpoint(checkpoint.path)
+
+
+def test_incremental_matches_full_run(checkpoint, serial, store, keep_user):
+    report = checkpoint.report()
+    assert report['flags']['bot'] == int((~keep_user).sum())
+
+    rules = serial.run('rule_models')
+    incremental = report['rule_revenue'].loc[rules.index]
+    assert np.allclose(incremental[rules.columns], rules)
+
+    shapley = serial.run('shapley')
+    for key in ('masks', 'journeys', 'conversions'):
+        assert np.array_equal(report['conversion_table'][key], shapley['table'][key])
+    assert np.allclose(report['shapley_revenue'][shapley['revenue'].index], shapley['revenue'])
+
+    markov = serial.run('markov')
+    assert np.isclose(report['markov_baseline'], markov['baseline'])
+    assert np.allclose(report['markov_revenue'][markov['revenue'].index], markov['revenue'])
+
+    journeys = serial.run('journeys')['attribution_df']
+    stats = report['journey_stats']
+    assert stats['events'] == len(store)
+    assert stats['users'] == len(store.users)
+    assert stats['journeys'] == len(journeys)
+    assert np.isclose(stats['revenue'], journeys['purchase_value'].sum())
+    assert np.isclose(stats['avg_days'], journeys['journey_days'].mean())
+    # Sessions spanning midnight keep their funnel flags across folds
+    funnel = serial.run('clean')['funnel']
+    assert {name: stats[name] for name in funnel} == funnel
+
+
+
+def test_checkpoint_refuses_other_settings(checkpoint):
+    with pytest.raises(ValueError):
+        checkpoint.check_settings(lookback_days=7)
+    with pytest.raises(ValueError):
+        AttributionCheckpoint.open_or_create(checkpoint.path, touchpoint_unit='session')
+    reopened = AttributionCheckpoint.open_or_create(checkpoint.path, **checkpoint.settings())
+    assert reopened.settings() == checkpoint.settings()
+
+def test_user_tables_stay_logarithmic(checkpoint):
+    tables = checkpoint.meta['tables'][USERS_DIR]
+    rows = [table['rows'] for table in tables]
+    # Every table is more than MERGE_RATIO times the next, and only live tables are on disk
+    assert all(older > MERGE_RATIO * newer for older, newer in zip(rows, rows[1:]))
+    assert sorted(os.listdir(os.path.join(checkpoint.path, USERS_DIR))) == [t['name'] for t in tables]
+
+
+def test_interrupted_fold_keeps_last_commit(workdir, events):
+    path = str(workdir / 'interrupted')
+    checkpoint = AttributionCheckpoint.create(path)
+    (first, first_csv), (second, second_csv) = day_csvs(workdir, events)[:2]
+    checkpoint.fold(first_csv, first)
+    with open(os.path.join(path, STATE_FILE), 'rb') as f:
+        committed = f.read()
+
+    def crash():
+        raise RuntimeError("interrupted")
+    checkpoint.save = crash
+    with pytest.raises(RuntimeError):
+        checkpoint.fold(second_csv, second)
+
+    with open(os.path.join(path, STATE_FILE), 'rb') as f:
+        assert f.read() == committed
+    reopened = AttributionCheckpoint(path)
+    assert reopened.meta['segments'] == [first]
+    live = [t['name'] for t in reopened.meta['tables'][USERS_DIR]]
+    assert sorted(os.listdir(os.path.join(path, USERS_DIR))) == live
+    with open(os.path.join(path, CHECKPOINT_META)) as f:
+        assert json.load(f) == reopened.meta
+    # The interrupted day folds again from the committed state
+    reopened.fold(second_csv, second)
+    assert reopened.meta['segments'] == [first, second]
+
+
+def test_decay_survives_long_gaps(workdir, events):
+    """Days thousands of half-lives apart still give finite time-decay credit"""
+    checkpoint = AttributionCheckpoint.create(str(workdir / 'gaps'))
+    for i, (day, path) in enumerate(day_csvs(workdir, events)[:3]):
+        shifted = pd.read_csv(path)
+        # 2000 half-lives between days would overflow decay sums kept against a fixed origin
+        stamps = pd.to_datetime(shifted['event_time']) + pd.Timedelta(days=i * 2000 * HALF_LIFE_DAYS)
+        shifted['event_time'] = stamps.dt.strftime('%Y-%m-%d %H:%M:%S UTC')
+        shifted_csv = str(workdir / f'gap-{day}.csv')
+        shifted.to_csv(shifted_csv, index=False)
+        checkpoint.fold(shifted_csv, day)
+    revenue = checkpoint.report()['rule_revenue']
+    assert np.isfinite(revenue.to_numpy()).all()
+    assert np.isclose(revenue['time_decay'].sum(), revenue['linear'].sum())
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from attribution.ingest import compact_chunk, load_events
+from attribution.store import build_store
+
+
+def raw_chunk(user_ids, start='2019-11-01 00:00:00'):
+    times = pd.date_range(start, periods=len(user_ids), freq='min')
+    return pd.DataFrame({
+        'event_time': times.strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'event_type': pd.Categorical(['view'] * len(user_ids)),
+        'price': np.ones(len(user_ids)),
+        'user_id': np.asarray(user_ids, dtype=np.int64),
+        'user_session': [f's{u}' for u in user_ids],
+    })
+
+
+def test_chunked_load_matches_single_read(events_csv, events):
+    loaded = load_events(events_csv, chunksize=997)
+    assert len(loaded) == len(events)
+    assert loaded['event_type'].astype(str).tolist() == events['event_type'].tolist()
+    assert np.array_equal(loaded['user_id'].to_numpy(), events['user_id'].to_numpy())
+    assert np.allclose(loaded['price'], events['price'].astype(np.float32))
+
+
+def test_user_ids_keep_one_dtype_across_chunks(tmp_path):
+    large = 2 ** 31 + 5
+    chunks = [compact_chunk(raw_chunk([1, 2])), compact_chunk(raw_chunk([5, large], '2019-11-02 00:00:00'))]
+    assert all(chunk['user_id'].dtype == np.int64 for chunk in chunks)
+
+    store = build_store(iter(chunks), str(tmp_path / 'store'))
+    assert np.asarray(store.users).tolist() == [1, 2, 5, large]
+    assert store['user_id'].dtype == np.int64
+
+
+def test_store_narrows_user_ids_that_fit(tmp_path):
+    store = build_store(compact_chunk(raw_chunk([3, 1, 2])), str(tmp_path / 'store'))
+    assert store['user_id'].dtype == np.int32
+    assert np.asarray(store.users).tolist() == [1, 2, 3]
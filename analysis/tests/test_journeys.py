@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from attribution.bots import BOT_BINS, BOT_LABELS
+from attribution.journeys import build_purchase_journeys
+
+
+def loop_journeys(events):
+    """The original per-user loop (without its 1,000-user sample), on raw CSV rows"""
+    sessions_per_user = events.groupby('user_id')['user_session'].nunique()
+    flags = pd.cut(sessions_per_user, bins=BOT_BINS, labels=BOT_LABELS, include_lowest=True)
+    clean = events[events['user_id'].map(flags) != 'bot'].copy()
+    clean['event_time'] = pd.to_datetime(clean['event_time'])
+
+    rows = []
+    purchases = clean[clean['event_type'] == 'purchase']
+    for user_id in purchases['user_id'].unique():
+        # Stable sort, so tied events keep file order as in the store
+        journey = clean[clean['user_id'] == user_id].sort_values('event_time', kind='stable')
+        for _, purchase in journey[journey['event_type'] == 'purchase'].iterrows():
+            before = journey[journey['event_time'] <= purchase['event_time']]
+            if len(before) > 1:
+                rows.append({
+                    'user_id': user_id,
+                    'purchase_value': purchase['price'],
+                    'first_touch_type': before.iloc[0]['event_type'],
+                    'last_touch_type': before.iloc[-2]['event_type'],
+                    'journey_length': len(before) - 1,
+                    'journey_days': (purchase['event_time'] - before.iloc[0]['event_time']).days,
+                })
+    return pd.DataFrame(rows)
+
+
+def test_journeys_match_original_loop(events, store, keep_user):
+    expected = loop_journeys(events).sort_values('user_id', kind='stable').reset_index(drop=True)
+    actual = build_purchase_journeys(store, keep_user=keep_user)
+
+    assert len(expected) > 0 and not keep_user.all()
+    assert actual['user_id'].tolist() == expected['user_id'].tolist()
+    for column in ('first_touch_type', 'last_touch_type'):
+        assert actual[column].astype(str).tolist() == expected[column].tolist()
+    for column in ('journey_length', 'journey_days'):
+        assert np.array_equal(actual[column].to_numpy(), expected[column].to_numpy())
+    assert np.allclose(actual['purchase_value'], expected['purchase_value'])
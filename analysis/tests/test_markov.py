@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from attribution import markov
+from attribution.markov import _removal_masks, build_transition_counts, conversion_probabilities
+
+
+@pytest.fixture(scope='module', params=[1, 2, 3])
+def chain(request, store, keep_user):
+    return build_transition_counts(store, keep_user=keep_user, order=request.param)
+
+
+@pytest.fixture(scope='module')
+def removed(chain):
+    return _removal_masks(chain, chain['channels'])
+
+
+def absorption_by_powers(chain, removed_states, squarings=60):
+    """P(START -> CONVERSION) from P ** (2 ** squarings), with moves into removed states sent to NULL"""
+    n = chain['n_states']
+    conversion, null = chain['n_transient'], chain['n_transient'] + 1
+    matrix = np.zeros((n, n))
+    matrix[chain['src'], chain['dst']] = markov.transition_probabilities(chain)
+    matrix[[conversion, null], [conversion, null]] = 1.0
+    removed_states = np.flatnonzero(removed_states)
+    matrix[:, null] += matrix[:, removed_states].sum(axis=1)
+    matrix[:, removed_states] = 0.0
+    for _ in range(squarings):
+        matrix = matrix @ matrix
+    return matrix[0, conversion]
+
+
+def test_dense_solve_matches_chain_powers(chain, removed):
+    info = {}
+    probs = conversion_probabilities(chain, removed, info=info)
+    assert info['method'] == 'dense'
+    expected = [absorption_by_powers(chain, states) for states in removed]
+    assert np.allclose(probs, expected, rtol=1e-9, atol=1e-12)
+
+
+def test_sparse_lu_matches_dense(chain, removed, monkeypatch):
+    pytest.importorskip('scipy')
+    dense = conversion_probabilities(chain, removed)
+    monkeypatch.setattr(markov, 'DENSE_STATE_LIMIT', 0)
+    info = {}
+    assert np.allclose(conversion_probabilities(chain, removed, info=info), dense, rtol=1e-10, atol=1e-13)
+    assert info['method'] == 'sparse_lu'
+
+
+def test_jacobi_matches_dense(chain, removed, monkeypatch):
+    dense = conversion_probabilities(chain, removed)
+    monkeypatch.setattr(markov, 'DENSE_STATE_LIMIT', 0)
+    monkeypatch.setattr(markov, 'spsolve', None)
+    info = {}
+    assert np.allclose(conversion_probabilities(chain, removed, info=info), dense, rtol=1e-9, atol=1e-11)
+    assert info['method'] == 'jacobi'
+    assert 0 < info['iterations'] < 100_000 and info['residual'] < 1e-12
+
+    with pytest.warns(RuntimeWarning, match='did not converge'):
+        conversion_probabilities(chain, removed, max_iter=2)
+
+
+@pytest.mark.parametrize('order', [1, 2, 3, 4])
+def test_transition_counts_match_journey_walk(store, keep_user, order):
+    """build_transition_counts against the same histories walked journey by journey"""
+    journeys = markov.markov_journeys(store, keep_user=keep_user)
+    chain = build_transition_counts(store, keep_user=keep_user, order=order)
+    labels = markov.state_labels(chain)
+    expected = {}
+    offsets, channels = journeys['offsets'], journeys['channels']
+    for j in range(len(offsets) - 1):
+        touches = [channels[c] for c in journeys['channel'][offsets[j]:offsets[j + 1]]]
+        states = [markov.START] + ['>'.join(touches[max(0, i + 1 - order):i + 1]) for i in range(len(touches))]
+        states.append(markov.CONVERSION if journeys['converted'][j] else markov.NULL)
+        for pair in zip(states[:-1], states[1:]):
+            expected[pair] = expected.get(pair, 0) + 1
+
+    actual = {(labels[s], labels[d]): int(c) for s, d, c in zip(chain['src'], chain['dst'], chain['count'])}
+    assert actual == expected
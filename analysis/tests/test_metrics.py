@@ -0,0 +1,57 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from attribution.metrics import RunMetrics
+from conftest import make_pipeline
+
+
+def test_stage_records(tmp_path):
+    metrics = RunMetrics()
+    with metrics.stage('fast', rows_in=10) as record:
+        record['rows_out'] = np.int64(4)
+    with metrics.stage('slow') as record:
+        time.sleep(0.05)
+    with pytest.raises(RuntimeError):
+        with metrics.stage('failing'):
+            raise RuntimeError
+
+    fast, slow, failing = metrics.stages
+    assert fast['rows_in'] == 10 and fast['rows_out'] == 4
+    assert slow['wall_s'] >= 0.05 > slow['cpu_s']
+    # A failing stage is still timed
+    assert failing['wall_s'] >= 0 and 'cpu_s' in failing and 'peak_rss' in failing
+
+    summary = metrics.summary()
+    assert summary['hot_stage'] == 'slow'
+    assert summary['wall_s'] >= sum(s['wall_s'] for s in metrics.stages)
+    assert list(metrics.report()['stage']) == ['fast', 'slow', 'failing']
+
+    path = metrics.write(str(tmp_path / 'run' / 'metrics.json'))
+    with open(path) as f:
+        assert json.load(f)['stages'][0]['rows_out'] == 4
+
+
+def test_profile_and_trace_memory(tmp_path):
+    metrics = RunMetrics(profile=True, trace_memory=True, profile_dir=str(tmp_path))
+    with metrics.stage('allocate'):
+        blocks = [bytearray(1 << 20) for _ in range(4)]
+    del blocks
+    record = metrics.stages[0]
+    assert record['traced_peak_bytes'] >= 4 << 20
+    assert record['profile'] and {'function', 'calls', 'own_s', 'cumulative_s'} <= set(record['profile'][0])
+    assert (tmp_path / 'allocate.prof').exists()
+
+
+def test_pipeline_records_cache_hits(workdir, events_csv):
+    first = make_pipeline(workdir, events_csv, 'metrics')
+    first.run('rule_models')
+    misses = {s['stage']: s['cache_misses'] for s in first.metrics.stages}
+    assert misses['rule_models'] == 1
+
+    second = make_pipeline(workdir, events_csv, 'metrics')
+    second.run('rule_models')
+    hits = {s['stage']: s['cache_hits'] for s in second.metrics.stages}
+    assert hits == {'rule_models': 1}
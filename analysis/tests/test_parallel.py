@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from attribution.metrics import cpu_time
+from conftest import make_pipeline
+
+
+@pytest.fixture(scope='module')
+def sharded(workdir, events_csv):
+    return make_pipeline(workdir, events_csv, 'sharded', sharded={'workers': 2})
+
+
+def test_sharded_models_match_serial(serial, sharded):
+    serial_rules, sharded_rules = serial.run('rule_models'), sharded.run('rule_models')
+    assert np.allclose(sharded_rules.loc[serial_rules.index, serial_rules.columns], serial_rules)
+
+    serial_shapley, sharded_shapley = serial.run('shapley'), sharded.run('shapley')
+    assert np.allclose(sharded_shapley['revenue'][serial_shapley['revenue'].index], serial_shapley['revenue'])
+    for key in ('masks', 'journeys', 'conversions'):
+        assert np.array_equal(sharded_shapley['table'][key], serial_shapley['table'][key])
+
+    serial_markov, sharded_markov = serial.run('markov'), sharded.run('markov')
+    assert np.isclose(sharded_markov['baseline'], serial_markov['baseline'])
+    assert np.allclose(sharded_markov['revenue'][serial_markov['revenue'].index], serial_markov['revenue'])
+
+
+def test_sharded_journey_stats_match_serial(serial, sharded, store):
+    journeys = serial.run('journeys')['attribution_df']
+    stats = sharded.run('sharded')['journey_stats']
+    assert stats['events'] == len(store)
+    assert stats['journeys'] == len(journeys)
+    assert np.isclose(stats['revenue'], journeys['purchase_value'].sum())
+    assert np.isclose(stats['avg_touchpoints'], journeys['journey_length'].mean())
+    assert np.isclose(stats['avg_days'], journeys['journey_days'].mean())
+
+
+def test_sharded_run_skips_serial_journeys(sharded):
+    for stage in ('rule_models', 'shapley', 'markov'):
+        sharded.run(stage)
+    assert 'journeys' not in sharded._results
+
+
+def test_sharded_run_skips_trends_and_cube_unless_forced(workdir, events_csv, sharded):
+    assert sharded.run('trends') is None and sharded.run('cube') is None
+    assert 'trends' not in sharded.dependencies('export') and 'journeys' not in sharded._results
+
+    forced = make_pipeline(workdir, events_csv, 'forced', sharded={'workers': 2}, trends={'enabled': True})
+    assert forced.run('trends')['attribution_trends']['dates']
+    assert forced.run('cube') is None
+
+
+def test_serial_run_honors_disabled_stages(workdir, events_csv):
+    pipeline = make_pipeline(workdir, events_csv, 'no-cube', cube={'enabled': False})
+    assert pipeline.run('cube') is None
+    assert pipeline.dependencies('cube') == []
+    assert 'cube' not in pipeline.dependencies('export')
+
+
+def _spin(seconds):
+    deadline = time.process_time() + seconds
+    while time.process_time() < deadline:
+        pass
+
+
+def test_cpu_time_includes_finished_workers():
+    cpu_started, own_started = cpu_time(), time.process_time()
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        list(pool.map(_spin, [0.3, 0.3]))
+    own = time.process_time() - own_started
+    assert cpu_time() - cpu_started - own > 0.5
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from attribution.paths import collapse_repeats, compress_paths, compression_report, path_table
+
+CHANNELS = ['view', 'cart', 'purchase']
+
+
+def journeys_from(sequences, **per_journey):
+    lengths = [len(seq) for seq in sequences]
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    channel = np.array([c for seq in sequences for c in seq], dtype=np.int64)
+    journeys = {'channel': channel, 'offsets': offsets, 'channels': CHANNELS,
+                'journey': np.repeat(np.arange(len(sequences)), lengths)}
+    journeys.update({name: np.asarray(values) for name, values in per_journey.items()})
+    return journeys
+
+
+def expand(paths):
+    """The journey sequences a compressed path set stands for"""
+    sequences = np.split(paths['channel'], paths['offsets'][1:-1])
+    return [sequences[p].tolist() for p in paths['path_of_journey']]
+
+
+@pytest.mark.parametrize('sequences', [
+    [[], [0, 1]],
+    [[0, 1], [], [0, 1]],
+    [[0, 1], []],
+    [[], [0], [], [], [0], []],
+])
+def test_empty_journeys(sequences):
+    journeys = journeys_from(sequences, converted=np.ones(len(sequences), dtype=bool))
+    paths = compress_paths(journeys, by='converted')
+    assert expand(paths) == sequences
+    assert sorted(map(tuple, np.split(paths['channel'], paths['offsets'][1:-1]))) == \
+        sorted(set(map(tuple, sequences)))
+
+
+def test_paths_group_identical_journeys():
+    sequences = [[0, 0, 1], [0, 1], [0, 0, 1], [1], [0, 1]]
+    journeys = journeys_from(sequences, value=[10.0, 1.0, 5.0, 2.0, 3.0],
+                             converted=[True, True, False, True, True])
+    paths = compress_paths(journeys, by='converted')
+    assert expand(paths) == sequences
+    # [0, 0, 1] splits on converted; [0, 1] groups
+    assert len(paths['count']) == 4
+    assert paths['count'].sum() == len(sequences)
+    assert np.isclose(paths['value'].sum(), 21.0)
+    report = compression_report(paths)
+    assert report['journeys'] == 5 and report['paths'] == 4
+
+    collapsed = compress_paths(journeys, collapse_runs=True)
+    assert expand(collapsed) == [[0, 1], [0, 1], [0, 1], [1], [0, 1]]
+    table = path_table(collapsed)
+    assert table.loc[0, 'path'] == 'view > cart' and table.loc[0, 'count'] == 4
+
+
+def test_collapse_repeats_keeps_journey_boundaries():
+    journeys = journeys_from([[0, 0], [0, 1, 1], [], [1]])
+    collapsed = collapse_repeats(journeys)
+    assert np.split(collapsed['channel'], collapsed['offsets'][1:-1])[1].tolist() == [0, 1]
+    assert np.diff(collapsed['offsets']).tolist() == [1, 2, 0, 1]
+
+
+def test_paths_of_real_journeys(serial):
+    journeys = serial.run('journeys')
+    paths, touches = journeys['paths'], journeys['touches']
+    sequences = [seq.tolist() for seq in np.split(touches['channel'], touches['offsets'][1:-1])]
+    assert expand(paths) == sequences
+    assert np.isclose(paths['value'].sum(), touches['value'].sum())
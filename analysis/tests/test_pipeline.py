@@ -0,0 +1,106 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from attribution.pipeline import StageCache, merge_params
+from conftest import make_pipeline
+
+
+def test_cache_round_trip_and_corrupt_entries(tmp_path):
+    cache = StageCache(str(tmp_path))
+    assert cache.get('markov', 'abc') == (False, None)
+    cache.put('markov', 'abc', {'order': 2})
+    assert cache.contains('markov', 'abc')
+    assert cache.get('markov', 'abc') == (True, {'order': 2})
+
+    with open(cache._file('markov', 'abc'), 'wb') as f:
+        f.write(b'not a pickle')
+    assert cache.get('markov', 'abc') == (False, None)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = StageCache(str(tmp_path))
+    for i, stage in enumerate(['a', 'b', 'c']):
+        cache.put(stage, 'key', b'x' * 1000)
+        past = time.time() - 100 + i
+        os.utime(cache._file(stage, 'key'), (past, past))
+    # Reading 'a' makes it the most recently used
+    cache.get('a', 'key')
+    size = cache.nbytes // 3
+    assert cache.evict(max_bytes=2 * size) == (1, size)
+    assert not cache.contains('b', 'key') and cache.contains('a', 'key') and cache.contains('c', 'key')
+
+    old = time.time() - 3 * 86_400
+    os.utime(cache._file('c', 'key'), (old, old))
+    assert cache.evict(max_age_days=1) == (1, size)
+    assert cache.contains('a', 'key') and not cache.contains('c', 'key')
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_bounded_cache_evicts_on_put(tmp_path):
+    cache = StageCache(str(tmp_path), max_bytes=2500)
+    for stage in ['a', 'b', 'c']:
+        cache.put(stage, 'key', b'x' * 1000)
+    assert cache.nbytes <= 2500 and cache.contains('c', 'key')
+
+
+def test_merge_params_rejects_unknown_stages():
+    assert merge_params({'markov': {'order': 3}})['markov']['order'] == 3
+    assert merge_params()['markov']['order'] == 1
+    with pytest.raises(KeyError):
+        merge_params({'nope': {}})
+
+
+def test_keys_follow_params(workdir, events_csv):
+    first = make_pipeline(workdir, events_csv, 'keys')
+    second = make_pipeline(workdir, events_csv, 'keys')
+    assert first.key('export') == second.key('export')
+
+    changed = make_pipeline(workdir, events_csv, 'keys', markov={'order': 2})
+    assert changed.key('markov') != first.key('markov')
+    assert changed.key('scenarios') != first.key('scenarios')
+    assert changed.key('journeys') == first.key('journeys')
+
+    # The worker count schedules shards but does not change their results
+    one = make_pipeline(workdir, events_csv, 'keys', sharded={'workers': 2})
+    two = make_pipeline(workdir, events_csv, 'keys', sharded={'workers': 4})
+    assert one.key('sharded') == two.key('sharded')
+    assert one.key('shapley') == two.key('shapley')
+
+
+def test_set_params_invalidates_downstream_only(workdir, events_csv):
+    pipeline = make_pipeline(workdir, events_csv, 'invalidate')
+    pipeline.run('scenarios')
+    journeys = pipeline.run('journeys')
+    shapley_key = pipeline.key('shapley')
+
+    pipeline.set_params('shapley', value_function='heuristic')
+    assert 'shapley' not in pipeline._results and 'scenarios' not in pipeline._results
+    assert pipeline.run('journeys') is journeys
+    assert pipeline.key('shapley') != shapley_key
+    assert pipeline.run('shapley')['table'] is None
+
+
+def test_switching_workers_rewires_model_stages(workdir, events_csv):
+    pipeline = make_pipeline(workdir, events_csv, 'rewire')
+    serial = pipeline.run('rule_models')
+    serial_key = pipeline.key('rule_models')
+
+    pipeline.set_params('sharded', workers=2)
+    assert pipeline.dependencies('rule_models') == ['sharded']
+    assert 'rule_models' not in pipeline._results and 'export' not in pipeline._keys
+    assert pipeline.key('rule_models') != serial_key
+    pd.testing.assert_frame_equal(pipeline.run('rule_models'), serial, check_exact=False)
+
+    # More workers over the same shards hits the cache
+    pipeline.set_params('sharded', workers=3)
+    assert pipeline.key('rule_models') != serial_key
+    pipeline.run('rule_models')
+    assert pipeline.metrics.stages[-1]['cache_hits'] == 1
+
+    pipeline.set_params('sharded', workers=1)
+    assert pipeline.key('rule_models') == serial_key
+    assert pipeline.dependencies('rule_models') == ['journeys']
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from attribution.journeys import NS_PER_DAY, purchase_journey_bounds
+from attribution.rules import (FIRST_SHARE, HALF_LIFE_DAYS, LAST_SHARE, RULE_MODELS, flatten_touchpoints,
+                               rule_based_revenue)
+
+
+def loop_weights(model, times):
+    """Per-touch weights of one journey, written out touch by touch"""
+    n = len(times)
+    if model == 'first_touch':
+        return [1.0] + [0.0] * (n - 1)
+    if model == 'last_touch':
+        return [0.0] * (n - 1) + [1.0]
+    if model == 'linear':
+        return [1.0 / n] * n
+    if model == 'time_decay':
+        raw = [2.0 ** (-(times[-1] - t) / NS_PER_DAY / HALF_LIFE_DAYS) for t in times]
+        return [r / sum(raw) for r in raw]
+    if n == 1:
+        return [1.0]
+    middle = 1.0 - FIRST_SHARE - LAST_SHARE
+    if n == 2:
+        return [FIRST_SHARE + middle / 2, LAST_SHARE + middle / 2]
+    return [FIRST_SHARE] + [middle / (n - 2)] * (n - 2) + [LAST_SHARE]
+
+
+@pytest.fixture(scope='module')
+def touches(store, keep_user):
+    return flatten_touchpoints(store, purchase_journey_bounds(store, keep_user=keep_user))
+
+
+@pytest.mark.parametrize('model', list(RULE_MODELS))
+def test_rule_models_match_per_journey_loop(touches, model):
+    expected = np.zeros(len(touches['channels']))
+    offsets = touches['offsets']
+    for j in range(len(offsets) - 1):
+        channels = touches['channel'][offsets[j]:offsets[j + 1]]
+        weights = loop_weights(model, touches['time'][offsets[j]:offsets[j + 1]].tolist())
+        for channel, weight in zip(channels, weights):
+            expected[channel] += weight * touches['value'][j]
+
+    revenue = rule_based_revenue(touches, model)
+    assert np.allclose(revenue.to_numpy(), expected)
+    assert np.isclose(revenue.sum(), touches['value'].sum())
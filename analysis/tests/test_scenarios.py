@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from attribution.export import channel_shares
+from attribution.scenarios import (TOTAL_BUDGET, allocation_grid, budget_scenarios, curve_revenue,
+                                   evaluate_allocations, fit_response_curves, optimal_allocation,
+                                   saturation_ratio, share_bounds)
+
+FOUR_CHANNELS = {'view': 1_500_000, 'cart': 1_250_000, 'email': 1_250_000, 'search': 1_000_000}
+
+
+@pytest.fixture
+def revenue():
+    return pd.DataFrame({'linear': [3.0, 2.0, 1.0, 1.0, 5.0], 'markov': [1.0, 4.0, 2.0, 0.5, 5.0]},
+                        index=['view', 'cart', 'email', 'search', 'purchase'])
+
+
+def test_share_bounds():
+    assert share_bounds(2) == pytest.approx((0.3, 0.7))
+    assert share_bounds(4) == pytest.approx((0.15, 0.35))
+    assert share_bounds(1) == (0.6, 1.0)
+    assert share_bounds(4, min_share=0.1) == pytest.approx((0.1, 0.35))
+    for n, low, high in [(4, 0.3, None), (2, None, 0.4), (2, 0.6, 0.5)]:
+        with pytest.raises(ValueError):
+            share_bounds(n, low, high)
+    with pytest.raises(ValueError):
+        allocation_grid(TOTAL_BUDGET, 4, 50_000, 0.3, 0.7)
+
+
+def test_saturation_ratio_has_the_elasticity():
+    elasticity = np.array([0.1, 0.35, 0.9])
+    x = saturation_ratio(elasticity)
+    assert np.allclose(x / np.expm1(x), elasticity)
+    with pytest.raises(ValueError):
+        saturation_ratio(1.0)
+
+
+def test_curves_pass_through_current_spend(revenue):
+    allocation = {'view': 3_000_000, 'cart': 2_000_000}
+    curves = fit_response_curves(revenue, allocation, baseline_revenue=50_000_000, elasticity=0.35)
+    shares = channel_shares(revenue) / 100
+    at_current = curve_revenue(curves, curves['current'])
+    assert np.allclose(at_current, shares.loc[['view', 'cart']].to_numpy().T * 50_000_000)
+    assert np.allclose(at_current.sum(axis=1) + curves['base'], 50_000_000)
+
+    # d log(revenue) / d log(spend) at the current spend
+    bumped = curve_revenue(curves, curves['current'] * (1 + 1e-6))
+    assert np.allclose(np.log(bumped / at_current) / np.log1p(1e-6), 0.35, atol=1e-4)
+
+
+def test_grid_at_the_slider_step():
+    grid = allocation_grid(TOTAL_BUDGET, 2, 50_000)
+    assert len(grid) == 41
+    assert np.allclose(grid.sum(axis=1), TOTAL_BUDGET)
+    assert grid[:, 0].min() == pytest.approx(1_500_000) and grid[:, 0].max() == pytest.approx(3_500_000)
+    assert np.allclose(np.diff(np.sort(grid[:, 0])), 50_000)
+
+
+def test_four_channel_scenarios(revenue):
+    out = budget_scenarios(revenue, current_allocation=FOUR_CHANNELS, step=125_000)
+    assert out['bounds'] == pytest.approx({'min_share': 0.15, 'max_share': 0.35})
+    grid = np.column_stack([out['allocations'][c] for c in out['channels']])
+    assert len(grid) > 0 and np.allclose(grid.sum(axis=1), TOTAL_BUDGET)
+    assert (grid >= 0.15 * TOTAL_BUDGET - 1e-6).all() and (grid <= 0.35 * TOTAL_BUDGET + 1e-6).all()
+
+    for model, scenario in out['optimal'].items():
+        spend = np.array([scenario['allocation'][c] for c in out['channels']])
+        assert spend.sum() == pytest.approx(TOTAL_BUDGET)
+        assert (spend >= 0.15 * TOTAL_BUDGET - 1e-6).all() and (spend <= 0.35 * TOTAL_BUDGET + 1e-6).all()
+        # The optimum is at least as good as every split on the grid
+        assert scenario['revenue'] >= max(out['allocations']['revenue'][model]) - 1e-6
+        assert scenario['revenue'] >= out['current'][model]['revenue'] - 1e-6
+
+
+def test_optimum_equalizes_marginal_revenue(revenue):
+    curves = fit_response_curves(revenue, {'view': 3_000_000, 'cart': 2_000_000})
+    optimal = optimal_allocation(curves, TOTAL_BUDGET, 0.0, 1.0)
+    marginal = curves['scale'] / curves['saturation'] * np.exp(-optimal / curves['saturation'])
+    assert np.allclose(marginal[:, 0], marginal[:, 1], rtol=1e-6)
+    dense = allocation_grid(TOTAL_BUDGET, 2, 1_000, 0.0, 1.0)
+    best = evaluate_allocations(curves, dense).max(axis=0)
+    assert (evaluate_allocations(curves, optimal).diagonal() >= best - 1e-6).all()
+
+
+def test_exported_curve_params_reproduce_the_tables(serial):
+    out = serial.run('scenarios')
+    assert len(out['allocations'][out['channels'][0]]) == 41
+    spend = np.asarray(out['curves']['spend'])
+    for model, channels in out['curves']['models'].items():
+        for channel, table in channels.items():
+            scale = out['curves']['scale'][model][channel]
+            saturation = out['curves']['saturation'][model][channel]
+            assert np.allclose(scale * -np.expm1(-spend / saturation), table)
+        grid = np.column_stack([out['allocations'][c] for c in out['channels']])
+        exact = out['curves']['base'][model] + sum(
+            out['curves']['scale'][model][c] * -np.expm1(-grid[:, j] / out['curves']['saturation'][model][c])
+            for j, c in enumerate(out['channels']))
+        assert np.allclose(exact, out['allocations']['revenue'][model])
@@ -0,0 +1,185 @@
+import asyncio
+import gzip
+import json
+import os
+
+import numpy as np
+import pytest
+
+from attribution.cube import ALL, write_cube_arrays
+from attribution.service import (CUBE_DIR, RESULTS_FILE, Artifacts, AttributionService,
+                                 ResponseCache, artifacts_signature)
+from conftest import make_pipeline
+
+
+@pytest.fixture(scope='module')
+def artifacts_dir(workdir, events_csv):
+    directory = workdir / 'artifacts'
+    pipeline = make_pipeline(workdir, events_csv, 'serial',
+                             export={'output': str(directory / RESULTS_FILE),
+                                     'cube_output': str(directory / (CUBE_DIR + '.json'))})
+    pipeline.run('export')
+    return directory
+
+
+@pytest.fixture
+def service(artifacts_dir):
+    return AttributionService(Artifacts(str(artifacts_dir)))
+
+
+def _get(service, target, accept_gzip=False):
+    status, body, encoding = service.respond(target, accept_gzip)
+    body = gzip.decompress(body) if encoding == 'gzip' else bytes(body)
+    return status, json.loads(body)
+
+
+def test_results_file_is_served_from_its_map(service, artifacts_dir):
+    raw = (artifacts_dir / RESULTS_FILE).read_bytes()
+    status, body, encoding = service.respond('/data/' + RESULTS_FILE, False)
+    assert status == 200 and encoding is None
+    assert isinstance(body, memoryview) and body == raw
+    assert len(service.cache) == 0
+
+    status, body, encoding = service.respond('/data/' + RESULTS_FILE, True)
+    assert encoding == 'gzip' and gzip.decompress(body) == raw
+    assert service.respond('/data/' + RESULTS_FILE, True)[1] is body
+    assert service.cache.stats['hits'] == 1
+
+
+def test_query_responses(service):
+    status, body = _get(service, '/attribution?model=linear&channel=view')
+    assert status == 200 and list(body['models']) == ['linear'] and list(body['models']['linear']) == ['view']
+    # No bootstrap replicates by default, so no intervals
+    assert 'intervals' not in body
+
+    status, body = _get(service, '/trends?model=markov&start=2000-01-01&end=2100-01-01')
+    assert status == 200 and len(body['dates']) == len(service.artifacts.results['attribution_trends']['dates'])
+    first = body['dates'][0]
+    status, body = _get(service, f'/trends?start={first}&end={first}')
+    assert body['dates'] == [first] and len(body['journeys']) == 1
+
+
+@pytest.mark.parametrize('target, status', [
+    ('/attribution?model=nope', 400),
+    ('/attribution?colour=red', 400),
+    ('/segment?brand=nope', 400),
+    ('/segment?start=yesterday', 400),
+    ('/trends?end=2020-13-45', 400),
+    ('/nowhere', 404),
+])
+def test_query_errors(service, target, status):
+    got, body = _get(service, target)
+    assert got == status and 'error' in body
+    assert len(service.cache) == 0
+
+
+def test_unexpected_errors_answer_500(service, monkeypatch):
+    def broken(**params):
+        raise KeyError('linear')
+
+    monkeypatch.setattr(service.artifacts, 'attribution', broken)
+    status, body = _get(service, '/attribution')
+    assert status == 500 and 'KeyError' in body['error']
+    assert len(service.cache) == 0
+
+
+def test_segment_rollups_and_date_ranges(service):
+    cube = service.artifacts
+    status, total = _get(service, '/segment')
+    assert status == 200 and total['journeys'] == int(cube.cube['journeys'][0])
+    assert (np.asarray([cube.cube[name][0] for name in cube.cube_header['dimensions']]) == ALL).all()
+
+    # The whole date range sums the daily cells back to the rolled-up cell
+    category = cube.cube_header['dimensions']['category'][0]
+    status, cell = _get(service, f'/segment?category={category}')
+    dates = [str(d) for d in cube.cube_dates]
+    status, ranged = _get(service, f'/segment?category={category}&start={dates[0]}&end={dates[-1]}')
+    assert ranged['journeys'] == cell['journeys']
+    assert ranged['revenue'] == pytest.approx(cell['revenue'], abs=0.01 * len(dates))
+    for model, channels in cell['models'].items():
+        for channel, credit in channels.items():
+            assert ranged['models'][model][channel]['revenue'] == pytest.approx(
+                credit['revenue'], abs=0.01 * len(dates))
+
+    # Disjoint ranges partition the journeys
+    middle = dates[len(dates) // 2]
+    before = _get(service, f'/segment?category={category}&end={middle}')[1]
+    after = _get(service, f'/segment?category={category}&start={str(np.datetime64(middle) + 1)}')[1]
+    assert before['journeys'] + after['journeys'] == cell['journeys']
+    assert _get(service, '/segment?start=2100-01-01')[1]['journeys'] == 0
+
+
+def test_response_cache_is_lru():
+    cache = ResponseCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats == {'hits': 3, 'misses': 1, 'evictions': 1}
+
+
+def test_query_cache_normalizes_parameters(service):
+    first = service.respond('/attribution?model=linear&channel=view', True)
+    assert service.respond('/attribution?channel=view&model=linear', True) is first
+    assert service.cache.stats == {'hits': 1, 'misses': 1, 'evictions': 0}
+    assert service.stats()['cache']['entries'] == 1
+
+
+def test_refresh_follows_cube_rewrites(service, artifacts_dir, tmp_path):
+    directory = tmp_path / 'artifacts'
+    directory.mkdir()
+    (directory / RESULTS_FILE).write_bytes((artifacts_dir / RESULTS_FILE).read_bytes())
+    cube = json.loads((artifacts_dir / (CUBE_DIR + '.json')).read_text())
+    write_cube_arrays(cube, str(directory / CUBE_DIR))
+    service = AttributionService(Artifacts(str(directory)))
+    old = service.artifacts
+    assert _get(service, '/segment')[1]['journeys'] > 0
+    assert len(service.cache) == 1
+
+    # Only the cube changes; the results file is untouched
+    signature = artifacts_signature(str(directory))
+    cube['cells']['journeys'] = [0] * len(cube['cells']['journeys'])
+    write_cube_arrays(cube, str(directory / CUBE_DIR))
+    assert artifacts_signature(str(directory)) != signature
+    service._checked -= 10
+    assert service.refresh()
+    assert old.results_map is None and old.cube is None
+    assert len(service.cache) == 0
+    assert _get(service, '/segment')[1]['journeys'] == 0
+
+    # A half-written export keeps the old artifacts serving
+    (directory / CUBE_DIR / 'cube.json').write_text('{')
+    service._checked -= 10
+    assert not service.refresh()
+    assert _get(service, '/segment')[0] == 200
+
+
+def test_keep_alive_http(service):
+    async def exchange():
+        server = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        responses = []
+        for target, extra in [('/data/' + RESULTS_FILE, 'Accept-Encoding: gzip\r\n'),
+                              ('/data/' + RESULTS_FILE, ''), ('/stats', 'Connection: close\r\n')]:
+            writer.write(f'GET {target} HTTP/1.1\r\nHost: test\r\n{extra}\r\n'.encode())
+            head = (await reader.readuntil(b'\r\n\r\n')).decode()
+            headers = dict(line.split(': ', 1) for line in head.split('\r\n')[1:] if line)
+            body = await reader.readexactly(int(headers['Content-Length']))
+            responses.append((head.split(' ')[1], headers, body))
+        assert await reader.read() == b''
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    compressed, raw, stats = asyncio.run(exchange())
+    with open(os.path.join(service.artifacts.directory, RESULTS_FILE), 'rb') as f:
+        expected = f.read()
+    assert compressed[0] == '200' and compressed[1]['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed[2]) == expected
+    assert raw[1]['Connection'] == 'keep-alive' and 'Content-Encoding' not in raw[1]
+    assert raw[2] == expected
+    assert stats[1]['Connection'] == 'close'
+    assert json.loads(stats[2])['latency']['requests'] == 2
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from attribution.sessions import (SessionStore, dominant_actions, session_starts, session_summary,
+                                  touchpoint_store)
+from attribution.store import MemoryStore
+
+CHANNELS = ['view', 'cart', 'purchase']
+VIEW, CART, PURCHASE = range(3)
+
+
+def minutes(*values):
+    return (np.datetime64('2020-01-01T00:00', 'ns') + np.array(values) * np.timedelta64(1, 'm'))
+
+
+@pytest.fixture
+def small_store():
+    # User 1: two views, then cart and two purchases after a 40-minute gap.
+    # User 2: a view, then a cart under a new user_session id one minute later.
+    return MemoryStore({
+        'user_id': np.array([1, 1, 1, 1, 1, 2, 2]),
+        'event_time': minutes(0, 10, 50, 55, 56, 0, 1),
+        'event_type': np.array([VIEW, VIEW, CART, PURCHASE, PURCHASE, VIEW, CART]),
+        'price': np.array([3.0, 4.0, 5.0, 10.0, 5.0, 7.0, 8.0]),
+        'user_session': np.array([1, 1, 1, 1, 1, 2, 3], dtype=np.uint64),
+    }, {'event_type': CHANNELS})
+
+
+def test_session_starts(small_store):
+    assert session_starts(small_store).tolist() == [0, 2, 5, 6]
+    assert session_starts(small_store, split_on_session_id=False).tolist() == [0, 2, 5]
+    assert session_starts(small_store, timeout_minutes=None).tolist() == [0, 5, 6]
+    assert session_starts(small_store, timeout_minutes=None, split_on_session_id=False).tolist() == [0, 5]
+
+
+def test_dominant_action_is_the_deepest_step():
+    event_types = np.array([VIEW, CART, VIEW, VIEW, VIEW, PURCHASE, CART])
+    actions, positions = dominant_actions(event_types, np.array([0, 3, 5]), CHANNELS)
+    assert actions.tolist() == [CART, VIEW, PURCHASE]
+    # The last event of the dominant type represents the session
+    assert positions.tolist() == [1, 4, 5]
+    actions, positions = dominant_actions(event_types[:0], np.array([], dtype=np.int64), CHANNELS)
+    assert len(actions) == len(positions) == 0
+
+
+def test_session_store(small_store):
+    sessions = SessionStore(small_store)
+    assert len(sessions) == 4
+    assert sessions.offsets.tolist() == [0, 2, 4]
+    assert np.array_equal(sessions.users, small_store.users)
+    assert np.asarray(sessions['event_type']).tolist() == [VIEW, PURCHASE, VIEW, CART]
+    assert np.array_equal(sessions['event_time'], minutes(10, 56, 0, 1))
+    # Purchase sessions carry their purchase total, others their dominant event's price
+    assert np.asarray(sessions['price']).tolist() == [4.0, 15.0, 7.0, 8.0]
+    assert np.asarray(sessions['session_events']).tolist() == [2, 3, 1, 1]
+    # Other columns are gathered from the dominant event
+    assert np.asarray(sessions['user_session']).tolist() == [1, 1, 2, 3]
+    assert sessions.meta['raw_events'] == len(small_store)
+
+    summary = session_summary(sessions)
+    assert summary == {'sessions': 4, 'avg_events_per_session': 7 / 4,
+                       'dominant_actions': {'view': 2, 'cart': 1, 'purchase': 1}}
+
+
+def test_touchpoint_store(small_store):
+    assert touchpoint_store(small_store) is small_store
+    assert len(touchpoint_store(small_store, 'session', timeout_minutes=None)) == 3
+    with pytest.raises(ValueError):
+        touchpoint_store(small_store, 'page')
+
+
+def test_session_store_keeps_every_purchase(store):
+    sessions = SessionStore(store)
+    assert len(sessions) == len(session_starts(store))
+    assert int(np.asarray(sessions['session_events']).sum()) == len(store)
+    # Purchase outranks every other action, so every purchase lands in a purchase session's total
+    purchases = np.asarray(store['event_type']) == store.channels.index('purchase')
+    session_purchases = np.asarray(sessions['event_type']) == store.channels.index('purchase')
+    assert np.isclose(np.asarray(sessions['price'])[session_purchases].sum(),
+                      np.asarray(store['price'])[purchases].sum())
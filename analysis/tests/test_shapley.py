@@ -0,0 +1,66 @@
+import math
+from itertools import combinations
+
+import numpy as np
+
+from attribution.shapley import ShapleyEngine, heuristic_value_function
+
+
+def enumerated_shapley(touchpoints, conversion_probability, conversion_value=1.0):
+    """The original per-journey enumeration over every coalition of the other touchpoints"""
+    touchpoints = list(set(touchpoints))
+    n = len(touchpoints)
+    if n == 1:
+        return {touchpoints[0]: conversion_value}
+    values = {}
+    for touchpoint in touchpoints:
+        others = [tp for tp in touchpoints if tp != touchpoint]
+        total = 0.0
+        for r in range(len(others) + 1):
+            for coalition in combinations(others, r):
+                weight = math.factorial(r) * math.factorial(n - r - 1) / math.factorial(n)
+                total += weight * (conversion_probability(list(coalition) + [touchpoint])
+                                   - conversion_probability(list(coalition)))
+        values[touchpoint] = total * conversion_value
+    return values
+
+
+def assert_engine_matches_enumeration(value_fn, n_channels):
+    engine = ShapleyEngine(value_fn, n_channels)
+
+    def conversion_probability(coalition):
+        return float(value_fn(np.array([sum(1 << c for c in coalition)], dtype=np.uint64))[0])
+
+    for mask in range(1, 1 << n_channels):
+        players = [c for c in range(n_channels) if mask >> c & 1]
+        expected = np.zeros(n_channels)
+        for channel, value in enumerated_shapley(players, conversion_probability).items():
+            expected[channel] = value
+        assert np.allclose(engine.shapley_vector(mask), expected, rtol=1e-12, atol=1e-15)
+
+
+def test_exact_shapley_matches_enumeration_heuristic():
+    assert_engine_matches_enumeration(heuristic_value_function(['view', 'cart', 'purchase', 'email', 'search']), 5)
+
+
+def test_exact_shapley_matches_enumeration_random_game():
+    rates = np.random.default_rng(0).random(1 << 7)
+    rates[0] = 0.0
+    assert_engine_matches_enumeration(lambda masks: rates[np.asarray(masks, dtype=np.int64)], 7)
+
+
+def test_sampled_shapley_converges_without_caching_samples():
+    n_channels = 8
+    rates = np.random.default_rng(1).random(1 << n_channels)
+    rates[0] = 0.0
+
+    def value_fn(masks):
+        return rates[np.asarray(masks, dtype=np.int64)]
+
+    exact = ShapleyEngine(value_fn, n_channels).shapley_vector((1 << n_channels) - 1)
+    sampled_engine = ShapleyEngine(value_fn, n_channels, max_exact=2, tolerance=1e-3, max_permutations=200_000)
+    sampled = sampled_engine.shapley_vector((1 << n_channels) - 1)
+
+    assert sampled_engine.stats['sampled_sets'] == 1
+    assert len(sampled_engine._values) == 1
+    assert np.abs(sampled - exact).max() < 0.01
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from attribution.store import META_FILE, build_store
+
+
+def test_store_is_sorted_by_user_and_time(store, events):
+    user_ids = np.asarray(store['user_id'])
+    times = np.asarray(store['event_time']).view(np.int64)
+    assert len(store) == len(events)
+    assert np.all(np.diff(user_ids) >= 0)
+    same_user = user_ids[1:] == user_ids[:-1]
+    assert np.all(np.diff(times)[same_user] >= 0)
+
+    offsets = np.asarray(store.offsets)
+    assert np.array_equal(np.asarray(store.users), user_ids[offsets[:-1]])
+    user_id = int(store.users[3])
+    journey = store.journey(user_id)
+    assert np.all(journey['user_id'] == user_id)
+    assert len(journey['user_id']) == int((events['user_id'] == user_id).sum())
+
+
+def test_decode_maps_missing_codes_to_none(store):
+    codes = np.array([0, -1, 1])
+    labels = store.decode('event_type', codes)
+    assert labels.tolist() == [store.channels[0], None, store.channels[1]]
+
+
+def test_rebuild_replaces_only_stores(tmp_path, events_csv):
+    target = tmp_path / 'store'
+    build_store(events_csv, str(target))
+    assert (target / META_FILE).exists()
+    build_store(events_csv, str(target))
+
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'notes.txt').write_text('keep me')
+    with pytest.raises(FileExistsError):
+        build_store(events_csv, str(other))
+    assert (other / 'notes.txt').read_text() == 'keep me'
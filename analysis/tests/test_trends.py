@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from attribution.export import EXPORT_CHANNELS, channel_shares
+from attribution.journeys import NS_PER_DAY, purchase_journey_bounds
+from attribution.markov import markov_journeys, markov_revenue, path_transition_counts, removal_effects
+from attribution.rules import flatten_touchpoints, run_rule_models
+from attribution.trends import (day_range, group_totals, lookback_comparison, lookback_revenue,
+                                rolling_attribution, rolling_sum)
+from conftest import make_pipeline
+
+WINDOW = 7
+
+
+def test_rolling_sum_and_group_totals():
+    daily = np.random.default_rng(0).random((20, 3))
+    rolled = rolling_sum(daily, 5)
+    for day in range(20):
+        assert np.allclose(rolled[day], daily[max(0, day - 4):day + 1].sum(axis=0))
+
+    groups = np.array([2, 0, 2, 1, 2])
+    values = np.arange(10.0).reshape(5, 2)
+    expected = pd.DataFrame(values).groupby(groups).sum().reindex(range(4), fill_value=0).to_numpy()
+    assert np.array_equal(group_totals(values, groups, 4), expected)
+
+
+@pytest.mark.parametrize('days', [1, 7])
+def test_lookback_bounds(store, keep_user, days):
+    full = purchase_journey_bounds(store, keep_user=keep_user)
+    bounds = purchase_journey_bounds(store, keep_user=keep_user, lookback_days=days)
+    times = np.asarray(store['event_time']).view(np.int64)
+    cutoff = times[bounds['purchase']] - days * NS_PER_DAY
+    # Every kept touch is inside the window, and the event before it is not
+    assert (times[bounds['touch_start']] >= cutoff).all()
+    starts = np.asarray(store.offsets)[bounds['user']]
+    earlier = bounds['touch_start'] > starts
+    assert (times[bounds['touch_start'][earlier] - 1] < cutoff[earlier]).all()
+    assert np.isin(bounds['purchase'], full['purchase']).all()
+    assert np.array_equal(bounds['touch_end'], full['touch_end'][np.isin(full['purchase'], bounds['purchase'])])
+
+
+def test_unbounded_lookback_matches_full_journeys(serial, store, keep_user):
+    _, n_days = day_range(store)
+    revenue, n_journeys = lookback_revenue(store, n_days + 1, keep_user)
+    rules = serial.run('rule_models')
+    assert n_journeys == len(serial.run('journeys')['attribution_df'])
+    assert np.allclose(revenue[rules.columns].loc[rules.index], rules)
+
+    comparison = lookback_comparison(store, (1, n_days + 1), keep_user)
+    assert comparison['1']['journeys'] < comparison[str(n_days + 1)]['journeys'] == n_journeys
+    for window in comparison.values():
+        for shares in window['models'].values():
+            assert np.isclose(sum(shares.values()), 100)
+
+
+def test_rolling_window_matches_recompute(serial, store, keep_user):
+    touches = serial.run('journeys')['touches']
+    trends = rolling_attribution(store, touches, keep_user, models=['linear'], window=WINDOW)
+    origin, n_days = day_range(store)
+    assert len(trends['dates']) == n_days and trends['dates'][0] == str(np.datetime64(origin, 'ns'))[:10]
+
+    bounds = purchase_journey_bounds(store, keep_user=keep_user)
+    times = np.asarray(store['event_time']).view(np.int64)
+    journeys = markov_journeys(store, keep_user=keep_user)
+    for day in (WINDOW - 1, n_days // 2, n_days - 1):
+        # Purchases (and Markov journeys) that ended in the trailing window
+        purchase_day = (times[bounds['purchase']] - origin) // NS_PER_DAY
+        in_window = (purchase_day > day - WINDOW) & (purchase_day <= day)
+        window_bounds = {name: values[in_window] for name, values in bounds.items()}
+        window_touches = flatten_touchpoints(store, window_bounds)
+        assert trends['journeys'][day] == int(in_window.sum())
+        assert np.isclose(trends['revenue'][day], window_touches['value'].sum())
+        linear = channel_shares(run_rule_models(window_touches, models=['linear']))['linear']
+        for channel in EXPORT_CHANNELS:
+            assert np.isclose(trends['models']['linear'][channel][day], linear[channel])
+
+        end_day = (journeys['end_time'] - origin) // NS_PER_DAY
+        chain = path_transition_counts(_subset(journeys, (end_day > day - WINDOW) & (end_day <= day)))
+        _, effects = removal_effects(chain)
+        markov = channel_shares(markov_revenue(effects, 1.0, store.channels).to_frame('markov'))['markov']
+        for channel in EXPORT_CHANNELS:
+            assert np.isclose(trends['models']['markov'][channel][day], markov[channel])
+
+
+def _subset(journeys, keep):
+    """markov_journeys output restricted to the journeys in the boolean mask keep"""
+    lengths = np.diff(journeys['offsets'])
+    touch_keep = np.repeat(keep, lengths)
+    offsets = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+    np.cumsum(lengths[keep], out=offsets[1:])
+    return {
+        'channel': journeys['channel'][touch_keep],
+        'journey': np.repeat(np.arange(int(keep.sum()), dtype=np.int32), lengths[keep]),
+        'offsets': offsets,
+        'converted': journeys['converted'][keep],
+        'end_time': journeys['end_time'][keep],
+        'channels': journeys['channels'],
+    }
+
+
+def test_trends_stage(workdir, events_csv):
+    pipeline = make_pipeline(workdir, events_csv, 'serial')
+    trends = pipeline.run('trends')
+    assert set(trends) == {'lookback_windows', 'attribution_trends'}
+    assert list(trends['lookback_windows']) == [str(d) for d in pipeline.params['trends']['lookback_windows']]
+    models = trends['attribution_trends']['models']
+    assert set(models) == set(pipeline.params['rule_models']['models']) | {'shapley', 'markov'}
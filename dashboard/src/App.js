@@ -1,6 +1,9 @@
 import React, { useState, useEffect } from 'react';
 import { BarChart, Bar, LineChart, Line, RadarChart, PolarGrid, PolarAngleAxis, PolarRadiusAxis, Radar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 
+// Attribution query service (python -m attribution.service); empty = static files
+const API_BASE = process.env.REACT_APP_ATTRIBUTION_API || '';
+
 export default function AttributionDashboard() {
   // ========== ALL STATE DECLARATIONS ==========
   const [selectedScenario, setSelectedScenario] = useState('recommended');
@@ -20,7 +23,7 @@ export default function AttributionDashboard() {
   useEffect(() => {
     console.log('🔄 Loading attribution data...');
     
-    fetch('/data/attribution-results.json')
+    fetch(`${API_BASE}/data/attribution-results.json`)
       .then(response => {
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);
@@ -173,9 +176,59 @@ export default function AttributionDashboard() {
     }
   };
 
+  // Model-derived response curves and optimal splits (budget_scenarios), when exported
+  const budgetScenarios = analysisData.budget_scenarios;
+  if (budgetScenarios) {
+    const fromModel = (sc, result) => ({
+      ...sc,
+      viewBudget: result.allocation.view,
+      cartBudget: result.allocation.cart,
+      projectedRevenue: result.revenue,
+      roas: result.roas.toFixed(1),
+      lift: result.lift.toFixed(1)
+    });
+    // Scenarios are the current split and each model's optimal split, labelled by model
+    scenarios.current = fromModel(scenarios.current, budgetScenarios.current.shapley);
+    scenarios.recommended = fromModel({ ...scenarios.recommended, name: 'Shapley Optimum' }, budgetScenarios.optimal.shapley);
+    scenarios.aggressive = fromModel({ ...scenarios.aggressive, name: 'Markov Optimum' }, budgetScenarios.optimal.markov);
+  }
+
   const scenario = scenarios[selectedScenario];
 
+  const upside = scenarios.recommended.projectedRevenue - scenarios.current.projectedRevenue;
+  const reallocation = scenarios.recommended.cartBudget - scenarios.current.cartBudget;
+
+  const scenarioChart = Object.values(scenarios).map(sc => ({
+    scenario: sc.name,
+    revenue: Number((sc.projectedRevenue / 1000000).toFixed(1)),
+    roas: Number(sc.roas),
+    lift: Number(sc.lift)
+  }));
+
+  // Linear interpolation in a sorted table (exported curves and allocation grids)
+  const interpolate = (xs, ys, x) => {
+    if (x <= xs[0]) return ys[0];
+    for (let i = 1; i < xs.length; i++) {
+      if (x <= xs[i]) {
+        const t = (x - xs[i - 1]) / (xs[i] - xs[i - 1]);
+        return ys[i - 1] + t * (ys[i] - ys[i - 1]);
+      }
+    }
+    return ys[ys.length - 1];
+  };
+
   const calculateCustomProjections = () => {
+    if (budgetScenarios) {
+      const { allocations } = budgetScenarios;
+      const revenue = interpolate(allocations.view, allocations.revenue.shapley, customViewBudget);
+      const lift = (revenue / budgetScenarios.current.shapley.revenue - 1) * 100;
+      return {
+        lift: lift.toFixed(1),
+        revenue: revenue,
+        roas: (revenue / budgetScenarios.total_budget).toFixed(1)
+      };
+    }
+
     const totalBudget = 5000000;
     const viewPercent = customViewBudget / totalBudget;
     const cartPercent = customCartBudget / totalBudget;
@@ -255,18 +308,18 @@ export default function AttributionDashboard() {
             <div className="grid grid-cols-4 gap-6">
               <div className="bg-white border border-slate-200 rounded-lg p-6 shadow-sm transform hover:scale-105 transition-transform">
                 <div className="text-slate-500 text-sm font-medium mb-2">Current Revenue</div>
-                <div className="text-4xl font-bold text-slate-900 mb-1">$50M</div>
+                <div className="text-4xl font-bold text-slate-900 mb-1">${(scenarios.current.projectedRevenue / 1000000).toFixed(0)}M</div>
                 <div className="text-slate-500 text-xs">Annual baseline</div>
               </div>
               <div className="bg-white border border-emerald-200 rounded-lg p-6 shadow-sm transform hover:scale-105 transition-transform">
                 <div className="text-emerald-700 text-sm font-medium mb-2">Potential Uplift</div>
-                <div className="text-4xl font-bold text-emerald-600 mb-1">+$4M</div>
-                <div className="text-emerald-600 text-xs">8% growth opportunity</div>
+                <div className="text-4xl font-bold text-emerald-600 mb-1">+${(upside / 1000000).toFixed(1)}M</div>
+                <div className="text-emerald-600 text-xs">{scenarios.recommended.lift}% growth opportunity</div>
               </div>
               <div className="bg-white border border-slate-200 rounded-lg p-6 shadow-sm transform hover:scale-105 transition-transform">
                 <div className="text-slate-500 text-sm font-medium mb-2">Budget Reallocation</div>
-                <div className="text-4xl font-bold text-slate-900 mb-1">$250K</div>
-                <div className="text-slate-500 text-xs">Awareness to cart optimization</div>
+                <div className="text-4xl font-bold text-slate-900 mb-1">${Math.round(Math.abs(reallocation) / 1000)}K</div>
+                <div className="text-slate-500 text-xs">{reallocation >= 0 ? 'Awareness to cart optimization' : 'Cart optimization to awareness'}</div>
               </div>
               <div className="bg-white border border-slate-200 rounded-lg p-6 shadow-sm transform hover:scale-105 transition-transform">
                 <div className="text-slate-500 text-sm font-medium mb-2">Payback Period</div>
@@ -278,7 +331,7 @@ export default function AttributionDashboard() {
             <div className="bg-slate-800 rounded-lg p-8 shadow-lg border border-slate-700">
               <h2 className="text-2xl font-bold text-white mb-4">Key Insight</h2>
               <p className="text-lg text-slate-50 mb-6 leading-relaxed">
-                Your brand awareness campaigns are performing exceptionally well, with an 11.9% conversion rate that significantly exceeds the industry average of 2.5%. However, a comprehensive attribution analysis across five different models reveals a systematic over-allocation to top-of-funnel activities, resulting in approximately $500K in suboptimal spend annually.
+                Your brand awareness campaigns are performing exceptionally well, with a {analysisData.journey_stats.conversion_rate.toFixed(1)}% conversion rate that significantly exceeds the industry average of 2.5%. However, a comprehensive attribution analysis across five different models reveals a systematic over-allocation to top-of-funnel activities, resulting in approximately $500K in suboptimal spend annually.
               </p>
               <div className="bg-slate-700 rounded-lg p-6 border border-slate-600">
                 <div className="text-sm font-semibold text-slate-300 mb-3">RECOMMENDATION</div>
@@ -498,7 +551,7 @@ export default function AttributionDashboard() {
             <div className="bg-white rounded-lg p-8 border border-slate-200 shadow-sm">
               <h2 className="text-2xl font-bold text-slate-900 mb-4">Customer Journey Conversion Funnel</h2>
               <p className="text-slate-600 mb-6">
-                Average customer journey consists of {analysisData.journey_stats.avg_touchpoints.toFixed(1)} touchpoints over {analysisData.journey_stats.avg_days.toFixed(1)} days. The cart stage exhibits a 71% abandonment rate, representing the primary optimization opportunity.
+                Average customer journey consists of {analysisData.journey_stats.avg_touchpoints.toFixed(1)} touchpoints over {analysisData.journey_stats.avg_days.toFixed(1)} days. The cart stage exhibits a {analysisData.journey_stats.cart_abandonment_rate.toFixed(1)}% abandonment rate, representing the primary optimization opportunity.
               </p>
               
               <div className="space-y-4">
@@ -566,17 +619,17 @@ export default function AttributionDashboard() {
                     <div className="space-y-4">
                       <div>
                         <div className="text-sm text-slate-600 mb-1">Awareness Budget</div>
-                        <div className="text-3xl font-bold text-slate-900">$3.00M</div>
-                        <div className="text-xs text-slate-500">60% allocation</div>
+                        <div className="text-3xl font-bold text-slate-900">${(scenarios.current.viewBudget / 1000000).toFixed(2)}M</div>
+                        <div className="text-xs text-slate-500">{((scenarios.current.viewBudget / (scenarios.current.viewBudget + scenarios.current.cartBudget)) * 100).toFixed(0)}% allocation</div>
                       </div>
                       <div>
                         <div className="text-sm text-slate-600 mb-1">Cart Budget</div>
-                        <div className="text-3xl font-bold text-red-600">$2.00M</div>
-                        <div className="text-xs text-red-500">40% allocation (under-funded)</div>
+                        <div className="text-3xl font-bold text-red-600">${(scenarios.current.cartBudget / 1000000).toFixed(2)}M</div>
+                        <div className="text-xs text-red-500">{((scenarios.current.cartBudget / (scenarios.current.viewBudget + scenarios.current.cartBudget)) * 100).toFixed(0)}% allocation</div>
                       </div>
                       <div className="pt-4 border-t border-slate-200">
                         <div className="text-sm text-slate-600 mb-1">Projected Revenue</div>
-                        <div className="text-3xl font-bold text-slate-900">$50.0M</div>
+                        <div className="text-3xl font-bold text-slate-900">${(scenarios.current.projectedRevenue / 1000000).toFixed(1)}M</div>
                       </div>
                     </div>
                   </div>
@@ -587,18 +640,18 @@ export default function AttributionDashboard() {
                     <div className="space-y-4">
                       <div>
                         <div className="text-sm text-slate-600 mb-1">Awareness Budget</div>
-                        <div className="text-3xl font-bold text-slate-900">$2.75M</div>
-                        <div className="text-xs text-emerald-600">55% allocation (-$250K)</div>
+                        <div className="text-3xl font-bold text-slate-900">${(scenarios.recommended.viewBudget / 1000000).toFixed(2)}M</div>
+                        <div className="text-xs text-emerald-600">{((scenarios.recommended.viewBudget / (scenarios.current.viewBudget + scenarios.current.cartBudget)) * 100).toFixed(0)}% allocation ({reallocation > 0 ? '-' : '+'}${Math.round(Math.abs(reallocation) / 1000)}K)</div>
                       </div>
                       <div>
                         <div className="text-sm text-slate-600 mb-1">Cart Budget</div>
-                        <div className="text-3xl font-bold text-emerald-600">$2.25M</div>
-                        <div className="text-xs text-emerald-600">45% allocation (+$250K)</div>
+                        <div className="text-3xl font-bold text-emerald-600">${(scenarios.recommended.cartBudget / 1000000).toFixed(2)}M</div>
+                        <div className="text-xs text-emerald-600">{((scenarios.recommended.cartBudget / (scenarios.current.viewBudget + scenarios.current.cartBudget)) * 100).toFixed(0)}% allocation ({reallocation < 0 ? '-' : '+'}${Math.round(Math.abs(reallocation) / 1000)}K)</div>
                       </div>
                       <div className="pt-4 border-t border-emerald-200">
                         <div className="text-sm text-slate-600 mb-1">Projected Revenue</div>
-                        <div className="text-3xl font-bold text-emerald-600">$54.0M</div>
-                        <div className="text-xs text-emerald-600 font-semibold">+$4M increase (+8%)</div>
+                        <div className="text-3xl font-bold text-emerald-600">${(scenarios.recommended.projectedRevenue / 1000000).toFixed(1)}M</div>
+                        <div className="text-xs text-emerald-600 font-semibold">+${(upside / 1000000).toFixed(1)}M increase (+{scenarios.recommended.lift}%)</div>
                       </div>
                     </div>
                   </div>
@@ -764,11 +817,7 @@ export default function AttributionDashboard() {
             <div className="bg-white rounded-lg p-8 border border-slate-200 shadow-sm">
               <h3 className="text-xl font-bold text-slate-900 mb-6">Scenario Comparison Chart</h3>
               <ResponsiveContainer width="100%" height={350}>
-                <LineChart data={[
-                  { scenario: 'Current', revenue: 50, roas: 10.0, lift: 0 },
-                  { scenario: 'Recommended', revenue: 54, roas: 11.2, lift: 8 },
-                  { scenario: 'Aggressive', revenue: 57.5, roas: 12.5, lift: 15 }
-                ]}>
+                <LineChart data={scenarioChart}>
                   <CartesianGrid strokeDasharray="3 3" stroke="#e2e8f0" />
                   <XAxis dataKey="scenario" tick={{ fill: '#475569' }} />
                   <YAxis yAxisId="left" tick={{ fill: '#475569' }} />